@@ -18,13 +18,21 @@ Compatible con app.py para dashboard de RRHH
 # =============================================================================
 import pandas as pd
 import numpy as np
+from pandas.api.types import union_categoricals
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import unicodedata
+import time
+from periods import format_period, period_codes, period_labels, to_period_code
+from lme_engine import LMEEngine
+from sketches import QuantileSketch
+from forecasting import AbsenceForecaster, TOTAL_UNIT
 import io
 import os
 # Configuración de visualización
@@ -57,6 +65,56 @@ STANDARD_COLUMN_SYNONYMS = {
     'DaysWorked': ['días trabajados']
 }
 
+# Columnas que usa cada análisis (nombres estándar o nombres originales).
+# Permite cargar solo lo necesario con load_hr_data(..., columns=...).
+ANALYSIS_COLUMNS = {
+    'overview': ['Gender', 'TenureYears', 'BaseSalary', 'Age', 'Department', 'ContractType',
+                 'DaysWorked', 'AbsenceDays'],
+    'demographic': ['AgeGroup', 'Gender', 'Nationality', 'TenureYears'],
+    'contracts': ['ContractType', 'Department'],
+    'salary': ['Department', 'BaseSalary'],
+    'attendance': ['RegularLeaveDays', 'MaternityLeaveDays', 'SickLeaveDays', 'PermissionDays',
+                   'VacationDays', 'Department', 'DaysWorked', 'AbsenceDays'],
+    'lme': ['Año', 'Tipo de Licencia', 'Cantidad', 'Seguro', 'TrabajadorID',
+            'Estado Resolución', 'Grupo Diagnostico', 'DiasAutorizados'],
+    'absenteeism': ['Período', 'ContractStartDate', 'Department', 'AbsenceDays', 'SickLeaveDays',
+                    'RegularLeaveDays', 'MaternityLeaveDays', 'PermissionDays'],
+    'causales': ['causal de termino'],
+}
+
+# Columnas calculadas en load_hr_data y las columnas de origen que requieren
+DERIVED_COLUMN_SOURCES = {
+    'AgeGroup': ['Age'],
+    'TenureYears': ['TenureMonths'],
+    'Normalized_AbsenceDays': ['AbsenceDays'],
+    'Normalized_SickLeaveDays': ['SickLeaveDays'],
+    'Normalized_RegularLeaveDays': ['RegularLeaveDays'],
+    'Normalized_MaternityLeaveDays': ['MaternityLeaveDays'],
+    'Normalized_PermissionDays': ['PermissionDays'],
+}
+
+# Plan de tipos compactos para la carga por bloques (load_hr_data(..., chunksize=...))
+CATEGORY_COLUMNS = ['Department', 'Gender', 'ContractType', 'Nationality', 'JobRole']
+DAY_COUNT_COLUMNS = ['RegularLeaveDays', 'MaternityLeaveDays', 'SickLeaveDays', 'PermissionDays',
+                     'AbsenceDays', 'DaysWorked', 'TenureMonths', 'Age']
+
+# Tipos de ausencia que agrega absenteeism_analysis (en este orden)
+ABSENCE_COLUMNS = ['AbsenceDays', 'SickLeaveDays', 'RegularLeaveDays', 'MaternityLeaveDays', 'PermissionDays']
+
+# Tramos de edad de la columna calculada AgeGroup
+AGE_BINS = [18, 25, 35, 45, 55, 65, 100]
+AGE_LABELS = ['18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+
+# Tramos de sueldo base usados por salary_analysis (y como dimensión del cubo de agregados)
+SALARY_BINS = [0, 500_000, 1_000_000, 1_500_000, 2_000_000, 3_000_000, float('inf')]
+SALARY_BAND_LABELS = ['<500k', '500k-1M', '1M-1.5M', '1.5M-2M', '2M-3M', '3M+']
+# Celdas de los sketches de cuantiles salariales (ver salary_sketch)
+SALARY_SKETCH_DIMENSIONS = ['Department', 'Período']
+
+# Formatos de fecha que se prueban (en orden) al detectar el formato de una columna
+DATE_FORMATS = ['%d-%m-%Y', '%d/%m/%Y', '%Y-%m-%d', '%d.%m.%Y', '%d-%m-%y', '%d/%m/%y',
+                '%Y-%m-%d %H:%M:%S', '%d-%m-%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S']
+
 # =============================================================================
 # 3. Funciones de normalización y estandarización
 # =============================================================================
@@ -131,6 +189,35 @@ def standardize_column_names(df):
             new_columns[col] = col
     return df.rename(columns=new_columns)
 
+def columns_for_analyses(analyses, registry=None):
+    """
+    Devuelve la lista de columnas que necesitan los análisis indicados,
+    incluyendo las columnas de origen de las columnas calculadas.
+    `registry` permite sumar otros catálogos (p.ej. INTEGRATED_COLUMNS de integrar.py).
+    """
+    catalog = dict(ANALYSIS_COLUMNS)
+    if registry:
+        catalog.update(registry)
+    needed = []
+    for name in analyses:
+        for col in catalog.get(name, []):
+            for c in [col] + DERIVED_COLUMN_SOURCES.get(col, []):
+                if c not in needed:
+                    needed.append(c)
+    return needed
+
+def column_selector(columns):
+    """
+    Construye un filtro para `usecols`: acepta una columna original si su nombre
+    normalizado coincide con alguna columna pedida o con alguno de sus sinónimos.
+    """
+    wanted = set()
+    for col in columns:
+        wanted.add(normalize_string(col))
+        for syn in STANDARD_COLUMN_SYNONYMS.get(col, []):
+            wanted.add(normalize_string(syn))
+    return lambda col: normalize_string(col) in wanted
+
 def normalize_and_map_data(df):
     """
     Aplica mapeo de valores y normaliza columnas numéricas específicas.
@@ -143,7 +230,12 @@ def normalize_and_map_data(df):
     """
     gender_mapping = {'F': 'Femenino', 'M': 'Masculino'}
     if 'Gender' in df.columns:
-        df['Gender'] = df['Gender'].map(gender_mapping).fillna(df['Gender'])
+        if isinstance(df['Gender'].dtype, pd.CategoricalDtype):
+            # Se mapea sobre las categorías (pocas) en vez de fila a fila
+            gender = df['Gender'].astype(object)
+            df['Gender'] = gender.map(gender_mapping).fillna(gender).astype('category')
+        else:
+            df['Gender'] = df['Gender'].map(gender_mapping).fillna(df['Gender'])
     
     cols_to_normalize = ['AbsenceDays', 'SickLeaveDays', 'RegularLeaveDays', 'MaternityLeaveDays', 'PermissionDays']
     for col in cols_to_normalize:
@@ -159,57 +251,316 @@ def normalize_and_map_data(df):
 # =============================================================================
 # 4. Función de carga y preparación de datos
 # =============================================================================
-def load_hr_data(file_input):
+def infer_dtype_plan(df):
     """
-    Carga datos desde CSV o Excel, estandariza nombres de columnas y normaliza datos
+    Decide el tipo compacto de cada columna a partir del primer bloque:
+      - 'category' para columnas de baja cardinalidad (CATEGORY_COLUMNS)
+      - 'integer' para conteos de días y columnas enteras
+      - 'float' para el resto de columnas numéricas decimales
     """
+    plan = {}
+    for col in df.columns:
+        if col in CATEGORY_COLUMNS:
+            plan[col] = 'category'
+        elif col in DAY_COUNT_COLUMNS or pd.api.types.is_integer_dtype(df[col]):
+            plan[col] = 'integer'
+        elif pd.api.types.is_float_dtype(df[col]):
+            plan[col] = 'float'
+    return plan
+
+def apply_dtype_plan(df, plan):
+    """
+    Aplica el plan de tipos a un bloque. Los enteros se reducen al menor tamaño
+    posible; los decimales pasan a float32 solo si no se pierde precisión.
+    Las columnas no numéricas que el plan marca como numéricas se dejan igual.
+    """
+    for col, kind in plan.items():
+        if col not in df.columns:
+            continue
+        if kind == 'category':
+            df[col] = df[col].astype('category')
+            continue
+        if not pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+            continue
+        values = df[col]
+        if kind == 'integer':
+            # Si hay NaN queda como float y se evalúa abajo
+            values = pd.to_numeric(values, downcast='integer')
+        if pd.api.types.is_float_dtype(values) and values.dtype != np.float32:
+            as32 = values.astype(np.float32)
+            if ((as32.astype(np.float64) == values) | values.isna()).all():
+                values = as32
+        df[col] = values
+    return df
+
+def concat_chunks(chunks):
+    """
+    Concatena bloques unificando las categorías, para que las columnas
+    'category' no vuelvan a object al concatenar.
+    """
+    if not chunks:
+        return pd.DataFrame()
+    for col in chunks[0].columns:
+        if not isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            continue
+        parts = [c[col] for c in chunks if col in c.columns]
+        categories = union_categoricals(parts).categories
+        dtype = pd.CategoricalDtype(categories)
+        for c in chunks:
+            if col in c.columns:
+                c[col] = c[col].astype(dtype)
+    return pd.concat(chunks, ignore_index=True)
+
+def detect_date_format(values, sample_size=200):
+    """
+    Devuelve el formato de DATE_FORMATS que reconoce más valores de una muestra,
+    o None si ninguno reconoce alguno.
+    """
+    sample = values.head(sample_size)
+    best_fmt, best_hits = None, 0
+    for fmt in DATE_FORMATS:
+        hits = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if hits > best_hits:
+            best_fmt, best_hits = fmt, hits
+            if hits == len(sample):
+                break
+    return best_fmt
+
+def parse_date_column(series, dayfirst=True):
+    """
+    Convierte una columna a datetime parseando cada valor distinto una sola vez:
+    detecta el formato sobre los valores únicos, usa el parseo flexible solo para
+    los que no calzan y reasigna el resultado a las filas por índice de código.
+    Retorna la columna convertida y la lista de valores que quedaron como NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, []
+
+    codes, uniques = pd.factorize(series)
+    uniq = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniq.index, dtype='datetime64[ns]')
+
+    is_str = uniq.map(lambda v: isinstance(v, str))
+    if (~is_str).any():
+        # Valores ya tipados (p.ej. fechas leídas desde Excel)
+        parsed[~is_str] = pd.to_datetime(uniq[~is_str], dayfirst=dayfirst, errors='coerce')
+    if is_str.any():
+        strs = uniq[is_str].str.strip()
+        fmt = detect_date_format(strs)
+        if fmt:
+            parsed[is_str] = pd.to_datetime(strs, format=fmt, errors='coerce')
+        pending = is_str & parsed.isna()
+        if pending.any():
+            parsed[pending] = pd.to_datetime(uniq[pending].str.strip(), dayfirst=dayfirst, errors='coerce')
+
+    failed = uniq[parsed.isna() & (uniq.astype(str).str.strip() != '')].tolist()
+    # El código -1 (valor nulo) apunta al NaT agregado al final
+    lookup = np.append(parsed.to_numpy(), np.datetime64('NaT', 'ns'))
+    return pd.Series(lookup[codes], index=series.index, name=series.name), failed
+
+def iter_csv_chunks(file_input, chunksize, usecols=None):
+    """
+    Recorre el CSV por bloques de `chunksize` filas, estandariza nombres y aplica
+    en cada bloque el plan de tipos inferido del primero. Solo mantiene un bloque
+    en memoria a la vez.
+    """
+    plan = None
+    reader = pd.read_csv(file_input, delimiter=';', decimal=',', thousands='.',
+                         usecols=usecols, chunksize=chunksize)
+    for chunk in reader:
+        chunk = standardize_column_names(chunk)
+        chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+        if plan is None:
+            plan = infer_dtype_plan(chunk)
+        yield apply_dtype_plan(chunk, plan)
+
+def read_csv_chunked(file_input, chunksize, usecols=None, on_chunk=None):
+    """
+    Lee el CSV por bloques (ver iter_csv_chunks) y los concatena. `on_chunk`
+    (opcional) recibe cada bloque ya tipado, p.ej. para alimentar un sketch.
+    """
+    chunks = []
+    for chunk in iter_csv_chunks(file_input, chunksize, usecols):
+        if on_chunk is not None:
+            on_chunk(chunk)
+        chunks.append(chunk)
+    return concat_chunks(chunks)
+
+def salary_sketch(df, sketch=None, value_column='BaseSalary'):
+    """
+    Agrega los sueldos de `df` (el dataset completo o un bloque de la carga) a
+    un QuantileSketch por Department × Período, creándolo si `sketch` es None.
+    Las dimensiones ausentes quedan como None.
+    """
+    sketch = sketch if sketch is not None else QuantileSketch(SALARY_SKETCH_DIMENSIONS)
+    if value_column not in df.columns:
+        return sketch
+    frame = df
+    if 'Período' not in df.columns and 'ContractStartDate' in df.columns \
+            and not pd.api.types.is_datetime64_any_dtype(df['ContractStartDate']):
+        # Bloque aún sin fechas parseadas (carga por bloques)
+        frame = pd.DataFrame({'ContractStartDate': parse_date_column(df['ContractStartDate'])[0]})
+    codes = period_codes(frame)
+    dims = {
+        'Department': df['Department'] if 'Department' in df.columns else np.full(len(df), None),
+        'Período': codes if codes is not None else np.zeros(len(df), dtype=np.int64),
+    }
+    return sketch.update(df[value_column], dims)
+
+class LoadProfile:
+    """
+    Registro opcional de tiempo, filas/seg y memoria del DataFrame por etapa
+    de load_hr_data. Uso: `with prof.stage("nombre", lambda: df): ...`
+    (la lambda se evalúa al entrar y al salir, así ve el df reasignado).
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+
+    @staticmethod
+    def _frame_bytes(df):
+        if isinstance(df, pd.DataFrame):
+            return int(df.memory_usage(deep=True).sum())
+        return 0
+
+    @contextmanager
+    def stage(self, name, get_df):
+        if not self.enabled:
+            yield
+            return
+        mem_before = self._frame_bytes(get_df())
+        t0 = time.perf_counter()
+        yield
+        seconds = time.perf_counter() - t0
+        df = get_df()
+        rows = len(df) if isinstance(df, pd.DataFrame) else 0
+        mem_after = self._frame_bytes(df)
+        self.stages.append({
+            'stage': name,
+            'seconds': round(seconds, 4),
+            'rows': rows,
+            'rows_per_sec': round(rows / seconds) if seconds > 0 else None,
+            'mem_after_mb': round(mem_after / 1024 ** 2, 2),
+            'mem_delta_mb': round((mem_after - mem_before) / 1024 ** 2, 2),
+        })
+
+    def to_dict(self):
+        last = self.stages[-1] if self.stages else {}
+        return {
+            'stages': self.stages,
+            'total_seconds': round(sum(s['seconds'] for s in self.stages), 4),
+            'rows': last.get('rows', 0),
+            'memory_mb': last.get('mem_after_mb', 0.0),
+        }
+
+def format_load_profile(profile):
+    """Tabla de texto con el resultado de LoadProfile.to_dict() (para la CLI)."""
+    lines = [f"{'Etapa':<22}{'Seg':>10}{'Filas':>12}{'Filas/seg':>14}{'MB':>10}{'Δ MB':>10}"]
+    for s in profile['stages']:
+        rps = s['rows_per_sec'] if s['rows_per_sec'] is not None else '-'
+        lines.append(f"{s['stage']:<22}{s['seconds']:>10.3f}{s['rows']:>12}{rps:>14}"
+                     f"{s['mem_after_mb']:>10.2f}{s['mem_delta_mb']:>10.2f}")
+    lines.append(f"{'Total':<22}{profile['total_seconds']:>10.3f}{profile['rows']:>12}"
+                 f"{'':>14}{profile['memory_mb']:>10.2f}")
+    return "\n".join(lines)
+
+def load_hr_data(file_input, columns=None, chunksize=None, profile=False, sketch=None):
+    """
+    Carga datos desde CSV o Excel, estandariza nombres de columnas y normaliza datos.
+    Los archivos .parquet se asumen sidecars ya procesados y se devuelven tal cual.
+    Si se indica `columns` (ver columns_for_analyses) solo se leen esas columnas
+    y sus sinónimos. Con `chunksize` los CSV se leen por bloques con tipos compactos.
+    Con `profile=True` retorna (df, perfil) donde perfil es LoadProfile.to_dict().
+    Si se entrega `sketch` (un QuantileSketch de salary_sketch) se alimenta con
+    los sueldos bloque a bloque durante la lectura, o al final si no hay bloques.
+    """
+    prof = LoadProfile(enabled=profile)
+    df = None
+
+    def result(frame):
+        return (frame, prof.to_dict()) if profile else frame
+
     try:
         if hasattr(file_input, 'name'):
             file_name = file_input.name
         else:
             file_name = str(file_input)
         
-        if file_name.endswith('.csv'):
-            df = pd.read_csv(file_input, delimiter=';', decimal=',', thousands='.')
-        elif file_name.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file_input)
-        else:
-            raise ValueError("Formato no soportado")
+        usecols = column_selector(columns) if columns is not None else None
+
+        with prof.stage('lectura', lambda: df):
+            if file_name.endswith('.parquet'):
+                # Sidecar generado al subir: ya viene estandarizado y tipado
+                if usecols is None:
+                    df = pd.read_parquet(file_input)
+                else:
+                    import pyarrow.parquet as pq
+                    names = pq.read_schema(file_input).names
+                    df = pd.read_parquet(file_input, columns=[c for c in names if usecols(c)])
+            elif file_name.endswith('.csv'):
+                if chunksize:
+                    on_chunk = (lambda chunk, target=sketch: salary_sketch(chunk, target)) if sketch is not None else None
+                    df = read_csv_chunked(file_input, chunksize, usecols=usecols, on_chunk=on_chunk)
+                    sketch = None  # ya se alimentó por bloques
+                else:
+                    df = pd.read_csv(file_input, delimiter=';', decimal=',', thousands='.', usecols=usecols)
+            elif file_name.endswith(('.xlsx', '.xls')):
+                df = pd.read_excel(file_input, usecols=usecols)
+            else:
+                raise ValueError("Formato no soportado")
+        if file_name.endswith('.parquet'):
+            if sketch is not None:
+                salary_sketch(df, sketch)
+            return result(df)
         
         # Estandarizar nombres de columnas
-        df = standardize_column_names(df)
+        with prof.stage('estandarizar_columnas', lambda: df):
+            df = standardize_column_names(df)
         # Eliminar columnas duplicadas (se conserva la primera aparición)
-        df = df.loc[:, ~df.columns.duplicated()]
+        with prof.stage('columnas_duplicadas', lambda: df):
+            df = df.loc[:, ~df.columns.duplicated()]
         
         if 'Faena' in df.columns:
             df['Faena'] = df['Faena'].fillna('').astype(str)
         
         date_cols = ['BirthDate', 'ContractStartDate', 'ContractEndDate']
-        for col in date_cols:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], dayfirst=True, errors='coerce')
-        
-        if 'TenureMonths' in df.columns:
-            df['TenureYears'] = df['TenureMonths'] / 12
+        unparsed_dates = {}
+        with prof.stage('fechas', lambda: df):
+            for col in date_cols:
+                if col in df.columns:
+                    df[col], failed = parse_date_column(df[col], dayfirst=True)
+                    if failed:
+                        unparsed_dates[col] = failed
+                        print(f"Aviso: {len(failed)} valores no reconocidos como fecha en '{col}' (quedan NaT)")
+        # Valores distintos que se convirtieron en NaT, por columna
+        df.attrs['unparsed_dates'] = unparsed_dates
         
-        if 'Age' in df.columns:
-            age_bins = [18, 25, 35, 45, 55, 65, 100]
-            age_labels = ['18-24', '25-34', '35-44', '45-54', '55-64', '65+']
-            df['AgeGroup'] = pd.cut(df['Age'], bins=age_bins, labels=age_labels, right=False)
+        with prof.stage('antiguedad_y_edad', lambda: df):
+            if 'TenureMonths' in df.columns:
+                df['TenureYears'] = df['TenureMonths'] / 12
+            
+            if 'Age' in df.columns:
+                df['AgeGroup'] = pd.cut(df['Age'], bins=AGE_BINS, labels=AGE_LABELS, right=False)
         
-        df = normalize_and_map_data(df)
+        with prof.stage('normalizar_y_mapear', lambda: df):
+            df = normalize_and_map_data(df)
         
-        return df
+        if sketch is not None:
+            with prof.stage('sketch_salarial', lambda: df):
+                salary_sketch(df, sketch)
+        return result(df)
     except Exception as e:
         print(f"Error cargando datos: {str(e)}")
-        return None
+        return result(None)
 
 # =============================================================================
 # 5. Funciones de análisis (demográfico, contratos, salarial, asistencia)
 # =============================================================================
-def demographic_analysis(df):
+def demographic_analysis(df, cube=None):
     """
     Análisis demográfico: Distribución de edad, género, nacionalidad y antigüedad.
+    Si se entrega `cube` (un CubeView) los conteos y promedios salen del cubo;
+    la nacionalidad no es dimensión del cubo y se calcula sobre `df`.
     Retorna una figura Plotly.
     """
     fig = make_subplots(
@@ -224,30 +575,46 @@ def demographic_analysis(df):
         )
     )
     if 'AgeGroup' in df.columns:
-        age_dist = df['AgeGroup'].value_counts().sort_index()
+        if cube is not None and cube.has('AgeGroup'):
+            age_dist = cube.counts('AgeGroup').sort_index()
+        else:
+            age_dist = df['AgeGroup'].value_counts().sort_index()
         fig.add_trace(go.Bar(x=age_dist.index.astype(str), y=age_dist.values, name='Edad'), row=1, col=1)
     if 'Gender' in df.columns:
-        gender_dist = df['Gender'].value_counts()
+        if cube is not None and cube.has('Gender'):
+            gender_dist = cube.counts('Gender')
+        else:
+            gender_dist = df['Gender'].value_counts()
         fig.add_trace(go.Pie(labels=gender_dist.index, values=gender_dist.values, name='Género'), row=1, col=2)
     if 'Nationality' in df.columns:
         # Convertimos el conteo a porcentaje
         nat_pct = df['Nationality'].value_counts(normalize=True) * 100
         fig.add_trace(go.Bar(x=nat_pct.index.astype(str), y=nat_pct.values, name='Nacionalidad (%)'), row=2, col=1)
     if 'Gender' in df.columns and 'TenureYears' in df.columns:
-        tenure_by_gender = df.groupby('Gender')['TenureYears'].mean()
+        if cube is not None and cube.has('Gender', 'TenureYears'):
+            rolled = cube.rollup(['Gender']).dropna(subset=['Gender'])
+            tenure_by_gender = rolled.set_index('Gender')['TenureYears_mean']
+        else:
+            tenure_by_gender = df.groupby('Gender')['TenureYears'].mean()
         fig.add_trace(go.Bar(x=tenure_by_gender.index, y=tenure_by_gender.values, name='Antigüedad'), row=2, col=2)
     fig.update_layout(height=800, showlegend=False, title_text="Análisis Demográfico")
     return fig
 
-def contract_analysis(df):
+def contract_analysis(df, cube=None):
     """
-    Análisis de contratos.
+    Análisis de contratos. Con `cube` los conteos salen del cubo de agregados.
     """
     if 'ContractType' not in df.columns or 'Department' not in df.columns:
         return go.Figure().update_layout(title="Datos insuficientes para análisis de contratos")
     
-    contract_dist = df['ContractType'].value_counts()
-    contract_dept = pd.crosstab(df['Department'], df['ContractType'])
+    if cube is not None and cube.has('ContractType', 'Department'):
+        contract_dist = cube.counts('ContractType')
+        rolled = cube.rollup(['Department', 'ContractType']).dropna(subset=['Department', 'ContractType'])
+        contract_dept = rolled.pivot_table(index='Department', columns='ContractType', values='count',
+                                           aggfunc='sum', fill_value=0, observed=True)
+    else:
+        contract_dist = df['ContractType'].value_counts()
+        contract_dept = pd.crosstab(df['Department'], df['ContractType'])
     
     fig = make_subplots(
         rows=1, cols=2,
@@ -260,25 +627,44 @@ def contract_analysis(df):
     fig.update_layout(barmode='stack', title_text="Análisis de Contratos")
     return fig
 
-def salary_analysis(df):
+def salary_bands(salaries, bins=None, labels=None):
+    """Tramo salarial (categórico ordenado) de cada sueldo base."""
+    return pd.cut(salaries, bins=bins or SALARY_BINS, labels=labels or SALARY_BAND_LABELS, include_lowest=True)
+
+def salary_analysis(df, cube=None, sketch=None, bins=None, labels=None):
     """
     Análisis salarial modificado para mostrar la distribución en porcentajes por Departamento.
+    `bins`/`labels` permiten tramos distintos a SALARY_BINS. Con los tramos por
+    defecto los conteos son exactos (cubo de agregados o filas); `sketch`
+    (QuantileSketch de salary_sketch) solo se usa para tramos personalizados y
+    el gráfico se rotula como aproximado.
     """
     try:
         if 'Department' not in df.columns or 'BaseSalary' not in df.columns:
             raise ValueError("Columnas necesarias no encontradas")
-        df_clean = df.dropna(subset=['Department', 'BaseSalary']).copy()
-        bins = [0, 500_000, 1_000_000, 1_500_000, 2_000_000, 3_000_000, float('inf')]
-        labels = ['<500k', '500k-1M', '1M-1.5M', '1.5M-2M', '2M-3M', '3M+']
-        df_clean['SalaryBand'] = pd.cut(df_clean['BaseSalary'], bins=bins, labels=labels, include_lowest=True)
-        df_clean = df_clean.dropna(subset=['SalaryBand'])
-        if df_clean.empty:
+        bins = bins or SALARY_BINS
+        labels = labels or (SALARY_BAND_LABELS if bins == SALARY_BINS else
+                            [f"{lo:,.0f}+" if hi == float('inf') else f"{lo:,.0f}-{hi:,.0f}"
+                             for lo, hi in zip(bins[:-1], bins[1:])])
+        title = 'Distribución Salarial por Departamento (Porcentajes)'
+        if cube is not None and cube.has('Department', 'SalaryBand') and bins == SALARY_BINS:
+            df_counts = cube.rollup(['Department', 'SalaryBand']).dropna(subset=['Department', 'SalaryBand'])
+            df_counts = df_counts[df_counts['count'] > 0][['Department', 'SalaryBand', 'count']]
+        elif sketch is not None and bins != SALARY_BINS:
+            df_counts = sketch.histogram(bins, labels, by=['Department'])
+            df_counts = df_counts[df_counts['count'] > 0].rename(columns={'band': 'SalaryBand'})
+            title += ' (aprox. ±1% en los cortes)'
+        else:
+            df_clean = df.dropna(subset=['Department', 'BaseSalary']).copy()
+            df_clean['SalaryBand'] = salary_bands(df_clean['BaseSalary'], bins, labels)
+            df_clean = df_clean.dropna(subset=['SalaryBand'])
+
+            # Agrupamos por Departamento y SalaryBand y contamos la cantidad de empleados
+            df_counts = df_clean.groupby(['Department', 'SalaryBand'], observed=True).size().reset_index(name='count')
+        if df_counts.empty:
             raise ValueError("No hay datos válidos para generar el gráfico")
-        
-        # Agrupamos por Departamento y SalaryBand y contamos la cantidad de empleados
-        df_counts = df_clean.groupby(['Department', 'SalaryBand']).size().reset_index(name='count')
         # Calculamos el porcentaje respecto al total de empleados en cada departamento
-        df_counts['perc'] = df_counts.groupby('Department')['count'].transform(lambda x: x / x.sum() * 100)
+        df_counts['perc'] = df_counts['count'] / df_counts.groupby('Department', observed=True)['count'].transform('sum') * 100
         
         # Creamos un gráfico de barras apiladas para mostrar los porcentajes
         fig = px.bar(
@@ -286,7 +672,7 @@ def salary_analysis(df):
             x='Department',
             y='perc',
             color='SalaryBand',
-            title='Distribución Salarial por Departamento (Porcentajes)',
+            title=title,
             labels={'perc': 'Porcentaje (%)'}
         )
         fig.update_layout(barmode='stack', yaxis=dict(ticksuffix='%'))
@@ -295,28 +681,57 @@ def salary_analysis(df):
         print(f"Error en análisis salarial: {str(e)}")
         return px.scatter(title="Error en datos salariales")
 
+def salary_percentiles(df, sketch=None, quantiles=(0.1, 0.5, 0.9), by='Department'):
+    """
+    Percentiles de BaseSalary por `by` (Department o Período), desde `sketch`
+    (error relativo ~1%) o, sin sketch, exactos sobre las filas.
+    Retorna (tabla, figura).
+    """
+    columns = [f"p{round(q * 100):g}" for q in quantiles]
+    if sketch is not None:
+        table = sketch.quantiles(quantiles, by=[by])
+    else:
+        if by not in df.columns or 'BaseSalary' not in df.columns:
+            return None, px.scatter(title="Error en datos salariales")
+        grouped = df.dropna(subset=[by]).groupby(by, observed=True)['BaseSalary']
+        table = grouped.quantile(list(quantiles)).unstack()
+        table.columns = columns
+        table.insert(0, 'n', grouped.count())
+        table = table.reset_index()
+    if by == 'Período':
+        table[by] = table[by].map(format_period)
+    fig = px.bar(table, x=by, y=columns, barmode='group',
+                 title=f"Percentiles de Sueldo Base por {by}",
+                 labels={'value': 'Sueldo Base', 'variable': 'Percentil'})
+    return table, fig
 
-def attendance_analysis(df):
+def attendance_analysis(df, cube=None):
     """
-    Análisis de asistencia.
+    Análisis de asistencia. Con `cube` los promedios por departamento salen del cubo.
     """
     try:
-        leave_columns = ['RegularLeaveDays', 'MaternityLeaveDays', 'SickLeaveDays', 'PermissionDays']
-        existing_leave = [col for col in leave_columns if col in df.columns]
-        if existing_leave:
-            df['TotalLeave'] = df[existing_leave].sum(axis=1)
-        else:
-            df['TotalLeave'] = 0
-
-        if 'VacationDays' not in df.columns:
-            df['VacationDays'] = 0
+        if cube is not None and cube.has('Department', 'DaysWorked', 'AbsenceDays'):
+            rolled = cube.rollup(['Department']).dropna(subset=['Department'])
+            attendance_dept = pd.DataFrame({
+                'Department': rolled['Department'],
+                'DaysWorked': rolled['DaysWorked_mean'],
+                'AbsenceDays': rolled['AbsenceDays_mean'],
+                'VacationDays': rolled['VacationDays_mean'] if cube.has('VacationDays') else 0,
+            })
+            return px.bar(attendance_dept, x='Department', y=['DaysWorked', 'AbsenceDays', 'VacationDays'],
+                          barmode='group', title='Patrones de Asistencia por Departamento',
+                          labels={'value': 'Días', 'variable': 'Tipo'})
 
         required = ['Department', 'DaysWorked', 'AbsenceDays']
         for col in required:
             if col not in df.columns:
                 raise ValueError(f"No se encontró la columna requerida: {col}")
-        
-        attendance_dept = df.groupby('Department')[['DaysWorked', 'AbsenceDays', 'VacationDays']].mean().reset_index()
+
+        # No se modifica `df`: puede estar compartido con otros análisis en paralelo
+        attendance = df[required + [c for c in ['VacationDays'] if c in df.columns]]
+        if 'VacationDays' not in attendance.columns:
+            attendance = attendance.assign(VacationDays=0)
+        attendance_dept = attendance.groupby('Department')[['DaysWorked', 'AbsenceDays', 'VacationDays']].mean().reset_index()
         fig = px.bar(attendance_dept, x='Department', y=['DaysWorked', 'AbsenceDays', 'VacationDays'],
                      barmode='group', title='Patrones de Asistencia por Departamento',
                      labels={'value': 'Días', 'variable': 'Tipo'})
@@ -328,59 +743,49 @@ def attendance_analysis(df):
 # =============================================================================
 # 5bis. Funciones para análisis de Licencias Médicas Electrónicas (LME)
 # =============================================================================
-def analyze_total_LME(df):
-    total = df.groupby(['Año', 'Tipo de Licencia'])['Cantidad'].sum().reset_index()
-    pivot = total.pivot(index='Tipo de Licencia', columns='Año', values='Cantidad').reset_index()
-    if 2023 in pivot.columns and 2024 in pivot.columns:
-        pivot['Variación %'] = ((pivot[2024] - pivot[2023]) / pivot[2023]) * 100
+# Todas reciben opcionalmente un LMEEngine ya construido (una pasada sobre el
+# extracto para todas las tablas) y `pairs`, los pares de años a comparar
+# (por defecto cada año contra el anterior).
+def analyze_total_LME(df, engine=None, pairs=None):
+    engine = engine or LMEEngine(df)
+    pivot, total = engine.total(pairs)
     fig = px.bar(total, x='Tipo de Licencia', y='Cantidad', color='Año', barmode='group',
                  title="LME emitidas por Tipo y Año")
     return pivot, fig
 
-def analyze_LME_por_seguro(df):
-    df_tipo1 = df[df['Tipo de Licencia'] == "Enfermedad o Accidente Común"]
-    seguro = df_tipo1.groupby(['Seguro', 'Año'])['Cantidad'].sum().reset_index()
-    pivot = seguro.pivot(index='Seguro', columns='Año', values='Cantidad').reset_index()
-    if 2023 in pivot.columns and 2024 in pivot.columns:
-        pivot['Variación %'] = ((pivot[2024] - pivot[2023]) / pivot[2023]) * 100
+def analyze_LME_por_seguro(df, engine=None, pairs=None):
+    engine = engine or LMEEngine(df)
+    pivot, seguro = engine.por_seguro(pairs)
     fig = px.bar(seguro, x='Seguro', y='Cantidad', color='Año', barmode='group',
                  title="LME 'Enfermedad o Accidente Común' por Seguro")
     return pivot, fig
 
-def analyze_trabajadores_LME(df):
-    if 'TrabajadorID' not in df.columns:
+def analyze_trabajadores_LME(df, engine=None, pairs=None):
+    engine = engine or LMEEngine(df)
+    pivot, unique = engine.trabajadores(pairs)
+    if pivot is None:
         return None, None
-    unique = df[df['Tipo de Licencia'] == "Enfermedad o Accidente Común"]\
-                .groupby(['Seguro', 'Año'])['TrabajadorID'].nunique().reset_index()
-    pivot = unique.pivot(index='Seguro', columns='Año', values='TrabajadorID').reset_index()
-    if 2023 in pivot.columns and 2024 in pivot.columns:
-        pivot['Variación %'] = ((pivot[2024] - pivot[2023]) / pivot[2023]) * 100
     fig = px.bar(unique, x='Seguro', y='TrabajadorID', color='Año', barmode='group',
                  title="Trabajadores Únicos por Seguro")
     return pivot, fig
 
-def analyze_estado_resolucion_LME(df):
-    estado = df.groupby(['Año', 'Estado Resolución', 'Seguro'])['Cantidad'].sum().reset_index()
-    total_por_seguro = df.groupby(['Año', 'Seguro'])['Cantidad'].sum().reset_index().rename(columns={'Cantidad':'Total'})
-    rechazados = df[df['Estado Resolución'] == "Rechazase"].groupby(['Año', 'Seguro'])['Cantidad'].sum().reset_index().rename(columns={'Cantidad':'Rechazados'})
-    tasa = pd.merge(total_por_seguro, rechazados, on=['Año', 'Seguro'], how='left')
-    tasa['Rechazados'] = tasa['Rechazados'].fillna(0)
-    tasa['Tasa Rechazo (%)'] = (tasa['Rechazados'] / tasa['Total']) * 100
+def analyze_estado_resolucion_LME(df, engine=None):
+    engine = engine or LMEEngine(df)
+    estado, tasa = engine.estado_resolucion()
     fig = px.bar(tasa, x='Seguro', y='Tasa Rechazo (%)', color='Año', barmode='group',
                  title="Tasa de Rechazo por Seguro")
     return estado, fig
 
-def analyze_grupo_diagnostico_LME(df):
-    grupo = df.groupby(['Año', 'Grupo Diagnostico'])['Cantidad'].sum().reset_index()
-    pivot = grupo.pivot(index='Grupo Diagnostico', columns='Año', values='Cantidad').reset_index()
-    if 2023 in pivot.columns and 2024 in pivot.columns:
-        pivot['Variación %'] = ((pivot[2024] - pivot[2023]) / pivot[2023]) * 100
+def analyze_grupo_diagnostico_LME(df, engine=None, pairs=None):
+    engine = engine or LMEEngine(df)
+    pivot, grupo = engine.grupo_diagnostico(pairs)
     fig = px.bar(grupo, x='Grupo Diagnostico', y='Cantidad', color='Año', barmode='group',
                  title="LME por Grupo Diagnóstico")
     return pivot, fig
 
-def analyze_duracion_LME(df):
-    duracion = df.groupby(['Año', 'Grupo Diagnostico'])['DiasAutorizados'].mean().reset_index()
+def analyze_duracion_LME(df, engine=None):
+    engine = engine or LMEEngine(df)
+    duracion = engine.duracion()
     fig = px.bar(duracion, x='Grupo Diagnostico', y='DiasAutorizados', color='Año', barmode='group',
                  title="Duración Promedio de LME por Grupo Diagnóstico")
     return duracion, fig
@@ -402,12 +807,12 @@ def absenteeism_analysis(df):
 
     if 'Período' not in df.columns:
         if 'ContractStartDate' in df.columns:
-            df['Período'] = df['ContractStartDate'].dt.strftime("%Y%m")
+            df['Período'] = period_labels(period_codes(df))
         else:
             raise ValueError("No se encontró la columna 'Período' ni 'ContractStartDate' para el análisis de ausentismo.")
     
     absence_cols = []
-    for col in ['AbsenceDays', 'SickLeaveDays', 'RegularLeaveDays', 'MaternityLeaveDays', 'PermissionDays']:
+    for col in ABSENCE_COLUMNS:
         if col in df.columns:
             absence_cols.append(col)
     if not absence_cols:
@@ -419,20 +824,6 @@ def absenteeism_analysis(df):
     for col in absence_cols:
         agg_df[f"{col}_pct"] = (agg_df[col] / agg_df['TotalAusentismo']) * 100
 
-    month_map = {
-        "01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril",
-        "05": "Mayo", "06": "Junio", "07": "Julio", "08": "Agosto",
-        "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
-    }
-
-    def format_period(yyyymm):
-        if len(yyyymm) == 6:
-            year = yyyymm[:4]
-            month = yyyymm[4:]
-            return f"{month_map.get(month, month)} {year}"
-        else:
-            return yyyymm
-
     agg_df['Período_formateado'] = agg_df['Período'].apply(format_period)
 
     # Gráfico de barras apiladas
@@ -504,68 +895,164 @@ def absenteeism_analysis(df):
 # =============================================================================
 # NUEVA FUNCIÓN: Comparativa de Ausentismo entre dos períodos
 # =============================================================================
-def absenteeism_comparison(agg_df, period1, period2):
+def absenteeism_comparison(agg_df, period1, period2, matrix=None):
     """
     Compara dos períodos de ausentismo a partir del DataFrame agregado (agg_df) generado por absenteeism_analysis.
-    period1 y period2 deben ser cadenas en formato YYYYMM.
+    period1 y period2 deben ser cadenas en formato YYYYMM. `matrix` (opcional) es un
+    AbsenteeismMatrix ya construido sobre agg_df.
     
     Retorna:
       - DataFrame comparativo con los valores absolutos y porcentuales por tipo.
       - Figura comparativa (barras agrupadas) que muestra los días de ausencia por tipo para ambos períodos.
       - Texto resumen que indica las principales diferencias estadísticas.
     """
-    comp1 = agg_df[agg_df['Período'] == period1]
-    comp2 = agg_df[agg_df['Período'] == period2]
-    
-    if comp1.empty or comp2.empty:
-        raise ValueError("Uno o ambos de los períodos seleccionados no existen en los datos.")
-    
-    comp1 = comp1.iloc[0]
-    comp2 = comp2.iloc[0]
-    
-    comparison_data = []
-    absence_cols = [col for col in ['AbsenceDays', 'SickLeaveDays', 'RegularLeaveDays', 'MaternityLeaveDays', 'PermissionDays'] if col in agg_df.columns]
-    for col in absence_cols:
-        val1 = comp1[col]
-        val2 = comp2[col]
-        pct1 = comp1[f"{col}_pct"]
-        pct2 = comp2[f"{col}_pct"]
-        diff = val2 - val1
-        diff_pct = ((val2 - val1) / val1 * 100) if val1 != 0 else None
-        comparison_data.append({
-            "TipoAusencia": col,
-            f"{period1}": val1,
-            f"{period2}": val2,
-            "Diferencia": diff,
-            "Diferencia (%)": diff_pct,
-            f"{period1}_pct": pct1,
-            f"{period2}_pct": pct2,
-        })
-    comp_df = pd.DataFrame(comparison_data)
+    matrix = matrix or AbsenteeismMatrix(agg_df)
+    comp_df = matrix.pair(period1, period2)
     
     comp_fig = px.bar(comp_df, x="TipoAusencia", y=[f"{period1}", f"{period2}"],
                       barmode="group", title="Comparativa de Ausentismo por Tipo",
                       labels={"value": "Días de Ausentismo", "variable": "Período"})
     
-    total1 = comp1['TotalAusentismo']
-    total2 = comp2['TotalAusentismo']
-    total_diff = total2 - total1
-    total_diff_pct = ((total2 - total1) / total1 * 100) if total1 != 0 else None
-    resumen = f"Comparación entre {comp1['Período_formateado']} y {comp2['Período_formateado']}:\n"
-    resumen += f"- Total de ausentismo en {comp1['Período_formateado']}: {total1:.0f} días.\n"
-    resumen += f"- Total de ausentismo en {comp2['Período_formateado']}: {total2:.0f} días.\n"
-    resumen += f"- Diferencia total: {total_diff:.0f} días ({total_diff_pct:.1f}% {'aumento' if total_diff_pct and total_diff_pct>0 else 'disminución'}).\n"
-    for item in comparison_data:
-        diff_pct = item["Diferencia (%)"]
-        if diff_pct is not None and abs(diff_pct) > 10:
-            resumen += f"- En {item['TipoAusencia']}, se observó una diferencia de {diff_pct:.1f}%.\n"
+    i, j = matrix.position(period1), matrix.position(period2)
+    label1, label2 = matrix.labels[i], matrix.labels[j]
+    total1, total2 = matrix.values[[i, j], -1]
+    total_diff = matrix.delta[i, j, -1]
+    total_diff_pct = matrix.delta_pct[i, j, -1]
+    resumen = f"Comparación entre {label1} y {label2}:\n"
+    resumen += f"- Total de ausentismo en {label1}: {total1:.0f} días.\n"
+    resumen += f"- Total de ausentismo en {label2}: {total2:.0f} días.\n"
+    # delta_pct es NaN cuando el período base tiene 0 días
+    if np.isnan(total_diff_pct):
+        resumen += f"- Diferencia total: {total_diff:.0f} días (sin base de comparación).\n"
+    else:
+        resumen += f"- Diferencia total: {total_diff:.0f} días ({total_diff_pct:.1f}% {'aumento' if total_diff_pct > 0 else 'disminución'}).\n"
+    for tipo, diff, diff_pct in zip(comp_df["TipoAusencia"], comp_df["Diferencia"], comp_df["Diferencia (%)"]):
+        if np.isnan(diff_pct):
+            if diff != 0:
+                resumen += f"- En {tipo}, se pasó de 0 a {diff:.0f} días (sin base de comparación).\n"
+        elif abs(diff_pct) > 10:
+            resumen += f"- En {tipo}, se observó una diferencia de {diff_pct:.1f}%.\n"
     
     return comp_df, comp_fig, resumen
 
+class AbsenteeismMatrix:
+    """
+    Comparación de todos los pares de períodos del agg_df de absenteeism_analysis,
+    calculada de una vez con arrays. Para P períodos y T tipos (las columnas de
+    ausencia más 'TotalAusentismo'):
+      - values, share: (P, T) días y participación (%) en el total del período.
+      - delta, delta_pct, share_shift: (P, P, T); [i, j] compara el período j
+        contra el período base i (días, % de cambio y puntos de participación).
+    Un % de cambio con base 0 queda como NaN.
+    """
+    METRICS = {'delta': 'Diferencia', 'delta_pct': 'Diferencia (%)', 'share_shift': 'Cambio de participación (pp)'}
+
+    def __init__(self, agg_df):
+        self.types = [c for c in ABSENCE_COLUMNS if c in agg_df.columns] + ['TotalAusentismo']
+        raw = agg_df['Período'].astype(str).to_numpy()
+        codes = np.array([to_period_code(p) for p in raw], dtype=np.int64)
+        order = np.argsort(codes, kind='stable')
+        self.periods = raw[order]
+        self.codes = codes[order]
+        self.labels = [format_period(p) for p in self.periods]
+        self.values = agg_df[self.types].to_numpy(dtype=float)[order]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.share = self.values / self.values[:, -1:] * 100
+            self.delta = self.values[None, :, :] - self.values[:, None, :]
+            base = self.values[:, None, :]
+            self.delta_pct = np.where(base != 0, self.delta / base * 100, np.nan)
+        self.share_shift = self.share[None, :, :] - self.share[:, None, :]
+
+    def position(self, period):
+        found = np.flatnonzero(self.periods == str(period))
+        if not len(found):
+            raise ValueError("Uno o ambos de los períodos seleccionados no existen en los datos.")
+        return int(found[0])
+
+    def pair(self, period1, period2):
+        """Tabla por tipo de ausencia entre dos períodos (mismas columnas que absenteeism_comparison)."""
+        i, j = self.position(period1), self.position(period2)
+        types = slice(0, len(self.types) - 1)
+        return pd.DataFrame({
+            "TipoAusencia": self.types[types],
+            f"{period1}": self.values[i, types],
+            f"{period2}": self.values[j, types],
+            "Diferencia": self.delta[i, j, types],
+            "Diferencia (%)": self.delta_pct[i, j, types],
+            f"{period1}_pct": self.share[i, types],
+            f"{period2}_pct": self.share[j, types],
+        })
+
+    def heatmap(self, metric='delta_pct', absence_type='TotalAusentismo'):
+        """Matriz período base (filas) × período comparado (columnas) para un tipo."""
+        grid = getattr(self, metric)[:, :, self.types.index(absence_type)]
+        return pd.DataFrame(grid, index=self.labels, columns=self.labels)
+
+    def changes(self, lag='period', metric='delta_pct'):
+        """
+        Cambio de cada período contra el anterior (lag='period') o contra el mismo
+        mes del año anterior (lag='year'), para todos los tipos. Los períodos sin
+        base quedan fuera.
+        """
+        if lag == 'period':
+            target = np.arange(1, len(self.codes))
+            base = target - 1
+        elif lag == 'year':
+            prev = self.codes - 100  # mismo mes, año anterior (YYYYMM)
+            pos = np.clip(np.searchsorted(self.codes, prev), 0, max(len(self.codes) - 1, 0))
+            target = np.flatnonzero(self.codes[pos] == prev)
+            base = pos[target]
+        else:
+            raise ValueError(f"lag {lag} no soportado (use 'period' o 'year')")
+        out = pd.DataFrame(getattr(self, metric)[base, target, :], columns=self.types)
+        out.insert(0, 'Base', [self.labels[k] for k in base])
+        out.insert(0, 'Período', [self.labels[k] for k in target])
+        return out
+
+def absenteeism_forecaster(df, by='Department'):
+    """AbsenceForecaster entrenado con el total de ABSENCE_COLUMNS (el mismo de absenteeism_analysis)."""
+    return AbsenceForecaster(df, ABSENCE_COLUMNS, by=by)
+
+def absenteeism_forecast(df, forecaster=None, horizon=6, level=0.9, unit=TOTAL_UNIT):
+    """
+    Pronóstico de ausentismo de los próximos `horizon` meses por Departamento.
+    Con `forecaster` (p.ej. entrenado una vez con el dataset completo) no se
+    reentrena y `df` (el subconjunto filtrado) solo elige los períodos de la
+    historia que se grafican. Retorna (tabla de pronósticos de todas las
+    unidades, figura de `unit` con su historia y el intervalo de nivel `level`).
+    """
+    forecaster = forecaster if forecaster is not None else absenteeism_forecaster(df)
+    table = forecaster.forecast(horizon, level)
+    if table.empty:
+        return table, px.scatter(title="Sin datos suficientes para pronosticar ausentismo")
+    unit_col = table.columns[0]
+    history = forecaster.history_frame()
+    history = history[history[unit_col] == unit]
+    codes = period_codes(df)
+    if codes is not None:
+        history = history[history['Período'].isin(np.unique(codes))]
+    ahead = table[table[unit_col] == unit]
+    x_hist = history['Período'].map(format_period)
+    x_ahead = ahead['Período'].map(format_period)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=pd.concat([x_ahead, x_ahead[::-1]]),
+                             y=pd.concat([ahead['Superior'], ahead['Inferior'][::-1]]),
+                             fill='toself', fillcolor='rgba(99,110,250,0.2)', line=dict(width=0),
+                             name=f"Intervalo {level:.0%}", hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=x_hist, y=history['TotalAusentismo'], mode='lines+markers', name='Observado'))
+    fig.add_trace(go.Scatter(x=x_ahead, y=ahead['Pronóstico'], mode='lines+markers',
+                             line=dict(dash='dash'), name='Pronóstico'))
+    fig.update_layout(title=f"Pronóstico de Ausentismo - {unit}",
+                      xaxis_title="Período", yaxis_title="Días de Ausentismo")
+    return table, fig
+
 # =============================================================================
 # 6. Funciones adicionales para análisis integral y generación de reportes
 # =============================================================================
-def generate_hr_overview(df):
+def generate_hr_overview(df, cube=None):
+    if cube is not None:
+        return _overview_from_cube(df, cube)
     overview = {}
     overview['total_employees'] = len(df)
     if 'Gender' in df.columns:
@@ -589,15 +1076,96 @@ def generate_hr_overview(df):
         overview['attendance_ratio'] = total_worked / (total_worked + total_absence) if (total_worked + total_absence) != 0 else None
     return overview
 
-def analyze_hr_data(df):
-    results = {}
-    results['overview'] = generate_hr_overview(df)
-    results['demographic'] = demographic_analysis(df)
-    results['contracts'] = contract_analysis(df)
-    results['salary'] = salary_analysis(df)
-    results['attendance'] = attendance_analysis(df)
+def _overview_from_cube(df, cube):
+    """Mismo resumen que generate_hr_overview, respondido desde un CubeView."""
+    overview = {}
+    overview['total_employees'] = cube.total_count()
+    if 'Gender' in df.columns and cube.has('Gender'):
+        overview['gender_distribution'] = cube.counts('Gender').to_dict()
+    for key, measure in (('avg_tenure', 'TenureYears'), ('avg_salary', 'BaseSalary'), ('avg_age', 'Age')):
+        if measure in df.columns and cube.has(measure):
+            overview[key] = cube.mean(measure)
+    if 'Department' in df.columns and cube.has('Department'):
+        overview['top_departments'] = cube.counts('Department').head(3).to_dict()
+    if 'ContractType' in df.columns and cube.has('ContractType'):
+        overview['contract_distribution'] = cube.counts('ContractType').to_dict()
+    if cube.has('DaysWorked', 'AbsenceDays'):
+        totals = cube.rollup().iloc[0]
+        total_worked = totals['DaysWorked_sum']
+        total_absence = totals['AbsenceDays_sum']
+        overview['attendance_ratio'] = total_worked / (total_worked + total_absence) if (total_worked + total_absence) != 0 else None
+    return overview
+
+# Análisis que ejecuta analyze_hr_data, en orden de presentación
+HR_ANALYSES = {
+    'overview': generate_hr_overview,
+    'demographic': demographic_analysis,
+    'contracts': contract_analysis,
+    'salary': salary_analysis,
+    'attendance': attendance_analysis,
+}
+
+def _run_analysis(name, df, cube):
+    """Ejecuta un análisis y retorna (nombre, resultado, segundos, error)."""
+    t0 = time.perf_counter()
+    try:
+        result, error = HR_ANALYSES[name](df, cube), None
+    except Exception as e:
+        result, error = None, f"{type(e).__name__}: {e}"
+    return name, result, round(time.perf_counter() - t0, 4), error
+
+def _executor(kind, workers):
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == 'thread':
+        return ThreadPoolExecutor(max_workers=workers)
+    raise ValueError(f"Ejecutor {kind} no soportado (use 'thread' o 'process')")
+
+def analyze_hr_data(df, cube=None, workers=1, executor='thread', profile=False):
+    """
+    Ejecuta los análisis de HR_ANALYSES sobre `df`, que se comparte sin modificar.
+    `cube` (opcional) es un CubeView del mismo subconjunto de filas que `df`.
+    Con workers > 1 los análisis corren en paralelo en un pool de hilos
+    (executor='thread') o de procesos (executor='process'; cada proceso recibe
+    una copia serializada de `df`). Un análisis que falla queda como None y no
+    detiene al resto. Con profile=True retorna (resultados, info), donde info
+    tiene los segundos y el error de cada análisis.
+    """
+    names = list(HR_ANALYSES)
+    if workers and workers > 1:
+        with _executor(executor, min(workers, len(names))) as pool:
+            runs = list(pool.map(_run_analysis, names, [df] * len(names), [cube] * len(names)))
+    else:
+        runs = [_run_analysis(name, df, cube) for name in names]
+
+    results, timings, errors = {}, {}, {}
+    for name, result, seconds, error in runs:
+        results[name] = result
+        timings[name] = seconds
+        if error:
+            errors[name] = error
+            print(f"Error en análisis {name}: {error}")
+    if profile:
+        return results, {'timings': timings, 'errors': errors}
     return results
 
+def _analyze_unit(unit, df, cube, profile):
+    return unit, analyze_hr_data(df, cube, profile=profile)
+
+def analyze_by_unit(df, column, workers=1, executor='thread', profile=False):
+    """
+    Ejecuta analyze_hr_data por cada valor de `column` (p.ej. una unidad de
+    negocio), repartiendo las unidades en un pool de `workers`. Cada unidad
+    corre sus análisis en secuencia; retorna {unidad: resultado de analyze_hr_data}.
+    """
+    units = [(unit, group) for unit, group in df.groupby(column, observed=True, sort=True)]
+    if workers and workers > 1 and len(units) > 1:
+        with _executor(executor, min(workers, len(units))) as pool:
+            runs = pool.map(_analyze_unit, [u for u, _ in units], [g for _, g in units],
+                            [None] * len(units), [profile] * len(units))
+            return dict(runs)
+    return dict(_analyze_unit(unit, group, None, profile) for unit, group in units)
+
 def export_analysis_report(df, results, format='html'):
     try:
         if format == 'html':
@@ -612,7 +1180,7 @@ def export_analysis_report(df, results, format='html'):
             html_report.write("<div class='header'><h1>Informe de RRHH</h1>")
             html_report.write(f"<p>Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M')}</p></div>")
             html_report.write("<div class='section'><h2>Resumen General</h2>")
-            overview = results.get('overview', {})
+            overview = results.get('overview') or {}
             for key, value in overview.items():
                 html_report.write(f"<p><strong>{key.replace('_', ' ').capitalize()}:</strong> {value}</p>")
             html_report.write("</div>")
@@ -620,7 +1188,7 @@ def export_analysis_report(df, results, format='html'):
             return html_report.getvalue()
         elif format == 'json':
             import json
-            return json.dumps(results.get('overview', {}))
+            return json.dumps(results.get('overview') or {})
         else:
             raise ValueError(f"Formato {format} no soportado")
     except Exception as e:
@@ -639,35 +1207,83 @@ if __name__ == "__main__":
         required=True,
         help="Ruta al archivo de datos (CSV o Excel) a procesar"
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Muestra tiempo, filas/seg y memoria de cada etapa de la carga"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=1,
+        help="Cantidad de análisis (o unidades con --by) que se ejecutan en paralelo"
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Tipo de pool para --workers > 1"
+    )
+    parser.add_argument(
+        "--by",
+        help="Genera un reporte por cada valor de esta columna (p.ej. Department)"
+    )
+    parser.add_argument(
+        "--percentiles",
+        action="store_true",
+        help="Imprime percentiles salariales por Department, estimados durante la carga"
+    )
     args = parser.parse_args()
 
-    df = load_hr_data(args.input)
+    sketch = QuantileSketch(SALARY_SKETCH_DIMENSIONS) if args.percentiles else None
+    if args.profile:
+        df, load_profile = load_hr_data(args.input, profile=True, sketch=sketch)
+        print(format_load_profile(load_profile))
+    else:
+        df = load_hr_data(args.input, sketch=sketch)
     if df is not None:
         print("Datos cargados y procesados correctamente.")
-        results = analyze_hr_data(df)
-
-        print("\nResumen General:")
-        for key, value in results['overview'].items():
-            print(f"{key}: {value}")
-
-        # Mostrar gráficas si corres en un entorno que lo soporte
-        try:
-            results['demographic'].show()
-            results['contracts'].show()
-            results['salary'].show()
-            results['attendance'].show()
-        except Exception:
-            pass
-
-        # Exportar reporte
-        reporte_html = export_analysis_report(df, results, format='html')
-        out_html = f"reporte_rrhh_{os.path.basename(args.input).split('.')[0]}.html"
-        with open(out_html, "w", encoding="utf-8") as f:
-            f.write(reporte_html)
-        df.to_csv(f"datos_procesados_{os.path.basename(args.input)}.csv", index=False)
-
-        print(f"\nReporte generado: '{out_html}'")
-        print(f"Datos procesados guardados en 'datos_procesados_{os.path.basename(args.input)}.csv'")
+        if sketch is not None:
+            print("\nPercentiles de Sueldo Base:")
+            print(salary_percentiles(df, sketch)[0].to_string(index=False))
+        base_name = os.path.basename(args.input).split('.')[0]
+        if args.by:
+            if args.by not in df.columns:
+                parser.error(f"La columna {args.by} no existe en los datos")
+            by_unit = analyze_by_unit(df, args.by, workers=args.workers, executor=args.executor, profile=True)
+            for unit, (unit_results, info) in by_unit.items():
+                out_html = f"reporte_rrhh_{base_name}_{normalize_string(unit).replace(' ', '_')}.html"
+                with open(out_html, "w", encoding="utf-8") as f:
+                    f.write(export_analysis_report(df, unit_results, format='html'))
+                status = f"{len(info['errors'])} errores" if info['errors'] else "ok"
+                print(f"{unit}: {sum(info['timings'].values()):.3f} s ({status}) -> {out_html}")
+        else:
+            results, run_info = analyze_hr_data(df, workers=args.workers, executor=args.executor, profile=True)
+            if args.profile:
+                for name, seconds in run_info['timings'].items():
+                    print(f"{name:<22}{seconds:>10.3f}  {run_info['errors'].get(name, '')}")
+
+            print("\nResumen General:")
+            for key, value in (results['overview'] or {}).items():
+                print(f"{key}: {value}")
+
+            # Mostrar gráficas si corres en un entorno que lo soporte
+            try:
+                for name in ('demographic', 'contracts', 'salary', 'attendance'):
+                    if results[name] is not None:
+                        results[name].show()
+            except Exception:
+                pass
+
+            # Exportar reporte
+            reporte_html = export_analysis_report(df, results, format='html')
+            out_html = f"reporte_rrhh_{base_name}.html"
+            with open(out_html, "w", encoding="utf-8") as f:
+                f.write(reporte_html)
+            df.to_csv(f"datos_procesados_{os.path.basename(args.input)}.csv", index=False)
+
+            print(f"\nReporte generado: '{out_html}'")
+            print(f"Datos procesados guardados en 'datos_procesados_{os.path.basename(args.input)}.csv'")
     else:
         print("Error: No se pudo cargar el archivo de datos")
 
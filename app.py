@@ -2,12 +2,27 @@ import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import tempfile
 # ───── Página Config (SIEMPRE lo primero) ───────────────────────────────────────
 st.set_page_config(page_title="RR.HH Integrado", page_icon="👥", layout="wide")
 
+# Copy-on-write: las vistas del dataset compartido no se modifican entre sesiones.
+# Desde pandas 3 siempre está activo y la opción está obsoleta.
+if int(pd.__version__.split(".")[0]) < 3:
+    try:
+        pd.set_option("mode.copy_on_write", True)
+    except Exception:
+        print("[WARN] pandas sin copy-on-write; las sesiones comparten datos sin protección")
+
 # ----- S3 -----
 from s3_manager import S3Manager
+from dataset_cache import DatasetCache, SharedDatasetStore, file_fingerprint
+from filter_engine import FilterEngine
+from cube import HRCube, CubeView, CUBE_DIMENSIONS, SALARY_CUBE_DIMENSIONS, cube_dimensions
+from lme_engine import LMEEngine, consecutive_pairs
+from headcount import HeadcountEngine
+from periods import MONTH_NAMES, format_period, period_filter_mask, to_period_code
+from search_index import SearchIndex
+from exporter import DataExporter, EXPORT_FORMATS
 from analisis_hr import load_hr_data, absenteeism_analysis  # …y el resto
 
 # ───── Config S3 ────────────────────────────────────────────────────────────────
@@ -16,42 +31,81 @@ BUCKET_OR_AP = os.getenv(
     "arn:aws:s3:us-east-2:715841338590:accesspoint/acceso-betel"
 )
 REGION = os.getenv("AWS_REGION", "us-east-2")
+S3_CACHE_DIR = os.getenv("S3_CACHE_DIR")  # por defecto <tmp>/s3_cache
+S3_CACHE_MAX_MB = int(os.getenv("S3_CACHE_MAX_MB", "512"))
+S3_LISTING_TTL = float(os.getenv("S3_LISTING_TTL", "30"))
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16"))
+S3_MULTIPART_CHUNK_MB = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8"))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+CSV_CHUNKSIZE = int(os.getenv("CSV_CHUNKSIZE", "100000"))  # 0 = lectura en un solo bloque
+SHARED_STORE_MB = int(os.getenv("SHARED_STORE_MB", "2048"))
+DATASET_SPILL_MB = int(os.getenv("DATASET_SPILL_MB", "512"))  # 0 = sin nivel serializado
+EXPORT_CACHE_MB = int(os.getenv("EXPORT_CACHE_MB", "1024"))
 
 if not BUCKET_OR_AP:
     st.error("Falta la variable de entorno AWS_ACCESS_POINT_ARN con el ARN de tu Access Point.")
     st.stop()
 
-S3 = S3Manager(BUCKET_OR_AP, region=REGION)
+@st.cache_resource
+def get_s3_manager() -> S3Manager:
+    # Una sola instancia por proceso: conserva las cachés entre reruns
+    return S3Manager(
+        BUCKET_OR_AP,
+        region=REGION,
+        cache_dir=S3_CACHE_DIR,
+        cache_max_bytes=S3_CACHE_MAX_MB * 1024 * 1024,
+        listing_ttl=S3_LISTING_TTL,
+        multipart_threshold=S3_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+        multipart_chunksize=S3_MULTIPART_CHUNK_MB * 1024 * 1024,
+        max_concurrency=S3_MAX_CONCURRENCY,
+    )
+
+S3 = get_s3_manager()
 
 # …el resto de tu código…
 
+def build_parquet_sidecar(key: str, file_obj):
+    """
+    Etapa de ingesta (una vez por subida): estandariza el archivo con load_hr_data
+    y guarda el resultado tipado como Parquet en processed/.
+    """
+    file_obj.seek(0)
+    df = load_hr_data(file_obj, chunksize=CSV_CHUNKSIZE or None)
+    if df is not None and S3.write_sidecar(key, df):
+        st.sidebar.caption("Versión procesada (Parquet) generada.")
+
 def setup_sidebar() -> str | None:
     st.sidebar.header("📁 Gestión de datos")
     uploaded = st.sidebar.file_uploader("Subir CSV / Excel (se guarda en S3)", type=["csv", "xlsx"])
 
     if uploaded:
-        # usa el directorio temporal del sistema, portable a Windows
-        tmp_dir  = tempfile.gettempdir()
-        tmp_path = os.path.join(tmp_dir, uploaded.name)
-        with open(tmp_path, "wb") as f:
-            f.write(uploaded.read())
+        # se envía directo desde memoria; si el contenido ya está en S3 no se resube
         key = f"uploads/{uploaded.name}"
-        S3.upload(tmp_path, key)
-        st.sidebar.success(f"Archivo guardado en S3 → {key}")
+        if S3.upload_fileobj_dedup(uploaded, key):
+            st.sidebar.success(f"Archivo guardado en S3 → {key}")
+            build_parquet_sidecar(key, uploaded)
+        else:
+            st.sidebar.info(f"Archivo ya presente en S3 → {key}")
         st.session_state["current_key"] = key
 
-    # listado en S3
-    keys = S3.list_keys("uploads/")
+    # listado en S3 (paginado y cacheado), más recientes primero
+    objects = sorted(S3.list_objects("uploads/"), key=lambda o: o["LastModified"], reverse=True)
+    keys = [o["Key"] for o in objects]
     sel_key = st.sidebar.selectbox("Histórico en S3", keys, index=0 if keys else None)
 
     if sel_key:
-        # descarga también en temp dir
-        tmp_dir  = tempfile.gettempdir()
-        tmp_path = os.path.join(tmp_dir, os.path.basename(sel_key))
-        S3.download(sel_key, tmp_path)
+        # prefiere el sidecar Parquet vigente; descarga a la caché local
+        # (solo baja de S3 si cambió el ETag)
+        side_key = S3.fresh_sidecar(sel_key)
+        local_path = S3.download_cached(side_key or sel_key)
         st.sidebar.info(f"Mostrando: {sel_key}")
+        st.sidebar.checkbox(
+            "⚡ Cargar solo las columnas del análisis", value=True, key="load_projection",
+            help="Desactívalo para usar el mapeo de columnas o ver todas las columnas."
+        )
+        st.sidebar.checkbox("🛠️ Medir etapas de carga", value=False, key="profile_load")
         # devuelve ruta local
-        return tmp_path
+        return local_path
 
     st.sidebar.info("Sin datos.")
     return None
@@ -63,25 +117,75 @@ from analisis_hr import (
     demographic_analysis, 
     contract_analysis, 
     salary_analysis, 
+    salary_percentiles,
+    salary_sketch,
+    SALARY_BINS,
     attendance_analysis,
     analyze_total_LME,
     analyze_grupo_diagnostico_LME,
     analyze_duracion_LME,
     absenteeism_analysis,
     absenteeism_comparison,
-    causales_analysis
+    absenteeism_forecast,
+    absenteeism_forecaster,
+    AbsenteeismMatrix,
+    causales_analysis,
+    columns_for_analyses,
+    column_selector,
+    DERIVED_COLUMN_SOURCES
 )
 
 from integrar import (
+    INTEGRATED_COLUMNS,
     horas_extras_vs_sueldos,
     faltas_vs_sueldo,
     antiguedad,
     dotacion,
     composicion_ausencias,
     empleados_activos,
-    faltas_por_cargo_y_departamento
+    faltas_por_cargo_y_departamento,
+    anomalias_nomina,
+    distinct_rut_counter
 )
 
+ANALYSIS_OPTIONS = {
+    "📋 Datos Procesados": "DatosProcesados",
+    "👥 Análisis Demográfico": "Demografico",
+    "📑 Análisis de Contratos": "Contratos",
+    "💰 Análisis Salarial": "Salarial",
+    "⏰ Análisis de Asistencia": "Asistencia",
+    "📈 Análisis LME": "LME",
+    "📉 Análisis de Ausentismo": "Ausentismo",
+    "📊 Análisis de Causales": "Causales",
+    "🔧 Análisis Integrados": "Integrados"
+}
+
+# Análisis (ver ANALYSIS_COLUMNS / INTEGRATED_COLUMNS) que usa cada pestaña.
+# "DatosProcesados" no aparece: siempre carga todas las columnas.
+ANALYSIS_REQUIREMENTS = {
+    "Demografico": ["demographic"],
+    "Contratos": ["contracts"],
+    "Salarial": ["salary"],
+    "Asistencia": ["attendance"],
+    "LME": ["lme"],
+    "Ausentismo": ["absenteeism"],
+    "Causales": ["causales"],
+    "Integrados": list(INTEGRATED_COLUMNS),
+}
+
+# Pestañas que responden desde un cubo de agregados y con qué dimensiones;
+# el resto no construye cubo
+CUBE_TABS = {
+    "Demografico": CUBE_DIMENSIONS,
+    "Contratos": CUBE_DIMENSIONS,
+    "Asistencia": CUBE_DIMENSIONS,
+    "Salarial": SALARY_CUBE_DIMENSIONS,
+}
+
+# Columnas que usan los filtros y las métricas clave en todas las pestañas
+DASHBOARD_COLUMNS = ["Período", "ContractStartDate", "ContractEndDate", "NationalID", "Status",
+                     "causal de termino", "Salary", "BaseSalary", "Department"]
+
 # --------------------------------------------------------------------------------
 # Funciones Auxiliares
 # --------------------------------------------------------------------------------
@@ -93,9 +197,165 @@ def init_session_state():
     if "df_filtered" not in st.session_state:
         st.session_state["df_filtered"] = pd.DataFrame()
 
-@st.cache_data
-def cached_load_data(file) -> pd.DataFrame:
-    return load_hr_data(file)
+@st.cache_resource
+def get_dataset_store() -> SharedDatasetStore:
+    # Un único DataFrame vivo por dataset; cada sesión recibe una vista. Los desalojados
+    # quedan en Arrow IPC comprimido hasta DATASET_SPILL_MB antes de releer el archivo
+    spill = DatasetCache(max_bytes=DATASET_SPILL_MB * 1024 * 1024, compression="zstd") if DATASET_SPILL_MB else None
+    return SharedDatasetStore(max_bytes=SHARED_STORE_MB * 1024 * 1024, spill=spill)
+
+def dataset_key(file, columns: tuple | None = None) -> tuple:
+    """Identifica un dataset cargado: huella de contenido + opciones de carga (el perfil no cambia los datos)."""
+    return (file_fingerprint(file), columns, CSV_CHUNKSIZE)
+
+@st.cache_resource(max_entries=16)
+def get_filter_engine(key: tuple, _df: pd.DataFrame) -> FilterEngine:
+    # Se construye una vez por dataset y se comparte entre sesiones
+    return FilterEngine(_df)
+
+@st.cache_resource(max_entries=16)
+def get_cube(key: tuple, dimensions: tuple, _df: pd.DataFrame, _engine: FilterEngine) -> HRCube:
+    # Cubo de agregados por dataset y pestaña; los filtros solo recortan sus celdas
+    return HRCube(_df, period_codes=_engine.period_codes, active=_engine.active, dimensions=dimensions)
+
+def current_cube_view(df: pd.DataFrame, engine: FilterEngine) -> CubeView | None:
+    """Vista filtrada del cubo de la pestaña elegida (None si la pestaña o el dataset no lo usan)."""
+    dimensions = CUBE_TABS.get(ANALYSIS_OPTIONS.get(st.session_state.get("analysis_choice")))
+    if not dimensions or not [d for d in cube_dimensions(df.columns, dimensions) if d != "Período"]:
+        return None
+    cube = get_cube(st.session_state["dataset_key"], tuple(dimensions), df, engine)
+    return cube.view(st.session_state["filter_params"])
+
+@st.cache_resource(max_entries=16)
+def get_lme_engine(key: tuple, filters: tuple, _df: pd.DataFrame) -> LMEEngine:
+    # Una pasada por dataset y combinación de filtros para todas las tablas LME
+    return LMEEngine(_df)
+
+@st.cache_resource(max_entries=16)
+def get_absence_forecaster(key: tuple, _df: pd.DataFrame):
+    # Modelos entrenados una vez por dataset (sin filtrar); cada rerun solo pronostica
+    return absenteeism_forecaster(_df)
+
+@st.cache_resource(max_entries=16)
+def get_headcount_engine(key: tuple, _df: pd.DataFrame) -> HeadcountEngine | None:
+    # Eventos de ingreso/término ordenados una vez por dataset
+    if "ContractStartDate" not in _df.columns:
+        return None
+    return HeadcountEngine(_df, id_column="NationalID")
+
+def headcount_cutoff(df: pd.DataFrame) -> pd.Timestamp:
+    """Fecha de corte para la dotación: fin del último período filtrado (u hoy)."""
+    if "Período" in df.columns:
+        codes = [to_period_code(p) for p in pd.unique(df["Período"])]
+        last = max(codes, default=0)
+        if last:
+            return pd.Period(year=last // 100, month=last % 100, freq="M").end_time.normalize()
+    return pd.Timestamp.today().normalize()
+
+@st.cache_resource(max_entries=16)
+def get_salary_sketch(key: tuple, _df: pd.DataFrame):
+    # Sketch de cuantiles por Department × Período; los filtros de período solo eligen celdas
+    return salary_sketch(_df)
+
+def salary_sketch_view(params: dict):
+    """Sketch salarial recortado a los períodos filtrados (None si hay filtro de estado)."""
+    if params.get("state") or params.get("custom_column"):
+        return None
+    sketch = get_salary_sketch(st.session_state["dataset_key"], st.session_state["df_original"])
+    if not len(sketch.cells):
+        return None
+    return sketch.select(period_filter_mask(sketch.cells["Período"].to_numpy(), params))
+
+@st.cache_resource(max_entries=16)
+def get_distinct_counter(key: tuple, filters: tuple, exact: bool, _df: pd.DataFrame):
+    # Rut únicos por celda, agregables sin volver a recorrer las filas
+    return distinct_rut_counter(_df, exact=exact)
+
+@st.cache_resource
+def get_exporter() -> DataExporter:
+    return DataExporter(max_bytes=EXPORT_CACHE_MB * 1024 * 1024)
+
+def current_filter_state() -> tuple:
+    """Valores de los filtros del sidebar, para identificar una descarga ya generada."""
+    keys = ("year_filter", "month_filter", "state_filter", "period_range", "window_filter", "estado_activo")
+    mapping = st.session_state["column_mappings"].get("estado_trabajador", {})
+    return tuple(st.session_state.get(k) for k in keys) + (tuple(sorted(mapping.items())),)
+
+@st.cache_resource(max_entries=8)
+def get_search_index(key: tuple, _df: pd.DataFrame) -> SearchIndex:
+    # Se construye la primera vez que alguien busca en el dataset
+    return SearchIndex(_df)
+
+def cached_load_data(file, columns: tuple | None = None, profile: bool = False):
+    """
+    Devuelve (df, perfil de carga); el perfil es None si profile=False.
+    La caché se indexa por la huella de contenido del archivo, no por su ruta.
+    Se guarda un solo DataFrame por archivo con la unión de las columnas de las
+    pestañas visitadas; df es una vista de él proyectada a `columns`: no copiar
+    sin necesidad.
+    """
+    key = (file_fingerprint(file), CSV_CHUNKSIZE)
+    loaded = []
+
+    def loader(load_columns):
+        loaded.append(True)
+        out = load_hr_data(file, columns=sorted(load_columns) if load_columns is not None else None,
+                           chunksize=CSV_CHUNKSIZE or None, profile=profile)
+        if not profile:
+            return out, None
+        df, prof = out
+        prof["loaded_at"] = pd.Timestamp.now()
+        return df, prof
+
+    # El store es el único dueño del DataFrame vivo; su nivel Arrow solo guarda los desalojados
+    df, prof = get_dataset_store().acquire(key, loader, columns=columns, project=project_columns)
+    if not profile:
+        return df, None
+    if loaded:
+        return df, prof
+    # Acierto de caché: el perfil (si lo hay) es el de la carga original, no el de esta ejecución
+    return df, {**(prof or {}), "cached": True}
+
+def project_columns(available, columns) -> list:
+    """Columnas cargadas que corresponden a `columns` (por nombre o sinónimo) o se derivan al cargar."""
+    wanted = column_selector(columns)
+    return [c for c in available
+            if wanted(c) or any(wanted(src) for src in DERIVED_COLUMN_SOURCES.get(c, []))]
+
+def display_load_profile(profile: dict):
+    cached = profile.get("cached", False)
+    with st.expander("🛠️ Depuración: etapas de carga" + (" (en caché)" if cached else "")):
+        if cached:
+            st.caption("Esta ejecución no leyó el archivo: los datos vienen del almacén compartido.")
+        if "stages" in profile:
+            if cached:
+                st.write(f"Tiempos de la carga original ({profile['loaded_at']:%Y-%m-%d %H:%M:%S}):")
+            st.write(f"**Total:** {profile['total_seconds']:.3f} s · "
+                     f"{profile['rows']:,} filas · {profile['memory_mb']:.1f} MB")
+            st.dataframe(pd.DataFrame(profile["stages"]))
+        else:
+            st.write("El dataset se cargó sin perfil de etapas.")
+        store = get_dataset_store().stats()
+        st.write(f"**Datasets compartidos:** {store['datasets']} en memoria · "
+                 f"{store['bytes'] / 1024 ** 2:.1f} / {store['max_bytes'] / 1024 ** 2:.0f} MB · "
+                 f"{store['references']} vistas activas · {store['hits']} aciertos · "
+                 f"{store['misses']} fallos · {store['evictions']} desalojos")
+        spill = store["spill"]
+        if spill:
+            st.write(f"**Nivel Arrow IPC:** {spill['entries']} datasets · "
+                     f"{spill['bytes'] / 1024 ** 2:.1f} / {spill['max_bytes'] / 1024 ** 2:.0f} MB · "
+                     f"{spill['hits']} aciertos · {spill['misses']} fallos · {spill['evictions']} desalojos")
+
+def selected_columns() -> tuple | None:
+    """Columnas a cargar para la pestaña elegida (None = todas)."""
+    if not st.session_state.get("load_projection", True):
+        return None
+    tab = ANALYSIS_OPTIONS.get(st.session_state.get("analysis_choice"))
+    analyses = ANALYSIS_REQUIREMENTS.get(tab)
+    if not analyses:
+        return None
+    needed = columns_for_analyses(analyses, INTEGRATED_COLUMNS)
+    return tuple(DASHBOARD_COLUMNS + [c for c in needed if c not in DASHBOARD_COLUMNS])
 
 def inject_css():
     st.markdown(
@@ -152,29 +412,23 @@ def display_header():
             unsafe_allow_html=True
         )
 
-def setup_period_filters(df: pd.DataFrame) -> pd.DataFrame:
+def setup_period_filters(df: pd.DataFrame, engine: FilterEngine) -> pd.DataFrame:
     st.sidebar.markdown("### ⏱️ Filtros Temporales")
-    df_filtered = df.copy()
 
-    if 'Período' not in df_filtered.columns:
-        if 'ContractStartDate' in df_filtered.columns:
-            df_filtered['Período'] = df_filtered['ContractStartDate'].dt.strftime("%Y%m")
-            st.sidebar.info("Se creó 'Período' a partir de 'ContractStartDate'.")
-        else:
-            st.sidebar.warning("No se encontró 'Período' ni 'ContractStartDate'.")
-            return df_filtered
-
-    df_filtered['Período'] = df_filtered['Período'].astype(str)
-    unique_periods = df_filtered['Período'].unique()
-    unique_years = sorted({p[:4] for p in unique_periods if len(p) >= 6})
-    unique_months = sorted({p[4:6] for p in unique_periods if len(p) >= 6})
-
-    month_names = {
-        "01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril",
-        "05": "Mayo", "06": "Junio", "07": "Julio", "08": "Agosto",
-        "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
-    }
-    month_options = ["Todos"] + [f"{month_names.get(m, m)} ({m})" for m in unique_months]
+    if engine.period_source is None:
+        st.sidebar.warning("No se encontró 'Período' ni 'ContractStartDate'.")
+        st.session_state["filter_params"] = None
+        return df
+    if engine.period_source == 'ContractStartDate':
+        st.sidebar.info("Se creó 'Período' a partir de 'ContractStartDate'.")
+
+    unique_years = engine.available_years()
+    unique_months = engine.available_months()
+    periods = engine.available_periods()
+
+    month_options = ["Todos"] + [f"{MONTH_NAMES.get(m, m)} ({m})" for m in unique_months]
+    window_options = {"Sin ventana": None, "Últimos 3 meses": 3, "Últimos 6 meses": 6,
+                      "Últimos 12 meses": 12, "Últimos 24 meses": 24}
 
     with st.sidebar.form("filtros_form"):
         col1, col2 = st.columns(2)
@@ -184,6 +438,14 @@ def setup_period_filters(df: pd.DataFrame) -> pd.DataFrame:
             selected_month_display = st.selectbox("Mes", options=month_options, key="month_filter")
         selected_month = "Todos" if selected_month_display == "Todos" else selected_month_display.split("(")[1].strip(")")
 
+        period_from = period_to = None
+        if len(periods) > 1:
+            period_from, period_to = st.select_slider(
+                "Rango de períodos", options=periods, value=(periods[0], periods[-1]),
+                format_func=format_period, key="period_range"
+            )
+        window_label = st.selectbox("Ventana móvil (termina en 'hasta')", list(window_options), key="window_filter")
+
         state_options = ["Todos", "Activos", "No Activos"]
         selected_state = st.selectbox("Estado del Trabajador", state_options, key="state_filter")
         map_estado = st.checkbox("¿Mapear columna para estado del trabajador?")
@@ -191,60 +453,53 @@ def setup_period_filters(df: pd.DataFrame) -> pd.DataFrame:
         custom_active_value = None
         if map_estado:
             req = {"Estado": "Columna que indica estado del trabajador:"}
-            mapping_estado = dynamic_column_mapping(df_filtered, req, "estado_trabajador")
+            mapping_estado = dynamic_column_mapping(df, req, "estado_trabajador")
             if len(mapping_estado) == 1:
                 custom_estado = mapping_estado["Estado"]
                 st.info(f"Columna mapeada: {custom_estado}")
-                custom_active_value = st.text_input("Valor que indica activo:", value="Active")
+                custom_active_value = st.text_input("Valor que indica activo:", value="Active", key="estado_activo")
             else:
                 st.warning("Complete el mapeo para proceder.")
 
         submit_filters = st.form_submit_button("Aplicar Filtros")
 
-    if selected_year != "Todos":
-        df_filtered = df_filtered[df_filtered['Período'].str.startswith(selected_year)]
-    if selected_month != "Todos":
-        df_filtered = df_filtered[df_filtered['Período'].str.endswith(selected_month)]
-
-    if selected_state in ["Activos", "No Activos"]:
-        if custom_estado:
-            if selected_state == "Activos":
-                df_filtered = df_filtered[
-                    df_filtered[custom_estado].astype(str).str.lower().str.strip() == custom_active_value.lower().strip()
-                ]
-            else:
-                df_filtered = df_filtered[
-                    df_filtered[custom_estado].astype(str).str.lower().str.strip() != custom_active_value.lower().strip()
-                ]
-        else:
-            if "Status" in df_filtered.columns:
-                if selected_state == "Activos":
-                    df_filtered = df_filtered[df_filtered['Status'] == 'Active']
-                else:
-                    df_filtered = df_filtered[df_filtered['Status'] != 'Active']
-            elif 'causal de termino' in df_filtered.columns:
-                if selected_state == "Activos":
-                    df_filtered = df_filtered[
-                        df_filtered['causal de termino'].astype(str).str.lower().str.strip() == 'sin definir'
-                    ]
-                else:
-                    df_filtered = df_filtered[
-                        df_filtered['causal de termino'].astype(str).str.lower().str.strip() != 'sin definir'
-                    ]
+    # Máscaras precalculadas y cacheadas por el motor: no se copia ni recorre el df
+    params = engine.resolve(
+        year=selected_year,
+        month=selected_month,
+        state=selected_state,
+        custom_column=custom_estado,
+        custom_active_value=custom_active_value,
+        period_from=period_from,
+        period_to=period_to,
+        window_months=window_options[window_label],
+    )
+    # Filtros efectivos, también los usa el cubo de agregados
+    st.session_state["filter_params"] = params
+    df_filtered = engine.apply(df, engine.mask(df, params))
 
     st.sidebar.markdown(f"**Registros:** {len(df_filtered):,}")
     return df_filtered
 
-def display_key_metrics(df: pd.DataFrame):
+def display_key_metrics(df: pd.DataFrame, cube: CubeView | None = None):
     st.markdown('<h3 class="section-title">📊 Métricas Clave</h3>', unsafe_allow_html=True)
     c1, c2, c3, c4 = st.columns(4)
     
-    total_empleados = len(df)
+    total_empleados = cube.total_count() if cube is not None else len(df)
     with c1:
         st.metric(label="Total Empleados", value=total_empleados)
 
     with c2:
-        if 'Status' in df.columns:
+        params = st.session_state.get("filter_params") or {}
+        headcount = get_headcount_engine(st.session_state.get("dataset_key"), st.session_state["df_original"])
+        if headcount is not None and headcount.deduplicated and headcount.contracts and not params.get("state"):
+            # Dotación vigente según fechas de contrato al cierre del período filtrado
+            # (solo con NationalID: sin él cada fila de remuneraciones contaría como contrato)
+            activos = int(headcount.active_on(headcount_cutoff(df))[0])
+        elif cube is not None and cube.has('Activo'):
+            by_state = cube.rollup(['Activo']).set_index('Activo')['count']
+            activos = int(by_state.get(True, 0))
+        elif 'Status' in df.columns:
             activos = (df['Status'] == 'Active').sum()
         elif 'causal de termino' in df.columns:
             activos = (df['causal de termino'].astype(str).str.lower().str.strip() == 'sin definir').sum()
@@ -253,18 +508,20 @@ def display_key_metrics(df: pd.DataFrame):
         st.metric(label="Empleados Activos", value=activos)
 
     with c3:
-        if 'Salary' in df.columns and pd.api.types.is_numeric_dtype(df['Salary']):
-            avg = df['Salary'].mean()
-            st.metric(label="Salario Prom.", value=f"${avg:,.2f}")
-        elif 'BaseSalary' in df.columns and pd.api.types.is_numeric_dtype(df['BaseSalary']):
-            avg = df['BaseSalary'].mean()
-            st.metric(label="Salario Prom.", value=f"${avg:,.2f}")
-        else:
+        salary_col = next((c for c in ('Salary', 'BaseSalary')
+                           if c in df.columns and pd.api.types.is_numeric_dtype(df[c])), None)
+        if salary_col is None:
             st.metric(label="Salario Prom.", value="N/A")
+        else:
+            avg = cube.mean(salary_col) if cube is not None and cube.has(salary_col) else df[salary_col].mean()
+            st.metric(label="Salario Prom.", value=f"${avg:,.2f}")
 
     with c4:
         if 'Department' in df.columns:
-            deptos = df['Department'].nunique()
+            if cube is not None and cube.has('Department'):
+                deptos = len(cube.counts('Department'))
+            else:
+                deptos = df['Department'].nunique()
             st.metric(label="Departamentos", value=deptos)
         else:
             st.metric(label="Departamentos", value="N/A")
@@ -332,49 +589,65 @@ def convalidacion_licencias(df: pd.DataFrame):
 # --------------------------------------------------------------------------------
 # MOSTRAR ANÁLISIS
 # --------------------------------------------------------------------------------
-def display_analysis(df: pd.DataFrame):
-    analysis_options = {
-        "📋 Datos Procesados": "DatosProcesados",
-        "👥 Análisis Demográfico": "Demografico",
-        "📑 Análisis de Contratos": "Contratos",
-        "💰 Análisis Salarial": "Salarial",
-        "⏰ Análisis de Asistencia": "Asistencia",
-        "📈 Análisis LME": "LME",
-        "📉 Análisis de Ausentismo": "Ausentismo",
-        "📊 Análisis de Causales": "Causales",
-        "🔧 Análisis Integrados": "Integrados"
-    }
+def display_analysis(df: pd.DataFrame, cube: CubeView | None = None):
     st.sidebar.markdown("### 📈 Tipo de Análisis")
-    selected_analysis = st.sidebar.radio("Seleccione qué desea visualizar:", list(analysis_options.keys()))
+    selected_analysis = st.sidebar.radio(
+        "Seleccione qué desea visualizar:", list(ANALYSIS_OPTIONS.keys()), key="analysis_choice"
+    )
     st.markdown(f'<h3 class="section-title">{selected_analysis}</h3>', unsafe_allow_html=True)
     
     with st.container():
         st.markdown('<div class="dashboard-card">', unsafe_allow_html=True)
-        key = analysis_options[selected_analysis]
+        key = ANALYSIS_OPTIONS[selected_analysis]
 
         # Secciones originales (DatosProcesados, Demografico, etc.)...
         # --------------------------------------------------------------------
         if key == "DatosProcesados":
             st.write("Visualización del DataFrame filtrado.")
-            srch = st.text_input("🔍 Buscar en los datos:")
+            c_srch, c_scope = st.columns([3, 1])
+            with c_srch:
+                srch = st.text_input("🔍 Buscar en los datos:")
+            with c_scope:
+                scope = st.selectbox("Buscar en", ["Todas las columnas"] + list(df.columns))
+            prefix = st.checkbox("Coincidir por inicio de palabra", value=True)
             if srch:
-                disp_df = df[df.astype(str).apply(lambda x: x.str.contains(srch, case=False)).any(axis=1)]
+                # Índice construido una vez por dataset (sobre el df sin filtrar)
+                index = get_search_index(st.session_state["dataset_key"], st.session_state["df_original"])
+                columns = None if scope == "Todas las columnas" else [scope]
+                disp_df = index.filter(df, srch, columns=columns, prefix=prefix)
             else:
                 disp_df = df
             page_size = st.selectbox("Registros por página", [10, 20, 50, 100], index=0)
             total_pages = (len(disp_df) // page_size) + (1 if len(disp_df) % page_size else 0)
             page = st.slider("Página", 1, max(1,total_pages), 1)
             st.dataframe(disp_df.iloc[(page-1)*page_size : page*page_size])
-            st.download_button(
-                "📥 Descargar datos filtrados",
-                data=disp_df.to_csv(index=False).encode("utf-8"),
-                file_name="datos_filtrados.csv",
-                mime="text/csv"
-            )
+            # El archivo se genera solo al pedirlo y se reutiliza mientras no cambien los filtros
+            export_state = (st.session_state.get("dataset_key"), current_filter_state(), srch, scope, prefix)
+            c_fmt, c_btn = st.columns([1, 1])
+            with c_fmt:
+                export_fmt = st.selectbox("Formato de descarga", list(EXPORT_FORMATS))
+            with c_btn:
+                if st.button("📦 Preparar descarga"):
+                    try:
+                        with st.spinner("Generando archivo..."):
+                            path = get_exporter().export(disp_df, export_fmt, export_state)
+                        st.session_state["export"] = (export_state, export_fmt, path)
+                    except Exception as e:
+                        st.error(f"No se pudo generar la descarga: {e}")
+            ready = st.session_state.get("export")
+            if ready and ready[:2] == (export_state, export_fmt) and os.path.exists(ready[2]):
+                fmt_info = EXPORT_FORMATS[export_fmt]
+                with open(ready[2], "rb") as fh:
+                    st.download_button(
+                        "📥 Descargar datos filtrados",
+                        data=fh,
+                        file_name=f"datos_filtrados.{fmt_info['ext']}",
+                        mime=fmt_info["mime"]
+                    )
 
         elif key == "Demografico":
             st.write("Análisis Demográfico")
-            st.plotly_chart(demographic_analysis(df), use_container_width=True)
+            st.plotly_chart(demographic_analysis(df, cube), use_container_width=True)
             if st.checkbox("Mapear columnas para análisis Demográfico"):
                 req = {
                     "Edad": "Columna para Edad:",
@@ -402,7 +675,7 @@ def display_analysis(df: pd.DataFrame):
 
         elif key == "Contratos":
             st.write("Análisis de Contratos")
-            st.plotly_chart(contract_analysis(df), use_container_width=True)
+            st.plotly_chart(contract_analysis(df, cube), use_container_width=True)
             if st.checkbox("Mapear columnas para análisis de Contratos"):
                 req = {
                     "ContractType": "Columna Tipo de Contrato:",
@@ -420,7 +693,21 @@ def display_analysis(df: pd.DataFrame):
 
         elif key == "Salarial":
             st.write("Análisis Salarial")
-            st.plotly_chart(salary_analysis(df), use_container_width=True)
+            sketch = salary_sketch_view(st.session_state.get("filter_params") or {})
+            edges_text = st.text_input("Tramos salariales (cortes separados por coma):",
+                                       ", ".join(f"{b:g}" for b in SALARY_BINS))
+            try:
+                bins = sorted(float(b) for b in edges_text.replace(" ", "").split(",") if b)
+            except ValueError:
+                st.warning("Cortes no válidos; se usan los tramos por defecto.")
+                bins = None
+            bins = bins if bins and len(bins) > 1 and bins != SALARY_BINS else None
+            st.plotly_chart(salary_analysis(df, cube, sketch, bins=bins), use_container_width=True)
+            by = st.radio("Percentiles por:", ["Department", "Período"], horizontal=True, key="salary_pct_by")
+            table, fig = salary_percentiles(df, sketch, by=by)
+            if table is not None:
+                st.dataframe(table, use_container_width=True)
+            st.plotly_chart(fig, use_container_width=True)
             if st.checkbox("Mapear columnas para análisis Salarial"):
                 req = {
                     "Department": "Columna Departamento:",
@@ -441,7 +728,7 @@ def display_analysis(df: pd.DataFrame):
         elif key == "Asistencia":
             st.write("Análisis de Asistencia")
             try:
-                st.plotly_chart(attendance_analysis(df), use_container_width=True)
+                st.plotly_chart(attendance_analysis(df, cube), use_container_width=True)
             except Exception as e:
                 st.error(f"Error: {e}")
             if st.checkbox("Mapear columnas para Asistencia"):
@@ -463,18 +750,29 @@ def display_analysis(df: pd.DataFrame):
 
         elif key == "LME":
             st.write("Análisis de Licencias Médicas (LME)")
+            params = st.session_state.get("filter_params") or {}
+            lme = get_lme_engine(st.session_state["dataset_key"], tuple(sorted(params.items())), df)
             lme_options = ["Total LME", "Grupo Diagnóstico", "Duración Promedio"]
             lme_sel = st.selectbox("Seleccione el subanálisis:", lme_options)
+            years = lme.years
+            pairs = consecutive_pairs(years)
+            if len(years) > 2 and st.checkbox("Comparar dos años específicos"):
+                c_base, c_target = st.columns(2)
+                with c_base:
+                    base_year = st.selectbox("Año base", years, index=len(years) - 2)
+                with c_target:
+                    target_year = st.selectbox("Año a comparar", years, index=len(years) - 1)
+                pairs = [(base_year, target_year)]
             if lme_sel == "Total LME":
-                pivot, fig = analyze_total_LME(df)
+                pivot, fig = analyze_total_LME(df, lme, pairs)
                 st.dataframe(pivot)
                 st.plotly_chart(fig, use_container_width=True)
             elif lme_sel == "Grupo Diagnóstico":
-                pivot, fig = analyze_grupo_diagnostico_LME(df)
+                pivot, fig = analyze_grupo_diagnostico_LME(df, lme, pairs)
                 st.dataframe(pivot)
                 st.plotly_chart(fig, use_container_width=True)
             elif lme_sel == "Duración Promedio":
-                dur, fig = analyze_duracion_LME(df)
+                dur, fig = analyze_duracion_LME(df, lme)
                 st.dataframe(dur)
                 st.plotly_chart(fig, use_container_width=True)
             st.info("Si tus columnas difieren, ajusta en analisis_hr.py o añade un mapeo similar.")
@@ -499,15 +797,49 @@ def display_analysis(df: pd.DataFrame):
                 p1 = st.selectbox("Período 1", periods)
             with cB:
                 p2 = st.selectbox("Período 2", periods)
+            matrix = AbsenteeismMatrix(agg_df)
             if st.button("Comparar"):
                 try:
-                    comp_df, comp_fig, comp_text = absenteeism_comparison(agg_df, p1, p2)
+                    comp_df, comp_fig, comp_text = absenteeism_comparison(agg_df, p1, p2, matrix)
                     st.dataframe(comp_df)
                     st.plotly_chart(comp_fig, use_container_width=True)
                     st.markdown(comp_text)
                 except Exception as e:
                     st.error(f"Error: {e}")
 
+            st.markdown("### Matriz de Variaciones")
+            cM, cT = st.columns(2)
+            with cM:
+                metric = st.selectbox("Métrica", list(AbsenteeismMatrix.METRICS),
+                                      format_func=AbsenteeismMatrix.METRICS.get)
+            with cT:
+                absence_type = st.selectbox("Tipo de ausencia", matrix.types, index=len(matrix.types) - 1)
+            heat = matrix.heatmap(metric, absence_type)
+            st.plotly_chart(px.imshow(heat, color_continuous_scale="RdBu_r", color_continuous_midpoint=0,
+                                      labels={"x": "Período comparado", "y": "Período base",
+                                              "color": AbsenteeismMatrix.METRICS[metric]},
+                                      aspect="auto"), use_container_width=True)
+            lag = st.radio("Variación respecto a", ["Período anterior", "Mismo mes del año anterior"],
+                           horizontal=True)
+            st.dataframe(matrix.changes("period" if lag == "Período anterior" else "year", metric))
+
+            st.markdown("### Pronóstico de Ausentismo")
+            # Un filtro de mes o año dejaría meses en 0 o muy poca historia: el modelo usa
+            # el dataset completo y los filtros solo recortan la historia graficada
+            forecaster = get_absence_forecaster(st.session_state["dataset_key"], st.session_state["df_original"])
+            st.caption("El modelo se entrena con todo el dataset; los filtros solo acotan la historia mostrada.")
+            cU, cH, cL = st.columns(3)
+            with cU:
+                unit = st.selectbox("Unidad", forecaster.units[::-1], key="forecast_unit")
+            with cH:
+                horizon = st.slider("Meses a pronosticar", 1, 12, 6, key="forecast_horizon")
+            with cL:
+                level = st.selectbox("Intervalo", [0.8, 0.9, 0.95], index=1, format_func="{:.0%}".format,
+                                     key="forecast_level")
+            forecast_df, forecast_fig = absenteeism_forecast(df, forecaster, horizon, level, unit)
+            st.plotly_chart(forecast_fig, use_container_width=True)
+            st.dataframe(forecast_df[forecast_df.iloc[:, 0] == unit])
+
         elif key == "Causales":
             st.write("Causales de Terminación")
             c_col = "causal de termino"
@@ -537,9 +869,13 @@ def display_analysis(df: pd.DataFrame):
                 "Dotación",
                 "Composición Ausencias",
                 "Empleados Activos (Corte)",
-                "Faltas por Cargo y Dpto"
+                "Faltas por Cargo y Dpto",
+                "Anomalías de Nómina"
             ]
             choice = st.selectbox("Seleccione análisis integrado:", integrated_options)
+            if choice in ("Antigüedad", "Dotación", "Empleados Activos (Corte)"):
+                conteo = st.radio("Conteo de Rut únicos", ["Exacto", "Aproximado (HyperLogLog)"], horizontal=True)
+                counter_args = (st.session_state["dataset_key"], current_filter_state(), conteo == "Exacto", df)
 
             if choice == "Horas Extras vs Sueldos":
                 st.write("Relación entre horas extra y sueldos.")
@@ -607,7 +943,7 @@ def display_analysis(df: pd.DataFrame):
                     else:
                         st.info("Complete el mapeo.")
                 else:
-                    antiguedad(df)
+                    antiguedad(df, get_distinct_counter(*counter_args))
 
             elif choice == "Dotación":
                 st.write("Distribución de empleados por Período y Gerencia.")
@@ -628,7 +964,7 @@ def display_analysis(df: pd.DataFrame):
                     else:
                         st.info("Complete el mapeo.")
                 else:
-                    dotacion(df)
+                    dotacion(df, get_distinct_counter(*counter_args))
 
             elif choice == "Composición Ausencias":
                 st.write("Días trabajados, faltas, licencias, vacaciones, etc.")
@@ -670,7 +1006,9 @@ def display_analysis(df: pd.DataFrame):
                     else:
                         st.info("Complete el mapeo.")
                 else:
-                    empleados_activos(df)
+                    empleados_activos(df, get_headcount_engine(st.session_state["dataset_key"],
+                                                               st.session_state["df_original"]),
+                                      get_distinct_counter(*counter_args))
 
             elif choice == "Faltas por Cargo y Dpto":
                 st.write("Visualiza faltas por cargo y gerencia.")
@@ -693,6 +1031,27 @@ def display_analysis(df: pd.DataFrame):
                 else:
                     faltas_por_cargo_y_departamento(df)
 
+            elif choice == "Anomalías de Nómina":
+                st.write("Horas extra y sueldos atípicos dentro de cada Gerencia, Cargo y Período.")
+                req = {
+                    "Rut": "Columna para Rut/ID empleado:",
+                    "Gerencia": "Columna para Gerencia/Departamento:",
+                    "Cargo": "Columna para Cargo/Puesto:",
+                    "Periodo": "Columna para Período (YYYYMM):",
+                    "HrsExt_Normales": "Columna para Horas Extras Normales:",
+                    "HrsExt_Dobles": "Columna para Horas Extras Dobles:",
+                    "HrsExt_215": "Columna para Horas Extras 2.15:",
+                    "SueldoBrutoDiasTrab": "Columna para Sueldo Bruto Días Trabajados:",
+                    "SueldoBrutoContractual": "Columna para Sueldo Bruto Contractual:"
+                }
+                if st.checkbox("Mapear columnas para 'Anomalías de Nómina'"):
+                    mp = dynamic_column_mapping(df, req, "anomalias_nomina")
+                    # Las columnas no mapeadas simplemente no se evalúan
+                    df2 = df.rename(columns={col_name: col_key for col_key, col_name in mp.items()})
+                    anomalias_nomina(df2)
+                else:
+                    anomalias_nomina(df)
+
         st.markdown('</div>', unsafe_allow_html=True)
 
     # (Opcional) Sección de insights si deseas para cada sección
@@ -719,21 +1078,33 @@ def run_dashboard():
 
     try:
         with st.spinner("Procesando datos..."):
-            df_loaded = cached_load_data(data_path)      # <─ lee desde la ruta
+            load_args = (data_path, selected_columns(), st.session_state.get("profile_load", False))
+            df_loaded, load_profile = cached_load_data(*load_args)  # <─ lee desde la ruta
+            if load_profile:
+                display_load_profile(load_profile)
             if df_loaded is None or df_loaded.empty:
                 st.error("No se pudo cargar el archivo o está vacío.")
                 return
 
+            unparsed = df_loaded.attrs.get("unparsed_dates")
+            if unparsed:
+                with st.sidebar.expander("⚠️ Fechas no reconocidas"):
+                    for col, values in unparsed.items():
+                        st.write(f"**{col}** ({len(values)}): {', '.join(map(str, values[:20]))}")
+
             st.session_state["df_original"] = df_loaded
-            df_filtered = setup_period_filters(df_loaded)
+            st.session_state["dataset_key"] = dataset_key(*load_args[:2])
+            engine = get_filter_engine(st.session_state["dataset_key"], df_loaded)
+            df_filtered = setup_period_filters(df_loaded, engine)
             st.session_state["df_filtered"] = df_filtered
+            cube_view = current_cube_view(df_loaded, engine)
 
         if df_filtered.empty:
             st.error("No hay datos para el período / estado seleccionado.")
             return
 
-        display_key_metrics(df_filtered)
-        display_analysis(df_filtered)
+        display_key_metrics(df_filtered, cube_view)
+        display_analysis(df_filtered, cube_view)
 
     except Exception as e:
         st.error(f"Error al procesar los datos: {e}")
@@ -0,0 +1,331 @@
+"""
+Riesgo de rotación por empleado-período.
+Las variables salen de las columnas estándar de load_hr_data (TenureMonths,
+AgeGroup, días de ausencia y licencias, ContractType y tramo de BaseSalary) y
+se puntúan con una regresión logística serializada en JSON. La puntuación
+recorre los archivos por bloques y reparte los bloques entre procesos, con un
+máximo de bloques en vuelo, de modo que la memoria depende de `chunksize` y
+`workers` y no del tamaño de los archivos. El resultado se escribe a Parquet
+bloque a bloque.
+
+Uso:
+    python attrition.py train -i historico.csv -m modelo_rotacion.json
+    python attrition.py score -i 2023/*.csv 2024/*.csv -m modelo_rotacion.json -o riesgo.parquet
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from analisis_hr import (ABSENCE_COLUMNS, AGE_BINS, AGE_LABELS, SALARY_BAND_LABELS, column_selector,
+                         iter_csv_chunks, load_hr_data, salary_bands)
+from filter_engine import active_mask
+from periods import period_codes, period_labels
+
+RISK_NUMERIC = ['TenureMonths'] + ABSENCE_COLUMNS
+RISK_CATEGORICAL = ['AgeGroup', 'ContractType', 'SalaryBand']
+# Columnas que se copian a la salida para identificar cada puntuación
+SCORE_ID_COLUMNS = ['NationalID', 'Período', 'Department']
+# Columnas a leer de los archivos (con sus sinónimos, ver column_selector)
+SCORE_SOURCE_COLUMNS = SCORE_ID_COLUMNS + RISK_NUMERIC + ['Age', 'AgeGroup', 'ContractType', 'BaseSalary']
+RISK_LEVELS = {'Bajo': 0.0, 'Medio': 0.3, 'Alto': 0.6}
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def risk_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Variables del modelo a partir de un DataFrame (o bloque) con columnas
+    estándar. AgeGroup y SalaryBand se derivan si faltan; las columnas
+    ausentes quedan vacías.
+    """
+    out = pd.DataFrame(index=df.index)
+    for col in RISK_NUMERIC:
+        out[col] = pd.to_numeric(df[col], errors='coerce') if col in df.columns else np.nan
+    if 'AgeGroup' in df.columns:
+        out['AgeGroup'] = df['AgeGroup']
+    elif 'Age' in df.columns:
+        out['AgeGroup'] = pd.cut(pd.to_numeric(df['Age'], errors='coerce'),
+                                 bins=AGE_BINS, labels=AGE_LABELS, right=False)
+    else:
+        out['AgeGroup'] = None
+    out['ContractType'] = df['ContractType'] if 'ContractType' in df.columns else None
+    out['SalaryBand'] = salary_bands(pd.to_numeric(df['BaseSalary'], errors='coerce')) \
+        if 'BaseSalary' in df.columns else None
+    return out
+
+
+class AttritionModel:
+    """
+    Regresión logística sobre las variables de risk_frame: numéricas
+    estandarizadas (faltantes = media) y categóricas en one-hot con el
+    vocabulario del entrenamiento (valores nuevos = todo cero).
+    """
+    def __init__(self, numeric, categories, mean, std, coef, intercept):
+        self.numeric = list(numeric)
+        self.categories = {col: list(levels) for col, levels in categories.items()}
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+
+    @property
+    def feature_names(self) -> list[str]:
+        return self.numeric + [f"{col}={level}" for col, levels in self.categories.items() for level in levels]
+
+    @staticmethod
+    def _design(features: pd.DataFrame, numeric, categories, mean, std) -> np.ndarray:
+        width = len(numeric) + sum(len(levels) for levels in categories.values())
+        X = np.zeros((len(features), width), dtype=np.float32)
+        values = features[numeric].to_numpy(dtype=np.float64)
+        X[:, :len(numeric)] = np.nan_to_num((values - mean) / std)
+        offset = len(numeric)
+        rows = np.arange(len(features))
+        for col, levels in categories.items():
+            labels = features[col].astype(object).map(str, na_action='ignore')
+            codes = pd.Categorical(labels, categories=levels).codes
+            known = codes >= 0
+            X[rows[known], offset + codes[known]] = 1.0
+            offset += len(levels)
+        return X
+
+    def design(self, features: pd.DataFrame) -> np.ndarray:
+        return self._design(features, self.numeric, self.categories, self.mean, self.std)
+
+    def predict_proba(self, features: pd.DataFrame) -> np.ndarray:
+        """Probabilidad de rotación de cada fila, en lote."""
+        z = self.design(features) @ self.coef.astype(np.float32) + self.intercept
+        return 1.0 / (1.0 + np.exp(-z.astype(np.float64)))
+
+    @classmethod
+    def fit(cls, features: pd.DataFrame, target: np.ndarray, ridge: float = 1.0,
+            max_iter: int = 25, tol: float = 1e-6) -> "AttritionModel":
+        """Ajuste por Newton (IRLS) con penalización L2 sobre los coeficientes."""
+        numeric = [c for c in RISK_NUMERIC if features[c].notna().any()]
+        categories = {}
+        for col in RISK_CATEGORICAL:
+            levels = features[col].dropna().astype(object).map(str).unique().tolist()
+            if col == 'SalaryBand':
+                levels = [b for b in SALARY_BAND_LABELS if b in levels]
+            elif col == 'AgeGroup':
+                levels = [a for a in AGE_LABELS if a in levels]
+            else:
+                levels = sorted(levels)
+            if levels:
+                categories[col] = levels
+        values = features[numeric].to_numpy(dtype=np.float64)
+        mean = np.nanmean(values, axis=0) if numeric else np.zeros(0)
+        std = np.nanstd(values, axis=0) if numeric else np.zeros(0)
+        std = np.where(std > 0, std, 1.0)
+
+        X = cls._design(features, numeric, categories, mean, std).astype(np.float64)
+        X = np.column_stack([np.ones(len(X)), X])
+        y = np.asarray(target, dtype=np.float64)
+        penalty = ridge * np.eye(X.shape[1])
+        penalty[0, 0] = 0.0  # sin penalización del intercepto
+        w = np.zeros(X.shape[1])
+        for _ in range(max_iter):
+            p = 1.0 / (1.0 + np.exp(-(X @ w)))
+            gradient = X.T @ (p - y) + penalty @ w
+            hessian = (X * (p * (1 - p))[:, None]).T @ X + penalty
+            step = np.linalg.solve(hessian, gradient)
+            w -= step
+            if np.abs(step).max() < tol:
+                break
+        return cls(numeric, categories, mean, std, w[1:], w[0])
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'numeric': self.numeric,
+                'categories': self.categories,
+                'mean': self.mean.tolist(),
+                'std': self.std.tolist(),
+                'coef': self.coef.tolist(),
+                'intercept': self.intercept,
+            }, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "AttritionModel":
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['numeric'], data['categories'], data['mean'], data['std'],
+                   data['coef'], data['intercept'])
+
+
+def attrition_target(df: pd.DataFrame) -> np.ndarray:
+    """1 si el empleado ya no está activo (ver filter_engine.active_mask)."""
+    active = active_mask(df)
+    if active is None:
+        raise ValueError("Se requiere 'Status' o 'causal de termino' para entrenar el modelo")
+    return (~active).astype(np.int8)
+
+
+def risk_level(proba: np.ndarray) -> pd.Categorical:
+    """Nivel de riesgo (Bajo / Medio / Alto) según los umbrales de RISK_LEVELS."""
+    thresholds = np.array(list(RISK_LEVELS.values())[1:])
+    return pd.Categorical.from_codes(np.searchsorted(thresholds, proba, side='right'),
+                                     categories=list(RISK_LEVELS))
+
+
+def score_frame(model: AttritionModel, df: pd.DataFrame, source: str | None = None) -> pd.DataFrame:
+    """Puntuación de un bloque: columnas de SCORE_ID_COLUMNS, 'RiesgoRotacion' y 'NivelRiesgo'."""
+    proba = model.predict_proba(risk_frame(df))
+    out = pd.DataFrame({col: df[col].astype(object).astype(str).where(df[col].notna(), None)
+                        if col in df.columns else None for col in SCORE_ID_COLUMNS}, index=df.index)
+    if 'Período' in df.columns:
+        # 202403.0 (columna float con vacíos) -> '202403'
+        out['Período'] = period_labels(period_codes(df))
+    out['RiesgoRotacion'] = proba.astype(np.float32)
+    out['NivelRiesgo'] = risk_level(proba).astype(str)
+    if source is not None:
+        out['Archivo'] = source
+    return out.reset_index(drop=True)
+
+
+def iter_input_chunks(path: str, chunksize: int):
+    """
+    Bloques de columnas estándar de un archivo: CSV y Parquet se leen por
+    bloques; Excel no admite lectura parcial y se carga completo con load_hr_data.
+    """
+    usecols = column_selector(SCORE_SOURCE_COLUMNS)
+    if path.endswith('.csv'):
+        yield from iter_csv_chunks(path, chunksize, usecols=usecols)
+    elif path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        names = [c for c in parquet.schema_arrow.names if usecols(c)]
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=names):
+            yield batch.to_pandas()
+    else:
+        df = load_hr_data(path, columns=SCORE_SOURCE_COLUMNS)
+        if df is None:
+            return
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+
+# Modelo de cada proceso trabajador (se carga una vez en el inicializador)
+_worker_model = None
+
+
+def _init_worker(model_path: str):
+    global _worker_model
+    _worker_model = AttritionModel.load(model_path)
+
+
+def _score_chunk(chunk: pd.DataFrame, source: str) -> pd.DataFrame:
+    return score_frame(_worker_model, chunk, source)
+
+
+def _output_schema():
+    import pyarrow as pa
+    fields = [pa.field(col, pa.string()) for col in SCORE_ID_COLUMNS]
+    fields += [pa.field('RiesgoRotacion', pa.float32()), pa.field('NivelRiesgo', pa.string()),
+               pa.field('Archivo', pa.string())]
+    return pa.schema(fields)
+
+
+def source_labels(paths) -> dict:
+    """
+    Nombre de cada archivo para la columna 'Archivo': su ruta relativa a la
+    carpeta común de todos, así 2023/enero.csv y 2024/enero.csv no se confunden.
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    return {p: os.path.relpath(os.path.abspath(p), root).replace(os.sep, '/') for p in paths}
+
+
+def score_files(paths, model_path: str, output: str, chunksize: int = DEFAULT_CHUNKSIZE,
+                workers: int = 1) -> int:
+    """
+    Puntúa todos los archivos de `paths` y escribe un único Parquet en `output`.
+    Con workers > 1 los bloques se puntúan en procesos; como máximo hay
+    2 × workers bloques en vuelo, así la memoria queda acotada por
+    chunksize × workers. Retorna la cantidad de filas escritas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _output_schema()
+    rows = 0
+    with pq.ParquetWriter(output, schema) as writer:
+        def write(scored):
+            nonlocal rows
+            writer.write_table(pa.Table.from_pandas(scored, schema=schema, preserve_index=False))
+            rows += len(scored)
+
+        sources = source_labels(paths)
+        chunks = ((chunk, sources[path]) for path in paths
+                  for chunk in iter_input_chunks(path, chunksize))
+        if workers <= 1:
+            model = AttritionModel.load(model_path)
+            for chunk, source in chunks:
+                write(score_frame(model, chunk, source))
+            return rows
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path,)) as pool:
+            pending = []
+            for chunk, source in chunks:
+                pending.append(pool.submit(_score_chunk, chunk, source))
+                if len(pending) >= 2 * workers:
+                    # Se escribe en orden de entrada: el más antiguo primero
+                    write(pending.pop(0).result())
+            for future in pending:
+                write(future.result())
+    return rows
+
+
+def train_model(paths, model_path: str, ridge: float = 1.0) -> AttritionModel:
+    """Entrena con los archivos de `paths` (cargados con load_hr_data) y guarda el modelo."""
+    features, targets = [], []
+    columns = SCORE_SOURCE_COLUMNS + ['Status', 'causal de termino']
+    for path in paths:
+        df = load_hr_data(path, columns=columns)
+        if df is None:
+            continue
+        features.append(risk_frame(df).reset_index(drop=True))
+        targets.append(attrition_target(df))
+    if not features:
+        raise ValueError("No se pudo cargar ningún archivo de entrenamiento")
+    features = pd.concat([f.astype({c: object for c in RISK_CATEGORICAL}) for f in features],
+                         ignore_index=True)
+    model = AttritionModel.fit(features, np.concatenate(targets), ridge=ridge)
+    model.save(model_path)
+    return model
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Riesgo de rotación por empleado-período")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="Entrena y serializa el modelo")
+    train.add_argument("--input", "-i", nargs="+", required=True,
+                       help="Archivos históricos (CSV, Excel o Parquet) con Status o causal de termino")
+    train.add_argument("--model", "-m", required=True, help="Ruta del modelo JSON a escribir")
+    train.add_argument("--ridge", type=float, default=1.0, help="Penalización L2")
+
+    score = commands.add_parser("score", help="Puntúa archivos por bloques y escribe Parquet")
+    score.add_argument("--input", "-i", nargs="+", required=True, help="Archivos a puntuar (CSV, Excel o Parquet)")
+    score.add_argument("--model", "-m", required=True, help="Modelo JSON entrenado con 'train'")
+    score.add_argument("--output", "-o", required=True, help="Archivo Parquet de salida")
+    score.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                       help="Filas por bloque (la memoria crece con chunksize × workers)")
+    score.add_argument("--workers", "-w", type=int, default=1, help="Procesos de puntuación")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.command == "train":
+        model = train_model(args.input, args.model, ridge=args.ridge)
+        print(f"Modelo guardado en '{args.model}' ({len(model.feature_names)} variables)")
+        for name, weight in sorted(zip(model.feature_names, model.coef), key=lambda x: -abs(x[1]))[:10]:
+            print(f"{name:<30}{weight:>10.3f}")
+    else:
+        rows = score_files(args.input, args.model, args.output, chunksize=args.chunksize, workers=args.workers)
+        seconds = time.perf_counter() - t0
+        print(f"{rows} filas puntuadas en {seconds:.1f} s -> '{args.output}'")
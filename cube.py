@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+from analisis_hr import salary_bands
+from periods import period_codes as build_period_codes, period_filter_mask
+from sketches import hash_values, hll_estimate, hll_registers
+
+# Dimensiones de baja cardinalidad: el cubo queda con muchas menos celdas que filas.
+# JobRole (cientos de cargos) y el tramo salarial multiplicarían las celdas hasta ~1 por fila.
+CUBE_DIMENSIONS = ['Período', 'Department', 'ContractType', 'Gender', 'AgeGroup']
+# Cubo chico para la pestaña salarial; 'SalaryBand' se deriva de BaseSalary
+SALARY_CUBE_DIMENSIONS = ['Período', 'Department', 'SalaryBand']
+CUBE_MEASURES = ['BaseSalary', 'Salary', 'TenureYears', 'Age', 'DaysWorked', 'AbsenceDays', 'VacationDays',
+                 'RegularLeaveDays', 'MaternityLeaveDays', 'SickLeaveDays', 'PermissionDays']
+CUBE_HLL_PRECISION = 8  # 256 registros por celda (~6.5% de error estándar)
+
+
+def cube_dimensions(columns, dimensions=CUBE_DIMENSIONS) -> list:
+    """Dimensiones de `dimensions` disponibles en `columns` ('SalaryBand' basta con BaseSalary)."""
+    columns = set(columns)
+    return [d for d in dimensions
+            if d in columns or (d == 'SalaryBand' and 'BaseSalary' in columns)]
+
+
+class HRCube:
+    """
+    Cubo de agregados construido una vez por dataset sobre `dimensions`
+    (por defecto CUBE_DIMENSIONS) más el estado activo, si se conoce. Cada celda
+    guarda el conteo de filas, la suma y el conteo no nulo de cada medida y, si
+    hay `id_column`, un sketch HyperLogLog de los empleados distintos. Las
+    consultas filtran y agregan celdas, así su costo depende del número de
+    grupos y no del número de filas.
+    """
+    def __init__(self, df: pd.DataFrame, period_codes: np.ndarray | None = None,
+                 active: np.ndarray | None = None, dimensions=CUBE_DIMENSIONS,
+                 id_column: str = 'NationalID', p: int = CUBE_HLL_PRECISION):
+        keys = {}
+        if 'Período' in dimensions:
+            codes = period_codes if period_codes is not None else build_period_codes(df)
+            if codes is not None:
+                keys['Período'] = codes
+        for dim in cube_dimensions(df.columns, dimensions):
+            if dim == 'SalaryBand' and dim not in df.columns:
+                keys[dim] = salary_bands(df['BaseSalary']).array
+            elif dim != 'Período':
+                keys[dim] = df[dim].array
+        if active is not None:
+            keys['Activo'] = active
+        self.dimensions = list(keys)
+        self.measures = [m for m in CUBE_MEASURES
+                         if m in df.columns and pd.api.types.is_numeric_dtype(df[m])]
+
+        frame = pd.DataFrame(keys)
+        for m in self.measures:
+            frame[m] = df[m].to_numpy()
+        frame['_row'] = 1
+
+        if self.dimensions:
+            grouped = frame.groupby(self.dimensions, observed=True, dropna=False, sort=False)
+            cell_ids = grouped.ngroup().to_numpy()
+        else:
+            grouped = frame.groupby(np.zeros(len(frame), dtype=np.int64), sort=False)
+            cell_ids = np.zeros(len(frame), dtype=np.int64)
+        agg = {'count': ('_row', 'size')}
+        for m in self.measures:
+            agg[f'{m}_sum'] = (m, 'sum')
+            agg[f'{m}_n'] = (m, 'count')
+        cells = grouped.agg(**agg)
+        self.cells = cells.reset_index() if self.dimensions else cells.reset_index(drop=True)
+        # Las categorías (p.ej. AgeGroup) conservan su orden al consultar
+        for dim in self.dimensions:
+            if isinstance(keys[dim].dtype, pd.CategoricalDtype):
+                self.cells[dim] = self.cells[dim].astype(keys[dim].dtype)
+
+        self.registers = None
+        if id_column and id_column in df.columns:
+            ids = df[id_column].to_numpy()
+            known = pd.notna(ids)
+            self.registers = hll_registers(hash_values(ids[known]), cell_ids[known], len(self.cells), p)
+
+    def view(self, params: dict | None = None) -> "CubeView | None":
+        """
+        Subconjunto de celdas según los filtros resueltos por FilterEngine.resolve.
+        Retorna None si los filtros no se pueden responder desde el cubo
+        (columna de estado personalizada, o estado sin dimensión 'Activo').
+        """
+        mask = np.ones(len(self.cells), dtype=bool)
+        if params:
+            if params.get("custom_column"):
+                return None
+            if params.get("state") and 'Activo' not in self.dimensions:
+                return None
+            if any(params.get(k) is not None for k in ("year", "month", "period_from", "period_to")) \
+                    and 'Período' not in self.dimensions:
+                return None
+            if 'Período' in self.dimensions:
+                mask &= period_filter_mask(self.cells['Período'].to_numpy(), params)
+            if params.get("state"):
+                active = self.cells['Activo'].to_numpy(dtype=bool)
+                mask &= active if params["state"] == "Activos" else ~active
+        return CubeView(self, mask)
+
+
+class CubeView:
+    """Celdas seleccionadas de un HRCube, con consultas de roll-up."""
+    def __init__(self, cube: HRCube, mask: np.ndarray):
+        self.cube = cube
+        self.mask = mask
+        self.cells = cube.cells[mask]
+
+    def has(self, *columns) -> bool:
+        """True si todas las columnas son dimensiones o medidas del cubo."""
+        return all(c in self.cube.dimensions or c in self.cube.measures for c in columns)
+
+    def _finish(self, out: pd.DataFrame) -> pd.DataFrame:
+        for m in self.cube.measures:
+            out[f'{m}_mean'] = out[f'{m}_sum'] / out[f'{m}_n'].replace(0, np.nan)
+        return out
+
+    def rollup(self, by=()) -> pd.DataFrame:
+        """
+        Agrega las celdas por las dimensiones `by` (vacío = total). Devuelve
+        count, <medida>_sum, <medida>_n, <medida>_mean y, si hay identificador,
+        'distinct' (empleados distintos estimados con HyperLogLog).
+        """
+        by = list(by)
+        value_cols = ['count'] + [c for m in self.cube.measures for c in (f'{m}_sum', f'{m}_n')]
+        if not by:
+            out = self.cells[value_cols].sum().to_frame().T
+            out['count'] = out['count'].astype(np.int64)
+            group_of_cell, n_groups = np.zeros(len(self.cells), dtype=np.int64), 1
+        else:
+            grouped = self.cells.groupby(by, observed=True, dropna=False, sort=True)
+            out = grouped[value_cols].sum().reset_index()
+            group_of_cell, n_groups = grouped.ngroup().to_numpy(), len(out)
+        if self.cube.registers is not None:
+            # Unir sketches (máximo por registro) de las celdas de cada grupo
+            merged = np.zeros((n_groups, self.cube.registers.shape[1]), dtype=np.uint8)
+            np.maximum.at(merged, group_of_cell, self.cube.registers[self.mask])
+            out['distinct'] = np.rint(hll_estimate(merged)).astype(np.int64)
+        return self._finish(out)
+
+    def total_count(self) -> int:
+        return int(self.cells['count'].sum())
+
+    def counts(self, dim: str) -> pd.Series:
+        """Conteo de filas por valor de `dim`, de mayor a menor (como value_counts)."""
+        out = self.cells.groupby(dim, observed=True)['count'].sum()
+        return out[out > 0].sort_values(ascending=False)
+
+    def mean(self, measure: str) -> float | None:
+        n = self.cells[f'{measure}_n'].sum()
+        return self.cells[f'{measure}_sum'].sum() / n if n else None
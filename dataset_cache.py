@@ -0,0 +1,275 @@
+import os
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import pandas as pd
+
+# Memo de huellas ya calculadas: (ruta, tamaño, mtime) -> sha256, acotado (LRU)
+FINGERPRINT_MEMO_SIZE = 256
+_FINGERPRINTS: OrderedDict = OrderedDict()
+_FINGERPRINTS_LOCK = threading.Lock()
+
+
+def file_fingerprint(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Huella de contenido (sha256) de un archivo local. Se memoriza por
+    (ruta, tamaño, mtime) para no volver a leer el archivo en cada rerun;
+    el memo guarda las FINGERPRINT_MEMO_SIZE huellas más recientes.
+    """
+    st_ = os.stat(path)
+    memo_key = (os.path.abspath(path), st_.st_size, st_.st_mtime_ns)
+    with _FINGERPRINTS_LOCK:
+        digest = _FINGERPRINTS.get(memo_key)
+        if digest is not None:
+            _FINGERPRINTS.move_to_end(memo_key)
+            return digest
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _FINGERPRINTS_LOCK:
+        _FINGERPRINTS[memo_key] = digest
+        while len(_FINGERPRINTS) > FINGERPRINT_MEMO_SIZE:
+            _FINGERPRINTS.popitem(last=False)
+    return digest
+
+
+def to_arrow_ipc(df: pd.DataFrame, compression: str | None = None):
+    """Serializa un DataFrame a un buffer Arrow IPC (stream), opcionalmente comprimido."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_arrow_ipc(buf) -> pd.DataFrame:
+    """Reconstruye el DataFrame desde un buffer Arrow IPC."""
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(buf).read_all().to_pandas()
+
+
+class DatasetCache:
+    """
+    Caché en memoria de DataFrames por huella de contenido.
+    Los datos se guardan como Arrow IPC (no pickle, comprimido si se indica
+    `compression`, p.ej. "zstd"), el total se limita a `max_bytes` desalojando
+    la entrada menos usada, y cada `get` devuelve un DataFrame nuevo, así los
+    análisis que agregan columnas no alteran la caché. SharedDatasetStore la
+    usa como segundo nivel para los datasets que desaloja.
+    """
+    def __init__(self, max_bytes: int = 1024 * 1024 * 1024, compression: str | None = None):
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self._entries: OrderedDict = OrderedDict()  # key -> (payload, nbytes, attrs, extra)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Devuelve (df, extra) o None si la key no está en caché."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        payload, _, attrs, extra = entry
+        if isinstance(payload, pd.DataFrame):
+            df = payload.copy()
+        else:
+            df = from_arrow_ipc(payload)
+        df.attrs.update(attrs)
+        return df, extra
+
+    def put(self, key, df: pd.DataFrame, extra=None):
+        try:
+            payload = to_arrow_ipc(df, self.compression)
+            nbytes = payload.size
+        except Exception as e:
+            # p.ej. columnas object con tipos mezclados: se guarda una copia en memoria
+            print(f"[WARN DatasetCache] No se pudo serializar a Arrow, se guarda el DataFrame: {e}")
+            payload = df.copy()
+            nbytes = int(payload.memory_usage(deep=True).sum())
+
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (payload, nbytes, dict(df.attrs), extra)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, old_bytes, _, _) = self._entries.popitem(last=False)
+                self._bytes -= old_bytes
+                self.evictions += 1
+
+    def pop(self, key):
+        """Quita `key` de la caché (si está) sin contarlo como acierto ni fallo."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def get_or_load(self, key, loader):
+        """
+        Devuelve (df, extra) desde la caché o ejecuta `loader()`, que debe
+        retornar (df, extra). Los resultados None o vacíos no se guardan.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        df, extra = loader()
+        if df is not None and not df.empty:
+            self.put(key, df, extra)
+        return df, extra
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else None,
+            }
+
+
+def _covers(loaded, columns) -> bool:
+    """True si un DataFrame cargado con `loaded` columnas (None = todas) incluye `columns`."""
+    return loaded is None or (columns is not None and columns <= loaded)
+
+
+class SharedDatasetStore:
+    """
+    Almacén de DataFrames compartido por todas las sesiones del proceso:
+    mantiene un único DataFrame por huella, con la unión de las columnas que
+    piden las pestañas, y entrega a cada sesión una vista superficial
+    proyectada a sus columnas (sin copiar datos). Cada vista cuenta como referencia y se
+    libera sola cuando el recolector la descarta (weakref.finalize). Con
+    copy-on-write de pandas activo, las sesiones que modifican su vista no
+    alteran el DataFrame compartido.
+    Si se supera `max_bytes` se desalojan los datasets sin referencias, del
+    menos usado al más reciente. Con `spill` (un DatasetCache) los desalojados
+    pasan a ese nivel serializado en Arrow IPC y se recuperan de ahí sin
+    volver a leer el archivo.
+    """
+    def __init__(self, max_bytes: int = 2 * 1024 * 1024 * 1024, spill: DatasetCache | None = None):
+        self.max_bytes = max_bytes
+        self.spill = spill
+        self._entries: OrderedDict = OrderedDict()  # key -> dict(df, extra, columns, nbytes, refs)
+        self._bytes = 0
+        # RLock: los finalizadores de vistas pueden ejecutarse dentro de una sección protegida
+        self._lock = threading.RLock()
+        self._loading: dict = {}  # key -> Lock, evita cargar el mismo dataset en paralelo
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, key, loader, columns=None, project=None):
+        """
+        Devuelve (vista, extra) del dataset `key` con las columnas `columns`
+        (None = todas). Se guarda un solo DataFrame por `key` con la unión de las
+        columnas pedidas hasta ahora: si no cubre `columns` se vuelve a cargar
+        con la unión y reemplaza al anterior. `loader(columnas)` debe retornar
+        (df, extra); `project(columnas_del_df, columns)` elige las columnas de la
+        vista (sin `project` la vista trae todas). Los resultados None o vacíos
+        no se guardan.
+        """
+        columns = frozenset(columns) if columns is not None else None
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and _covers(entry["columns"], columns):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._view(entry, columns, project), entry["extra"]
+            loaded = entry["columns"] if entry is not None else columns
+            spilled = self.spill.get(key) if self.spill is not None and entry is None else None
+            if spilled is not None:
+                # Vuelve a memoria: el nivel serializado no guarda una segunda copia
+                self.spill.pop(key)
+                df, (extra, loaded) = spilled
+            if spilled is None or not _covers(loaded, columns):
+                union = None if loaded is None or columns is None else loaded | columns
+                df, extra = loader(union)
+                loaded = union
+            if df is None or df.empty:
+                return df, extra
+            nbytes = int(df.memory_usage(deep=True).sum())
+            new = {"df": df, "extra": extra, "columns": loaded, "nbytes": nbytes, "refs": 0}
+            with self._lock:
+                self.misses += 1
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    # Las vistas del DataFrame anterior lo mantienen vivo hasta liberarse
+                    self._bytes -= old["nbytes"]
+                self._entries[key] = new
+                self._bytes += nbytes
+            return self._view(new, columns, project), extra
+
+    def _view(self, entry, columns=None, project=None):
+        view = entry["df"].copy(deep=False)
+        if columns is not None and project is not None:
+            view = view[project(view.columns, columns)]
+        with self._lock:
+            entry["refs"] += 1
+        weakref.finalize(view, self._release, entry)
+        self._evict()
+        return view
+
+    def _release(self, entry):
+        with self._lock:
+            entry["refs"] -= 1
+        self._evict()
+
+    def _evict(self):
+        evicted = []
+        with self._lock:
+            for key in list(self._entries):
+                if self._bytes <= self.max_bytes:
+                    break
+                entry = self._entries[key]
+                if entry["refs"] > 0:
+                    continue
+                del self._entries[key]
+                self._loading.pop(key, None)
+                self._bytes -= entry["nbytes"]
+                self.evictions += 1
+                evicted.append((key, entry))
+        # La serialización ocurre fuera del lock
+        if self.spill is not None:
+            for key, entry in evicted:
+                self.spill.put(key, entry["df"], (entry["extra"], entry["columns"]))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "datasets": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "references": sum(e["refs"] for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "spill": self.spill.stats() if self.spill is not None else None,
+            }
@@ -0,0 +1,135 @@
+import os
+import hashlib
+import tempfile
+import threading
+import pandas as pd
+
+EXPORT_FORMATS = {
+    "CSV": {"ext": "csv", "mime": "text/csv"},
+    "Parquet": {"ext": "parquet", "mime": "application/vnd.apache.parquet"},
+    "Excel": {"ext": "xlsx", "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+}
+
+EXCEL_MAX_ROWS = 1_048_575  # filas de datos (la primera es el encabezado)
+
+
+def write_csv(df: pd.DataFrame, fh, chunk_rows: int):
+    """Escribe el CSV en bloques de `chunk_rows` filas (UTF-8)."""
+    fh.write(df.iloc[:0].to_csv(index=False).encode("utf-8"))
+    for start in range(0, len(df), chunk_rows):
+        fh.write(df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8"))
+
+
+def write_parquet(df: pd.DataFrame, fh, chunk_rows: int):
+    """Escribe el Parquet con un row group por bloque."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(fh, schema) as writer:
+        for start in range(0, max(len(df), 1), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_xlsx(df: pd.DataFrame, fh, chunk_rows: int):
+    """
+    Escribe el Excel por bloques. Con xlsxwriter se usa el modo constant_memory;
+    si no está instalado, openpyxl en modo write_only. En ambos casos las filas
+    se van volcando a disco en vez de armar el libro completo en memoria.
+    """
+    if len(df) > EXCEL_MAX_ROWS:
+        raise ValueError(f"Excel admite hasta {EXCEL_MAX_ROWS:,} filas; use CSV o Parquet.")
+    try:
+        import xlsxwriter  # noqa: F401
+    except ImportError:
+        _write_xlsx_openpyxl(df, fh, chunk_rows)
+        return
+    writer = pd.ExcelWriter(fh, engine="xlsxwriter", engine_kwargs={"options": {"constant_memory": True}})
+    with writer:
+        df.iloc[:0].to_excel(writer, index=False, sheet_name="Datos")
+        for start in range(0, len(df), chunk_rows):
+            df.iloc[start:start + chunk_rows].to_excel(
+                writer, index=False, header=False, sheet_name="Datos", startrow=start + 1
+            )
+
+
+def _write_xlsx_openpyxl(df: pd.DataFrame, fh, chunk_rows: int):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Datos")
+    ws.append([str(c) for c in df.columns])
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].astype(object)
+        # Celdas vacías para NaN/NaT; openpyxl no acepta esos valores
+        chunk = chunk.where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(fh)
+
+
+WRITERS = {"CSV": write_csv, "Parquet": write_parquet, "Excel": write_xlsx}
+
+
+class DataExporter:
+    """
+    Genera archivos de descarga solo cuando se piden, escribiéndolos a disco por
+    bloques en vez de armar el archivo completo en memoria. Los artefactos se
+    guardan en `export_dir` indexados por (dataset, estado de filtros, formato),
+    así una misma descarga se reutiliza entre reruns y sesiones; el directorio
+    se mantiene bajo `max_bytes` borrando los menos usados.
+    """
+    def __init__(self, export_dir: str | None = None, max_bytes: int = 1024 * 1024 * 1024,
+                 chunk_rows: int = 50_000):
+        self.export_dir = export_dir or os.path.join(tempfile.gettempdir(), "hr_exports")
+        self.max_bytes = max_bytes
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+
+    def artifact_path(self, state, fmt: str) -> str:
+        digest = hashlib.sha256(repr((state, fmt)).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.export_dir, f"{digest}.{EXPORT_FORMATS[fmt]['ext']}")
+
+    def export(self, df: pd.DataFrame, fmt: str, state) -> str:
+        """
+        Devuelve la ruta del archivo para `state` (cualquier valor con repr estable
+        que identifique dataset y filtros), generándolo si no existe.
+        """
+        path = self.artifact_path(state, fmt)
+        if os.path.exists(path):
+            os.utime(path, None)
+            return path
+
+        os.makedirs(self.export_dir, exist_ok=True)
+        # Archivo temporal único: dos sesiones pueden generar la misma descarga a la vez
+        fd, tmp_path = tempfile.mkstemp(dir=self.export_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                WRITERS[fmt](df, fh, self.chunk_rows)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str | None = None):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.export_dir):
+                path = os.path.join(self.export_dir, name)
+                if os.path.isfile(path) and not name.endswith(".part"):
+                    st_ = os.stat(path)
+                    entries.append((st_.st_mtime, st_.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError as e:
+                    print(f"[WARN exporter] No se pudo eliminar {path}: {e}")
@@ -0,0 +1,184 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from periods import PeriodAxis, period_codes, period_labels
+
+
+def normalize_codes(series: pd.Series):
+    """
+    Factoriza una columna y normaliza (minúsculas, sin espacios extremos) solo
+    sus valores distintos. Retorna (códigos por fila, valores normalizados).
+    """
+    codes, uniques = pd.factorize(series)
+    normalized = pd.Index(uniques).astype(str).str.lower().str.strip()
+    return codes, normalized
+
+
+def active_mask(df: pd.DataFrame):
+    """
+    Estado activo por fila: Status == 'Active' o, si no existe, 'causal de
+    termino' igual a 'sin definir'. None si no hay ninguna de las dos columnas.
+    """
+    if 'Status' in df.columns:
+        return (df['Status'] == 'Active').to_numpy()
+    if 'causal de termino' in df.columns:
+        codes, normalized = normalize_codes(df['causal de termino'])
+        return np.isin(codes, np.flatnonzero(normalized == 'sin definir'))
+    return None
+
+
+class FilterEngine:
+    """
+    Motor de filtros construido una vez por dataset. Precalcula el período como
+    entero YYYYMM (año, mes y un PeriodAxis ordenado para rangos) y el estado
+    activo/no activo, y compone los filtros como máscaras booleanas cacheadas. El DataFrame solo se
+    recorta una vez, al aplicar la máscara final; sin filtros se devuelve tal cual.
+    """
+    def __init__(self, df: pd.DataFrame, max_masks: int = 32):
+        self.period_source = None
+        self.period_codes = None
+        self.period_labels = None
+        self.axis = None
+        self._period_is_text = False
+        self._build_period(df)
+        if self.period_codes is not None:
+            self.years = self.period_codes // 100
+            self.months = self.period_codes % 100
+            self.axis = PeriodAxis(self.period_codes)
+        self.active = self._build_active(df)
+        self._custom: dict[str, tuple] = {}
+        self._masks: OrderedDict = OrderedDict()
+        self.max_masks = max_masks
+        # El motor se comparte entre sesiones (st.cache_resource): las cachés se protegen
+        self._lock = threading.Lock()
+
+    # ───── Precálculo ────────────────────────────────────────────────────────────
+    def _build_period(self, df: pd.DataFrame):
+        codes = period_codes(df)
+        if codes is None:
+            return
+        if 'Período' in df.columns:
+            self.period_source = 'Período'
+            self._period_is_text = pd.api.types.is_object_dtype(df['Período']) or \
+                pd.api.types.is_string_dtype(df['Período'])
+        else:
+            self.period_source = 'ContractStartDate'
+        self.period_codes = codes
+        if not self._period_is_text:
+            # Etiquetas 'YYYYMM' como texto, para las funciones que esperan strings
+            self.period_labels = period_labels(codes)
+
+    @staticmethod
+    def _build_active(df: pd.DataFrame):
+        return active_mask(df)
+
+    @property
+    def needs_period_column(self) -> bool:
+        """True si 'Período' no existe como texto y debe agregarse al filtrar."""
+        return self.period_source is not None and not self._period_is_text
+
+    def available_years(self) -> list[str]:
+        return [f"{y:04d}" for y in np.unique(self.axis.periods // 100)]
+
+    def available_months(self) -> list[str]:
+        return [f"{m:02d}" for m in np.unique(self.axis.periods % 100)]
+
+    def available_periods(self) -> list[int]:
+        return [int(p) for p in self.axis.periods]
+
+    # ───── Máscaras ──────────────────────────────────────────────────────────────
+    def _cached(self, key, build):
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        # Se construye fuera del lock; si otra sesión la construyó antes, se usa la suya
+        mask = build()
+        with self._lock:
+            mask = self._masks.setdefault(key, mask)
+            self._masks.move_to_end(key)
+            while len(self._masks) > self.max_masks:
+                self._masks.popitem(last=False)
+        return mask
+
+    def custom_active_mask(self, df: pd.DataFrame, column: str, active_value: str):
+        """Filas cuyo valor normalizado en `column` coincide con `active_value`."""
+        with self._lock:
+            cached = self._custom.get(column)
+        if cached is None:
+            cached = normalize_codes(df[column])
+            with self._lock:
+                cached = self._custom.setdefault(column, cached)
+        codes, normalized = cached
+        target = str(active_value).lower().strip()
+        return np.isin(codes, np.flatnonzero(normalized == target))
+
+    def resolve(self, year="Todos", month="Todos", state="Todos",
+                custom_column=None, custom_active_value=None,
+                period_from=None, period_to=None, window_months=None):
+        """
+        Normaliza la selección de filtros. `period_from`/`period_to` (YYYYMM)
+        definen un rango y `window_months` una ventana móvil que termina en
+        `period_to` (o en el último período). Retorna un dict con los filtros
+        efectivos, o None si ninguno filtra (el DataFrame se usa completo).
+        """
+        use_custom = bool(custom_column) and custom_active_value is not None
+        target = str(custom_active_value).lower().strip() if use_custom else None
+        if self.period_codes is None or self.axis.first is None:
+            year = month = "Todos"
+            period_from = period_to = window_months = None
+        if window_months:
+            win_from, period_to = self.axis.window(window_months, period_to)
+            period_from = max(period_from or win_from, win_from)
+        # Un rango que cubre todos los períodos no filtra nada
+        if period_from is not None and period_from <= self.axis.first:
+            period_from = None
+        if period_to is not None and period_to >= self.axis.last:
+            period_to = None
+        if state not in ("Activos", "No Activos") or (not use_custom and self.active is None):
+            state = "Todos"
+        if (year == "Todos" and month == "Todos" and state == "Todos"
+                and period_from is None and period_to is None):
+            return None
+        return {
+            "year": None if year == "Todos" else int(year),
+            "month": None if month == "Todos" else int(month),
+            "period_from": period_from,
+            "period_to": period_to,
+            "state": None if state == "Todos" else state,
+            "custom_column": custom_column if use_custom else None,
+            "custom_target": target,
+        }
+
+    def mask(self, df: pd.DataFrame, params: dict | None):
+        """Máscara booleana (cacheada) de los filtros resueltos por `resolve`."""
+        if params is None:
+            return None
+
+        def build():
+            parts = []
+            if params["period_from"] is not None or params["period_to"] is not None:
+                parts.append(self.axis.range_mask(params["period_from"], params["period_to"]))
+            if params["year"] is not None:
+                parts.append(self.years == params["year"])
+            if params["month"] is not None:
+                parts.append(self.months == params["month"])
+            if params["state"] is not None:
+                if params["custom_column"]:
+                    active = self.custom_active_mask(df, params["custom_column"], params["custom_target"])
+                else:
+                    active = self.active
+                parts.append(active if params["state"] == "Activos" else ~active)
+            return np.logical_and.reduce(parts)
+
+        return self._cached(tuple(sorted(params.items())), build)
+
+    def apply(self, df: pd.DataFrame, mask) -> pd.DataFrame:
+        """Recorta el DataFrame con la máscara y agrega 'Período' si hace falta."""
+        out = df if mask is None else df[mask]
+        if self.needs_period_column:
+            labels = self.period_labels if mask is None else self.period_labels[mask]
+            out = out.assign(**{'Período': labels})
+        return out
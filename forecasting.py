@@ -0,0 +1,149 @@
+"""
+Pronóstico de ausentismo por unidad (p.ej. Department).
+Las ausencias se agregan una vez a una matriz unidades × meses (meses sin
+registros = 0) y las variables (rezagos, rezago estacional, tendencia y
+estacionalidad mensual) se construyen por desplazamiento de esa matriz para
+todas las unidades a la vez. Cada unidad tiene su propia regresión ridge,
+resuelta en lote con numpy; el pronóstico es recursivo y sus intervalos
+crecen con el horizonte.
+"""
+import numpy as np
+import pandas as pd
+from periods import period_codes
+
+FORECAST_LAGS = (1, 2, 3)
+SEASONAL_LAG = 12
+# Meses mínimos de entrenamiento (después de los rezagos) para ajustar y estimar
+# sigma; además deben superar la cantidad de variables para que quede residuo
+MIN_TRAIN_MONTHS = 4
+N_SHARED_FEATURES = 4  # intercepto, tendencia, seno y coseno del mes
+TOTAL_UNIT = "Total"
+# Cuantiles normales de los intervalos bilaterales
+INTERVAL_Z = {0.8: 1.2816, 0.9: 1.6449, 0.95: 1.9600}
+
+
+def absence_panel(df: pd.DataFrame, columns, by: str | None = 'Department'):
+    """
+    Suma de `columns` por unidad `by` y mes, como matriz densa sobre el rango
+    continuo de meses. Retorna (unidades, períodos YYYYMM, matriz). Se agrega
+    siempre la unidad TOTAL_UNIT con la suma de todas las filas.
+    """
+    codes = period_codes(df)
+    columns = [c for c in columns if c in df.columns]
+    if codes is None or not columns:
+        return [], np.empty(0, dtype=np.int64), np.empty((0, 0))
+    valid = codes > 0
+    if not valid.any():
+        return [], np.empty(0, dtype=np.int64), np.empty((0, 0))
+    months = (codes // 100) * 12 + codes % 100 - 1
+    first, last = months[valid].min(), months[valid].max()
+    span = int(last - first + 1)
+    values = df[columns].apply(pd.to_numeric, errors='coerce').fillna(0).sum(axis=1).to_numpy(dtype=float)
+
+    total = np.bincount(months[valid] - first, weights=values[valid], minlength=span)
+    units, panel = [], np.empty((0, span))
+    if by and by in df.columns:
+        unit_codes, uniques = pd.factorize(df[by])
+        valid &= unit_codes >= 0
+        units = list(uniques)
+        cell = unit_codes[valid] * span + (months[valid] - first)
+        panel = np.bincount(cell, weights=values[valid], minlength=len(units) * span).reshape(len(units), span)
+    idx = first + np.arange(span)
+    return units + [TOTAL_UNIT], (idx // 12) * 100 + idx % 12 + 1, np.vstack([panel, total])
+
+
+class AbsenceForecaster:
+    """
+    Modelos de pronóstico de ausentismo entrenados una vez por dataset. `fit`
+    ocurre en el constructor; `forecast` solo evalúa los coeficientes, así
+    que puede llamarse en cada rerun sin reentrenar. Con pocos meses de
+    historia se omiten el rezago estacional y, si hace falta, los rezagos; con
+    menos de MIN_TRAIN_MONTHS meses de entrenamiento no se ajusta y `forecast`
+    retorna una tabla vacía.
+    """
+    def __init__(self, df: pd.DataFrame, columns, by: str | None = 'Department', ridge: float = 1.0):
+        self.by = by if by and by in df.columns else None
+        self.units, self.periods, panel = absence_panel(df, columns, self.by)
+        n_months = len(self.periods)
+        self.lags = [l for l in FORECAST_LAGS if n_months >= 4 * l + 4]
+        if n_months >= 2 * SEASONAL_LAG + 6:
+            self.lags.append(SEASONAL_LAG)
+        # Cada unidad se escala por su nivel medio para que un mismo ridge sirva a todas
+        self.scale = np.maximum(panel.mean(axis=1), 1.0) if panel.size else np.ones(0)
+        self.history = panel / self.scale[:, None] if panel.size else panel
+        self.coef = None
+        self.sigma = None
+        train = n_months - max(self.lags, default=0)
+        if train >= max(MIN_TRAIN_MONTHS, N_SHARED_FEATURES + len(self.lags) + 1):
+            self._fit(ridge)
+
+    # ───── Variables ─────────────────────────────────────────────────────────────
+    def _month_index(self, t: np.ndarray) -> np.ndarray:
+        start = (self.periods[0] // 100) * 12 + self.periods[0] % 100 - 1
+        return start + t
+
+    def _design(self, series: np.ndarray, t: np.ndarray) -> np.ndarray:
+        """Variables en las posiciones `t` para todas las unidades: (unidades, len(t), k)."""
+        n_units = series.shape[0]
+        month = self._month_index(t) % 12
+        angle = 2 * np.pi * month / 12
+        shared = np.column_stack([np.ones(len(t)), t / max(len(self.periods), 1),
+                                  np.sin(angle), np.cos(angle)])
+        features = [np.broadcast_to(shared, (n_units,) + shared.shape)]
+        if self.lags:
+            features.append(np.stack([series[:, t - l] for l in self.lags], axis=2))
+        return np.concatenate(features, axis=2)
+
+    def _fit(self, ridge: float):
+        first = max(self.lags, default=0)
+        t = np.arange(first, len(self.periods))
+        X = self._design(self.history, t)
+        y = self.history[:, t]
+        k = X.shape[2]
+        penalty = ridge * np.eye(k)
+        penalty[0, 0] = 0.0  # sin penalización del intercepto
+        A = np.einsum('utk,utj->ukj', X, X) + penalty
+        b = np.einsum('utk,ut->uk', X, y)
+        self.coef = np.linalg.solve(A, b[..., None])[..., 0]
+        residuals = y - np.einsum('utk,uk->ut', X, self.coef)
+        dof = max(len(t) - k, 1)
+        self.sigma = np.sqrt((residuals ** 2).sum(axis=1) / dof)
+
+    # ───── Consultas ─────────────────────────────────────────────────────────────
+    def history_frame(self) -> pd.DataFrame:
+        """Serie observada en formato largo: unidad, 'Período' y 'TotalAusentismo'."""
+        values = self.history * self.scale[:, None]
+        return pd.DataFrame({
+            self.by or 'Unidad': np.repeat(self.units, len(self.periods)),
+            'Período': np.tile(self.periods, len(self.units)),
+            'TotalAusentismo': values.ravel(),
+        })
+
+    def forecast(self, horizon: int = 6, level: float = 0.9) -> pd.DataFrame:
+        """
+        Pronóstico de los próximos `horizon` meses para todas las unidades, con
+        intervalo de nivel `level` (0.8, 0.9 o 0.95). Formato largo: unidad,
+        'Período', 'Pronóstico', 'Inferior' y 'Superior' (no negativos).
+        """
+        columns = [self.by or 'Unidad', 'Período', 'Pronóstico', 'Inferior', 'Superior']
+        if self.coef is None or horizon < 1:
+            return pd.DataFrame(columns=columns)
+        if level not in INTERVAL_Z:
+            raise ValueError(f"Nivel {level} no soportado (use {', '.join(map(str, INTERVAL_Z))})")
+        n_months = len(self.periods)
+        series = np.concatenate([self.history, np.zeros((len(self.units), horizon))], axis=1)
+        for h in range(horizon):
+            t = np.array([n_months + h])
+            series[:, n_months + h] = np.einsum('utk,uk->u', self._design(series, t), self.coef)
+        point = series[:, n_months:]
+        # Error acumulado del pronóstico recursivo: crece con la raíz del horizonte
+        width = INTERVAL_Z[level] * self.sigma[:, None] * np.sqrt(np.arange(1, horizon + 1))
+        scale = self.scale[:, None]
+        idx = self._month_index(np.arange(n_months, n_months + horizon))
+        return pd.DataFrame({
+            columns[0]: np.repeat(self.units, horizon),
+            'Período': np.tile((idx // 12) * 100 + idx % 12 + 1, len(self.units)),
+            'Pronóstico': (np.maximum(point, 0) * scale).ravel(),
+            'Inferior': (np.maximum(point - width, 0) * scale).ravel(),
+            'Superior': (np.maximum(point + width, 0) * scale).ravel(),
+        })
@@ -4,10 +4,58 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 import pandas as pd
+from headcount import FREQUENCIES
+from sketches import DistinctCounter
+
+# Columnas de días que suma composicion_ausencias
+AUSENCIAS_COLUMNS = ["DiasTrabajados", "DiasFalta", "DiasLicenciaNormales", "DiasLicenciaMaternales",
+                     "DiasVacaciones"]
+
+# Columnas que necesita cada análisis integrado (ver analisis_hr.columns_for_analyses)
+INTEGRATED_COLUMNS = {
+    "horas_extras_vs_sueldos": ["Periodo", "HrsExt_Normales", "HrsExt_Dobles", "HrsExt_215", "SueldoBrutoDiasTrab"],
+    "faltas_vs_sueldo": ["Periodo", "DiasFalta", "SueldoBrutoContractual", "SueldoBrutoDiasTrab"],
+    "antiguedad": ["AntiguedadMes", "Rut"],
+    "dotacion": ["Rut", "Periodo", "Gerencia"],
+    "composicion_ausencias": ["Periodo"] + AUSENCIAS_COLUMNS,
+    "empleados_activos": ["FechaTerminoContrato", "Rut", "Periodo", "ContractStartDate", "ContractEndDate",
+                          "NationalID"],
+    "faltas_por_cargo_y_departamento": ["Cargo", "Gerencia", "DiasFalta"],
+    "anomalias_nomina": ["Rut", "Gerencia", "Cargo", "Periodo", "HrsExt_Normales", "HrsExt_Dobles", "HrsExt_215",
+                         "SueldoBrutoDiasTrab", "SueldoBrutoContractual"],
+}
+
+# Niveles de comparación de detectar_anomalias_nomina, del más fino al más grueso:
+# cada valor se compara con el primer nivel cuyo grupo tenga al menos `min_grupo` valores
+ANOMALIAS_NIVELES = [["Gerencia", "Cargo", "Periodo"], ["Gerencia", "Periodo"], ["Periodo"]]
+HORAS_EXTRA = ["HrsExt_Normales", "HrsExt_Dobles", "HrsExt_215"]
+# 0.6745 = cuantil 0.75 de la normal: hace comparable la z robusta con una z clásica
+MAD_ESCALA = 0.6745
+
+ANTIGUEDAD_BINS = [0, 1, 3, 5, 10, 20, 50]
+ANTIGUEDAD_LABELS = ["0-1", "1-3", "3-5", "5-10", "10-20", "20+"]
+
+def rango_antiguedad(antiguedad_mes: pd.Series) -> pd.Series:
+    return pd.cut(antiguedad_mes, bins=ANTIGUEDAD_BINS, labels=ANTIGUEDAD_LABELS, right=False)
+
+def distinct_rut_counter(df: pd.DataFrame, exact: bool = True) -> DistinctCounter | None:
+    """
+    Conteo de Rut únicos por Periodo × Gerencia × rango de antigüedad × activo
+    (las dimensiones cuyas columnas existan), para dotacion, antiguedad y
+    empleados_activos. Retorna None si no hay columna 'Rut'.
+    """
+    if "Rut" not in df.columns:
+        return None
+    dims = {col: df[col] for col in ("Periodo", "Gerencia") if col in df.columns}
+    if "AntiguedadMes" in df.columns:
+        dims["RangoAntiguedad"] = rango_antiguedad(df["AntiguedadMes"])
+    if "FechaTerminoContrato" in df.columns:
+        dims["Activo"] = df["FechaTerminoContrato"].isna()
+    return DistinctCounter(df["Rut"], dims, exact=exact)
 
 def horas_extras_vs_sueldos(df: pd.DataFrame):
     st.header("Análisis: Horas Extras vs. Sueldos")
-    required_cols = ["Periodo", "HrsExt_Normales", "HrsExt_Dobles", "HrsExt_215", "SueldoBrutoDiasTrab"]
+    required_cols = INTEGRATED_COLUMNS["horas_extras_vs_sueldos"]
     if not all(col in df.columns for col in required_cols):
         st.warning(f"Faltan columnas: {set(required_cols) - set(df.columns)}")
         return
@@ -42,7 +90,7 @@ def horas_extras_vs_sueldos(df: pd.DataFrame):
 
 def faltas_vs_sueldo(df: pd.DataFrame):
     st.header("Análisis: Faltas vs. Sueldo")
-    required_cols = ["Periodo", "DiasFalta", "SueldoBrutoContractual", "SueldoBrutoDiasTrab"]
+    required_cols = INTEGRATED_COLUMNS["faltas_vs_sueldo"]
     if not all(col in df.columns for col in required_cols):
         st.warning(f"Faltan columnas: {set(required_cols) - set(df.columns)}")
         return
@@ -83,7 +131,7 @@ def faltas_vs_sueldo(df: pd.DataFrame):
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def antiguedad(df: pd.DataFrame):
+def antiguedad(df: pd.DataFrame, counter: DistinctCounter | None = None):
     st.header("Análisis: Antigüedad de Empleados")
     if "AntiguedadMes" not in df.columns:
         st.warning("No se encontró la columna 'AntiguedadMes'.")
@@ -92,10 +140,17 @@ def antiguedad(df: pd.DataFrame):
         st.warning("No se encontró la columna 'Rut'.")
         return
 
-    bins = [0, 1, 3, 5, 10, 20, 50]
-    labels = ["0-1", "1-3", "3-5", "5-10", "10-20", "20+"]
-    df["RangoAntiguedad"] = pd.cut(df["AntiguedadMes"], bins=bins, labels=labels, right=False)
-    count_antiguedad = df.groupby("RangoAntiguedad")["Rut"].nunique().reset_index(name="NumEmpleados")
+    if counter is not None and "RangoAntiguedad" in counter.dimensions:
+        count_antiguedad = (
+            counter.count(["RangoAntiguedad"])
+            .set_index("RangoAntiguedad")["distinct"]
+            .reindex(ANTIGUEDAD_LABELS, fill_value=0)
+            .rename_axis("RangoAntiguedad")
+            .reset_index(name="NumEmpleados")
+        )
+    else:
+        df["RangoAntiguedad"] = rango_antiguedad(df["AntiguedadMes"])
+        count_antiguedad = df.groupby("RangoAntiguedad")["Rut"].nunique().reset_index(name="NumEmpleados")
 
     st.write("Distribución de empleados por rango de antigüedad")
     st.dataframe(count_antiguedad)
@@ -108,23 +163,29 @@ def antiguedad(df: pd.DataFrame):
     )
     st.plotly_chart(fig_pie, use_container_width=True)
 
-def dotacion(df: pd.DataFrame):
+def dotacion(df: pd.DataFrame, counter: DistinctCounter | None = None):
     st.header("Análisis: Dotación")
-    needed_cols = ["Rut", "Periodo", "Gerencia"]
+    needed_cols = INTEGRATED_COLUMNS["dotacion"]
     missing = [col for col in needed_cols if col not in df.columns]
     if missing:
         st.warning(f"Faltan columnas para este análisis de dotación: {missing}")
         return
 
-    dotacion_total = df["Rut"].nunique()
+    if counter is not None and {"Periodo", "Gerencia"} <= set(counter.dimensions):
+        dotacion_total = counter.total()
+        dotacion_por_periodo_depto = (
+            counter.count(["Periodo", "Gerencia"])
+            .rename(columns={"distinct": "NumEmpleados"})
+        )
+    else:
+        dotacion_total = df["Rut"].nunique()
+        dotacion_por_periodo_depto = (
+            df.groupby(["Periodo", "Gerencia"])["Rut"]
+            .nunique()
+            .reset_index(name="NumEmpleados")
+        )
     st.write(f"**Dotación total:** {dotacion_total} empleados únicos.")
 
-    dotacion_por_periodo_depto = (
-        df.groupby(["Periodo", "Gerencia"])["Rut"]
-        .nunique()
-        .reset_index(name="NumEmpleados")
-    )
-
     st.subheader("Distribución de empleados por Período y Departamento")
     st.dataframe(dotacion_por_periodo_depto)
 
@@ -141,14 +202,7 @@ def dotacion(df: pd.DataFrame):
 
 def composicion_ausencias(df: pd.DataFrame):
     st.header("Análisis: Composición de Ausencias")
-    ausencias_cols = [
-        "DiasTrabajados",
-        "DiasFalta",
-        "DiasLicenciaNormales",
-        "DiasLicenciaMaternales",
-        "DiasVacaciones"
-    ]
-    ausencias_cols = [col for col in ausencias_cols if col in df.columns]
+    ausencias_cols = [col for col in AUSENCIAS_COLUMNS if col in df.columns]
 
     if len(ausencias_cols) > 1 and "Periodo" in df.columns:
         comp_ausencias = df.groupby("Periodo")[ausencias_cols].sum().reset_index()
@@ -173,8 +227,17 @@ def composicion_ausencias(df: pd.DataFrame):
     else:
         st.warning("No se encontraron las columnas de ausencias requeridas o la columna 'Periodo'.")
 
-def empleados_activos(df: pd.DataFrame):
+def empleados_activos(df: pd.DataFrame, engine=None, counter: DistinctCounter | None = None):
+    """
+    Con `engine` (un HeadcountEngine construido desde las fechas de contrato) la
+    dotación, ingresos y egresos salen de las fechas de inicio y término; sin él
+    se cuentan los Rut sin FechaTerminoContrato en cada Periodo (desde `counter`,
+    si se entrega).
+    """
     st.header("Análisis: Empleados Activos (Corte)")
+    if engine is not None and engine.contracts:
+        _empleados_activos_por_fechas(engine)
+        return
     if "FechaTerminoContrato" not in df.columns:
         st.warning("La columna 'FechaTerminoContrato' no está presente en el DataFrame.")
         return
@@ -182,12 +245,18 @@ def empleados_activos(df: pd.DataFrame):
         st.warning("Falta la columna 'Rut' o 'Periodo' para este análisis.")
         return
 
-    df_activos = df[df["FechaTerminoContrato"].isna()]
-    activos_por_periodo = (
-        df_activos.groupby("Periodo")["Rut"]
-        .nunique()
-        .reset_index(name="NumEmpleadosActivos")
-    )
+    if counter is not None and {"Periodo", "Activo"} <= set(counter.dimensions):
+        activos_por_periodo = (
+            counter.count(["Periodo"], where={"Activo": True})
+            .rename(columns={"distinct": "NumEmpleadosActivos"})
+        )
+    else:
+        df_activos = df[df["FechaTerminoContrato"].isna()]
+        activos_por_periodo = (
+            df_activos.groupby("Periodo")["Rut"]
+            .nunique()
+            .reset_index(name="NumEmpleadosActivos")
+        )
 
     st.write("Empleados activos por Período")
     st.dataframe(activos_por_periodo)
@@ -201,9 +270,39 @@ def empleados_activos(df: pd.DataFrame):
     )
     st.plotly_chart(fig_line_activos, use_container_width=True)
 
+def _empleados_activos_por_fechas(engine):
+    c_from, c_to, c_freq = st.columns(3)
+    with c_from:
+        start = st.date_input("Desde", value=engine.first_date, key="dotacion_desde")
+    with c_to:
+        end = st.date_input("Hasta", value=engine.last_date, key="dotacion_hasta")
+    with c_freq:
+        freq = st.selectbox("Frecuencia", list(FREQUENCIES), index=1, format_func=FREQUENCIES.get,
+                            key="dotacion_frecuencia")
+    if start > end:
+        st.warning("La fecha 'Desde' debe ser anterior a 'Hasta'.")
+        return
+
+    serie = engine.series(start, end, freq=freq)
+    st.write(f"**Dotación al {end:%d-%m-%Y}:** {int(engine.active_on(end)[0])} contratos activos.")
+    st.dataframe(serie)
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=serie["Fecha"], y=serie["Dotación"], mode="lines", name="Dotación"))
+    fig.add_trace(go.Bar(x=serie["Fecha"], y=serie["Ingresos"], name="Ingresos", yaxis="y2"))
+    fig.add_trace(go.Bar(x=serie["Fecha"], y=-serie["Egresos"], name="Egresos", yaxis="y2"))
+    fig.update_layout(
+        title="Dotación, Ingresos y Egresos",
+        xaxis_title="Fecha" if freq == "D" else "Período",
+        yaxis=dict(title="Dotación"),
+        yaxis2=dict(title="Ingresos / Egresos", overlaying="y", side="right"),
+        barmode="relative"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
 def faltas_por_cargo_y_departamento(df: pd.DataFrame):
     st.header("Análisis: Faltas por Cargo y Departamento")
-    needed_cols = ["Cargo", "Gerencia", "DiasFalta"]
+    needed_cols = INTEGRATED_COLUMNS["faltas_por_cargo_y_departamento"]
     missing_cols = [col for col in needed_cols if col not in df.columns]
     if missing_cols:
         st.warning(f"Faltan columnas para este análisis: {missing_cols}")
@@ -227,4 +326,119 @@ def faltas_por_cargo_y_departamento(df: pd.DataFrame):
         title="Faltas (Días) por Cargo y Departamento",
         labels={"DiasFalta": "Total Días de Falta"}
     )
-    st.plotly_chart(fig_faltas, use_container_width=True)
\ No newline at end of file
+    st.plotly_chart(fig_faltas, use_container_width=True)
+
+def detectar_anomalias_nomina(df: pd.DataFrame, umbral: float = 3.5, min_grupo: int = 5,
+                              tope_ratio_sueldo: float = 1.05) -> pd.DataFrame:
+    """
+    Excepciones de nómina por fila. Para cada hora extra (HrsExt_*), su total
+    por millón de sueldo contractual y la razón SueldoBrutoDiasTrab /
+    SueldoBrutoContractual se calcula la z robusta 0.6745·(x - mediana) / MAD
+    dentro del grupo Gerencia × Cargo × Periodo (o del siguiente nivel de
+    ANOMALIAS_NIVELES si el grupo tiene menos de `min_grupo` valores; si
+    ningún nivel alcanza, la métrica no se evalúa). Si el MAD es 0 se usa la
+    desviación absoluta media. Además, un sueldo por días trabajados mayor a
+    `tope_ratio_sueldo` veces el contractual se marca siempre.
+    Las horas extra en 0 no se evalúan y solo se marca el lado alto (z >= umbral).
+    Retorna una fila por excepción, ordenada de mayor a menor z.
+    """
+    metricas = pd.DataFrame(index=df.index)
+    for col in HORAS_EXTRA:
+        if col in df.columns:
+            metricas[col] = pd.to_numeric(df[col], errors="coerce")
+    horas = [c for c in HORAS_EXTRA if c in metricas]
+    contractual = pd.to_numeric(df["SueldoBrutoContractual"], errors="coerce") \
+        if "SueldoBrutoContractual" in df.columns else None
+    contractual = contractual.where(contractual > 0) if contractual is not None else None
+    if horas and contractual is not None:
+        metricas["HrsExtPorMillonSueldo"] = metricas[horas].sum(axis=1, min_count=1) / contractual * 1e6
+    # Las horas extra son mayoritariamente 0: se comparan solo entre quienes tienen horas
+    metricas = metricas.where(metricas > 0)
+    if "SueldoBrutoDiasTrab" in df.columns and contractual is not None:
+        metricas["RatioSueldoDiasTrab"] = pd.to_numeric(df["SueldoBrutoDiasTrab"], errors="coerce") / contractual
+    columnas = ["Rut", "Gerencia", "Cargo", "Periodo", "Métrica", "Valor", "Mediana", "ZRobusta", "Grupo", "Motivo"]
+    niveles = [[c for c in nivel if c in df.columns] for nivel in ANOMALIAS_NIVELES]
+    niveles = [nivel for nivel in niveles if nivel]
+    if metricas.empty or not niveles:
+        return pd.DataFrame(columns=columnas)
+
+    values = metricas.to_numpy(dtype=np.float64)
+    z = np.full(values.shape, np.nan)
+    mediana = np.full(values.shape, np.nan)
+    grupo = np.full(values.shape, "", dtype=object)
+    pendiente = ~np.isnan(values)
+    for nivel in niveles:
+        if not pendiente.any():
+            break
+        # Conteo, mediana y MAD del nivel sobre todos los valores del grupo, no solo
+        # los pendientes: un grupo amplio incluye a los ya evaluados en niveles finos
+        g = df.groupby(nivel, observed=True, dropna=False, sort=False).ngroup().to_numpy()
+        grouped = metricas.groupby(g, sort=False)
+        n = grouped.transform("count").to_numpy()
+        med = grouped.transform("median").to_numpy(dtype=np.float64)
+        desv = pd.DataFrame(np.abs(values - med), index=metricas.index)
+        mad = desv.groupby(g, sort=False).transform("median").to_numpy()
+        media = desv.groupby(g, sort=False).transform("mean").to_numpy()
+        # MAD = 0 (valores mayoritariamente iguales): desviación media × 1.2533
+        escala = np.where(mad > 0, mad / MAD_ESCALA, media * 1.2533)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            nivel_z = np.where(escala > 0, (values - med) / escala, 0.0)
+        # Cada métrica usa el primer nivel donde su grupo tiene al menos min_grupo valores
+        usar = pendiente & (n >= min_grupo)
+        z[usar], mediana[usar], grupo[usar] = nivel_z[usar], med[usar], " × ".join(nivel)
+        pendiente &= ~usar
+
+    # Solo el lado alto: muchas horas extra o pago sobre lo habitual
+    marca = np.nan_to_num(z) >= umbral
+    motivo = np.where(marca, "Z robusta", "").astype(object)
+    if "RatioSueldoDiasTrab" in metricas:
+        k = metricas.columns.get_loc("RatioSueldoDiasTrab")
+        sobre = values[:, k] > tope_ratio_sueldo
+        motivo[:, k] = np.where(sobre, np.where(marca[:, k], "Z robusta y sobre contrato", "Sobre contrato"),
+                                motivo[:, k])
+        marca[:, k] |= sobre
+    filas, cols = np.nonzero(marca)
+    ids = {c: df[c].to_numpy()[filas] if c in df.columns else None for c in ("Rut", "Gerencia", "Cargo", "Periodo")}
+    out = pd.DataFrame({
+        **ids,
+        "Métrica": metricas.columns.to_numpy()[cols],
+        "Valor": values[filas, cols],
+        "Mediana": mediana[filas, cols],
+        "ZRobusta": z[filas, cols],
+        "Grupo": grupo[filas, cols],
+        "Motivo": motivo[filas, cols],
+    }, columns=columnas)
+    orden = np.argsort(-np.nan_to_num(out["ZRobusta"].to_numpy(dtype=np.float64)), kind="stable")
+    return out.iloc[orden].reset_index(drop=True)
+
+def anomalias_nomina(df: pd.DataFrame):
+    st.header("Análisis: Anomalías de Nómina")
+    required_cols = ["Periodo", "SueldoBrutoContractual"]
+    if not all(col in df.columns for col in required_cols) or \
+            not any(col in df.columns for col in HORAS_EXTRA + ["SueldoBrutoDiasTrab"]):
+        st.warning(f"Faltan columnas: se requieren {required_cols} y horas extra o SueldoBrutoDiasTrab")
+        return
+
+    c1, c2 = st.columns(2)
+    with c1:
+        umbral = st.slider("Umbral de z robusta", 2.0, 10.0, 3.5, 0.5)
+    with c2:
+        min_grupo = st.number_input("Mínimo de filas por grupo", 2, 100, 5)
+    excepciones = detectar_anomalias_nomina(df, umbral=umbral, min_grupo=int(min_grupo))
+    if excepciones.empty:
+        st.info("No se detectaron anomalías con los parámetros actuales.")
+        return
+
+    st.write(f"{len(excepciones)} excepciones en {excepciones['Rut'].nunique()} trabajadores" if "Rut" in df.columns
+             else f"{len(excepciones)} excepciones")
+    st.dataframe(excepciones)
+
+    resumen = excepciones.groupby(["Periodo", "Métrica"]).size().reset_index(name="Excepciones")
+    fig = px.bar(
+        resumen,
+        x="Periodo",
+        y="Excepciones",
+        color="Métrica",
+        title="Excepciones de Nómina por Período",
+    )
+    st.plotly_chart(fig, use_container_width=True)
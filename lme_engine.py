@@ -0,0 +1,121 @@
+"""
+Motor de análisis de Licencias Médicas Electrónicas (LME).
+Agrupa el extracto una sola vez por Año × Tipo de Licencia × Seguro ×
+Estado Resolución × Grupo Diagnostico, y todas las tablas (totales, por
+seguro, estado de resolución, grupo diagnóstico, duración) se obtienen
+sumando esas celdas. La variación porcentual se calcula para cualquier
+par de años, vectorizada sobre todos los pares a la vez.
+"""
+import numpy as np
+import pandas as pd
+from sketches import DistinctCounter
+
+LME_KEYS = ['Año', 'Tipo de Licencia', 'Seguro', 'Estado Resolución', 'Grupo Diagnostico']
+COMMON_ILLNESS = "Enfermedad o Accidente Común"
+REJECTED = "Rechazase"
+
+
+def consecutive_pairs(years) -> list[tuple]:
+    """[(2022, 2023), (2023, 2024), ...] para años ordenados."""
+    years = sorted(years)
+    return list(zip(years[:-1], years[1:]))
+
+
+def add_variation(pivot: pd.DataFrame, pairs=None) -> pd.DataFrame:
+    """
+    Agrega una columna 'Variación % A-B' por cada par (A, B) de columnas de año
+    del pivot (por defecto, cada año contra el anterior). Las columnas de año que
+    no existen en el pivot se omiten.
+    """
+    year_cols = [c for c in pivot.columns if c not in LME_KEYS and not str(c).startswith('Variación')]
+    pairs = consecutive_pairs(year_cols) if pairs is None else \
+        [(a, b) for a, b in pairs if a in pivot.columns and b in pivot.columns]
+    if not pairs:
+        return pivot
+    base = pivot[[a for a, _ in pairs]].to_numpy(dtype=float)
+    target = pivot[[b for _, b in pairs]].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variation = (target - base) / base * 100
+    names = [f"Variación % {a}-{b}" for a, b in pairs]
+    return pivot.assign(**dict(zip(names, variation.T)))
+
+
+class LMEEngine:
+    """
+    Agregados de un extracto LME calculados en una pasada. `cells` tiene una
+    fila por combinación de LME_KEYS presente con la suma de 'Cantidad' y la
+    suma/conteo de 'DiasAutorizados'; los trabajadores únicos por Seguro y Año
+    (licencias de enfermedad común) van en un DistinctCounter, exacto o
+    aproximado con HyperLogLog (exact=False).
+    """
+    def __init__(self, df: pd.DataFrame, exact: bool = True):
+        self.keys = [c for c in LME_KEYS if c in df.columns]
+        agg = {}
+        if 'Cantidad' in df.columns:
+            agg['Cantidad'] = ('Cantidad', 'sum')
+        if 'DiasAutorizados' in df.columns:
+            agg['DiasSum'] = ('DiasAutorizados', 'sum')
+            agg['DiasN'] = ('DiasAutorizados', 'count')
+        if self.keys and agg:
+            self.cells = df.groupby(self.keys, observed=True, dropna=False, sort=False).agg(**agg).reset_index()
+        else:
+            self.cells = pd.DataFrame(columns=self.keys + list(agg))
+
+        self.workers = None
+        if {'TrabajadorID', 'Tipo de Licencia', 'Seguro', 'Año'} <= set(df.columns):
+            common = df.loc[df['Tipo de Licencia'] == COMMON_ILLNESS, ['Seguro', 'Año', 'TrabajadorID']]
+            self.workers = DistinctCounter(common['TrabajadorID'], {'Seguro': common['Seguro'], 'Año': common['Año']},
+                                           exact=exact)
+
+    @property
+    def years(self) -> list:
+        return sorted(self.cells['Año'].dropna().unique().tolist()) if 'Año' in self.cells else []
+
+    def _sum(self, by, value='Cantidad', cells=None) -> pd.DataFrame:
+        cells = self.cells if cells is None else cells
+        return cells.groupby(by, observed=True, sort=True)[value].sum().reset_index()
+
+    @staticmethod
+    def _pivot(long: pd.DataFrame, index: str, value: str, pairs=None) -> pd.DataFrame:
+        pivot = long.pivot(index=index, columns='Año', values=value).reset_index()
+        pivot.columns.name = None
+        return add_variation(pivot, pairs)
+
+    def total(self, pairs=None):
+        """(pivot Tipo de Licencia × Año, datos largos) de LME emitidas."""
+        total = self._sum(['Año', 'Tipo de Licencia'])
+        return self._pivot(total, 'Tipo de Licencia', 'Cantidad', pairs), total
+
+    def por_seguro(self, pairs=None):
+        """LME de enfermedad o accidente común por Seguro y Año."""
+        common = self.cells[self.cells['Tipo de Licencia'] == COMMON_ILLNESS]
+        seguro = self._sum(['Seguro', 'Año'], cells=common)
+        return self._pivot(seguro, 'Seguro', 'Cantidad', pairs), seguro
+
+    def trabajadores(self, pairs=None):
+        """Trabajadores únicos con LME de enfermedad común por Seguro y Año (None si no hay ID)."""
+        if self.workers is None:
+            return None, None
+        unique = self.workers.count(['Seguro', 'Año']).rename(columns={'distinct': 'TrabajadorID'})
+        return self._pivot(unique, 'Seguro', 'TrabajadorID', pairs), unique
+
+    def estado_resolucion(self):
+        """(LME por Año × Estado × Seguro, tasa de rechazo por Año × Seguro)."""
+        estado = self._sum(['Año', 'Estado Resolución', 'Seguro'])
+        tasa = self._sum(['Año', 'Seguro']).rename(columns={'Cantidad': 'Total'})
+        rejected = self.cells[self.cells['Estado Resolución'] == REJECTED]
+        rechazados = self._sum(['Año', 'Seguro'], cells=rejected).rename(columns={'Cantidad': 'Rechazados'})
+        tasa = pd.merge(tasa, rechazados, on=['Año', 'Seguro'], how='left')
+        tasa['Rechazados'] = tasa['Rechazados'].fillna(0)
+        tasa['Tasa Rechazo (%)'] = (tasa['Rechazados'] / tasa['Total']) * 100
+        return estado, tasa
+
+    def grupo_diagnostico(self, pairs=None):
+        grupo = self._sum(['Año', 'Grupo Diagnostico'])
+        return self._pivot(grupo, 'Grupo Diagnostico', 'Cantidad', pairs), grupo
+
+    def duracion(self) -> pd.DataFrame:
+        """Promedio de DiasAutorizados por Año y Grupo Diagnostico."""
+        sums = self.cells.groupby(['Año', 'Grupo Diagnostico'], observed=True, sort=True)[['DiasSum', 'DiasN']].sum()
+        sums = sums[sums['DiasN'] > 0]
+        return (sums['DiasSum'] / sums['DiasN']).rename('DiasAutorizados').reset_index()
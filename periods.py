@@ -0,0 +1,133 @@
+"""
+Dimensión de período canónica: entero YYYYMM (p.ej. 202403).
+Centraliza la conversión desde 'Período' (texto o número) o desde una fecha,
+el formato en español y las consultas por rango sobre un eje ordenado.
+"""
+import numpy as np
+import pandas as pd
+
+MONTH_NAMES = {
+    "01": "Enero", "02": "Febrero", "03": "Marzo", "04": "Abril",
+    "05": "Mayo", "06": "Junio", "07": "Julio", "08": "Agosto",
+    "09": "Septiembre", "10": "Octubre", "11": "Noviembre", "12": "Diciembre"
+}
+
+
+def to_period_code(value) -> int:
+    """Convierte 'YYYYMM', 202403, Timestamp o pd.Period a entero YYYYMM (0 si no es válido)."""
+    if isinstance(value, (pd.Timestamp, pd.Period)):
+        return value.year * 100 + value.month
+    try:
+        code = int(str(value).strip()[:6])
+    except (TypeError, ValueError):
+        return 0
+    return code if 1 <= code % 100 <= 12 else 0
+
+
+def period_codes(df: pd.DataFrame, column: str = 'Período', date_column: str = 'ContractStartDate'):
+    """
+    Códigos YYYYMM por fila como array int64 (0 = sin período), a partir de
+    `column` o, si no existe, de `date_column`. Cada valor distinto se convierte
+    una sola vez. Retorna None si no hay ninguna de las dos columnas.
+    """
+    if column in df.columns:
+        codes, uniques = pd.factorize(df[column])
+        converted = np.array([to_period_code(v) for v in uniques], dtype=np.int64)
+    elif date_column in df.columns:
+        dates = df[date_column]
+        values = (dates.dt.year * 100 + dates.dt.month).fillna(0).astype(np.int64)
+        return values.to_numpy()
+    else:
+        return None
+    # El código -1 (valor nulo) apunta al 0 agregado al final
+    return np.append(converted, 0)[codes]
+
+
+def period_label(code: int) -> str:
+    """202403 -> '202403'"""
+    return f"{int(code):06d}"
+
+
+def period_labels(codes: np.ndarray) -> np.ndarray:
+    """Array de códigos YYYYMM -> array object de etiquetas 'YYYYMM' (None si es 0)."""
+    uniques, inverse = np.unique(codes, return_inverse=True)
+    labels = np.array([period_label(c) if c else None for c in uniques], dtype=object)
+    return labels[inverse]
+
+
+def format_period(value) -> str:
+    """'202403' o 202403 -> 'Marzo 2024'. Si no es un período válido lo devuelve como texto."""
+    code = to_period_code(value)
+    if not code:
+        return str(value)
+    label = period_label(code)
+    return f"{MONTH_NAMES[label[4:]]} {label[:4]}"
+
+
+def shift_period(code: int, months: int) -> int:
+    """Suma (o resta) meses a un período YYYYMM."""
+    idx = (code // 100) * 12 + (code % 100 - 1) + months
+    return (idx // 12) * 100 + idx % 12 + 1
+
+
+def period_filter_mask(codes: np.ndarray, params: dict | None) -> np.ndarray:
+    """
+    Máscara de año, mes y rango desde–hasta (claves de FilterEngine.resolve)
+    sobre un array de códigos YYYYMM, p.ej. las celdas de un cubo o sketch.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    mask = np.ones(len(codes), dtype=bool)
+    params = params or {}
+    if params.get("year") is not None:
+        mask &= codes // 100 == params["year"]
+    if params.get("month") is not None:
+        mask &= codes % 100 == params["month"]
+    if params.get("period_from") is not None or params.get("period_to") is not None:
+        mask &= codes > 0
+    if params.get("period_from") is not None:
+        mask &= codes >= params["period_from"]
+    if params.get("period_to") is not None:
+        mask &= codes <= params["period_to"]
+    return mask
+
+
+class PeriodAxis:
+    """
+    Eje de períodos ordenado sobre las filas de un dataset. Guarda el orden de
+    las filas por período, de modo que un rango desde–hasta o una ventana móvil
+    se resuelven con dos búsquedas binarias en lugar de comparar texto fila a fila.
+    """
+    def __init__(self, codes: np.ndarray):
+        self.codes = codes
+        self.order = np.argsort(codes, kind='stable')
+        self.sorted_codes = codes[self.order]
+        self.periods = np.unique(self.sorted_codes[self.sorted_codes > 0])
+
+    @property
+    def first(self) -> int | None:
+        return int(self.periods[0]) if len(self.periods) else None
+
+    @property
+    def last(self) -> int | None:
+        return int(self.periods[-1]) if len(self.periods) else None
+
+    def positions(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        """Posiciones de fila con start <= período <= end (extremos None = abiertos)."""
+        lo = np.searchsorted(self.sorted_codes, max(start or 1, 1), side='left')
+        hi = len(self.sorted_codes) if end is None else np.searchsorted(self.sorted_codes, end, side='right')
+        return self.order[lo:hi]
+
+    def range_mask(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        mask = np.zeros(len(self.codes), dtype=bool)
+        mask[self.positions(start, end)] = True
+        return mask
+
+    def window(self, months: int, end: int | None = None) -> tuple[int, int]:
+        """(inicio, fin) de una ventana móvil de `months` meses que termina en `end` (o el último período)."""
+        end = end or self.last
+        return shift_period(end, -(months - 1)), end
+
+    def periods_between(self, start: int | None = None, end: int | None = None) -> np.ndarray:
+        lo = np.searchsorted(self.periods, start, side='left') if start else 0
+        hi = np.searchsorted(self.periods, end, side='right') if end else len(self.periods)
+        return self.periods[lo:hi]
@@ -1,57 +1,297 @@
 import os
+import time
+import hashlib
+import tempfile
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import boto3
+from boto3.s3.transfer import TransferConfig
 import pandas as pd
 from botocore.config import Config
+from botocore.exceptions import ClientError
 
 class S3Manager:
     """
     Envuelve las operaciones básicas (subida, descarga, listado) y añade helpers
     para convertir los objetos directamente en DataFrame.
     """
-    def __init__(self, bucket_or_ap_arn: str, region: str = "us-east-1"):
+    def __init__(self, bucket_or_ap_arn: str, region: str = "us-east-1",
+                 cache_dir: str | None = None, cache_max_bytes: int = 512 * 1024 * 1024,
+                 listing_ttl: float = 30.0,
+                 multipart_threshold: int = 16 * 1024 * 1024,
+                 multipart_chunksize: int = 8 * 1024 * 1024,
+                 max_concurrency: int = 8):
         cfg = Config(
-            s3={"addressing_style": "virtual", "use_arn_region": True}  # Soporta Access Point ARN
+            s3={"addressing_style": "virtual", "use_arn_region": True},  # Soporta Access Point ARN
+            max_pool_connections=max(10, max_concurrency),
         )
         self.bucket = bucket_or_ap_arn
         self.client = boto3.client("s3", region_name=region, config=cfg)
+        # Transferencias multipart en paralelo (subidas, descargas y lecturas por rangos)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=max_concurrency > 1,
+        )
+        # Caché local de descargas (direccionada por ETag, desalojo LRU por tamaño)
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "s3_cache")
+        self.cache_max_bytes = cache_max_bytes
+        # Digests ya confirmados en S3 por este proceso (key -> sha256)
+        self._known_digests: dict[str, str] = {}
+        # Caché en memoria de listados (prefix -> (timestamp, objetos))
+        self.listing_ttl = listing_ttl
+        self._listing_cache: dict[str, tuple[float, list[dict]]] = {}
 
     # ───── CRUD binario ──────────────────────────────────────────────────────────
     def upload_fileobj(self, file_obj, key: str) -> str:
         """Sube un file-like object y devuelve la key."""
-        self.client.upload_fileobj(file_obj, self.bucket, key, ExtraArgs={"ACL": "private"})
+        self.client.upload_fileobj(file_obj, self.bucket, key, ExtraArgs={"ACL": "private"},
+                                   Config=self.transfer_config)
+        self.invalidate_listing()
         return key
 
+    @staticmethod
+    def _sha256_fileobj(file_obj, chunk_size: int = 1024 * 1024) -> str:
+        """Calcula el sha256 de un file-like object y lo deja posicionado al inicio."""
+        h = hashlib.sha256()
+        file_obj.seek(0)
+        for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+            h.update(chunk)
+        file_obj.seek(0)
+        return h.hexdigest()
+
+    def head(self, key: str) -> dict | None:
+        """HEAD del objeto; devuelve None si la key no existe."""
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def remote_digest(self, key: str) -> str | None:
+        """Devuelve el sha256 guardado en la metadata del objeto, o None si no existe."""
+        head = self.head(key)
+        if head is None:
+            return None
+        return head.get("Metadata", {}).get("sha256")
+
+    def upload_fileobj_dedup(self, file_obj, key: str) -> bool:
+        """
+        Sube un file-like object (p.ej. el UploadedFile de Streamlit) sin pasar por
+        disco, solo si el contenido difiere del objeto ya guardado en `key`.
+        El sha256 del contenido se guarda como metadata del objeto.
+        Devuelve True si hubo subida y False si se omitió por ser idéntico.
+        """
+        digest = self._sha256_fileobj(file_obj)
+        if self._known_digests.get(key) == digest or self.remote_digest(key) == digest:
+            self._known_digests[key] = digest
+            return False
+
+        self.client.upload_fileobj(
+            file_obj, self.bucket, key,
+            ExtraArgs={"ACL": "private", "Metadata": {"sha256": digest}},
+            Config=self.transfer_config,
+        )
+        self._known_digests[key] = digest
+        self.invalidate_listing()
+        return True
+
     def upload(self, local_path: str, key: str) -> str:
-        self.client.upload_file(local_path, self.bucket, key, ExtraArgs={"ACL": "private"})
+        self.client.upload_file(local_path, self.bucket, key, ExtraArgs={"ACL": "private"},
+                                Config=self.transfer_config)
+        self.invalidate_listing()
         return key
 
     def download(self, key: str, local_path: str):
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        self.client.download_file(self.bucket, key, local_path)
+        self.client.download_file(self.bucket, key, local_path, Config=self.transfer_config)
 
-    def list_keys(self, prefix: str = "") -> list[str]:
+    def download_cached(self, key: str) -> str:
+        """
+        Descarga la key a la caché local y devuelve la ruta del archivo.
+        Hace un HEAD para obtener el ETag: si ya existe una copia con ese ETag se
+        reutiliza sin volver a descargar. El nombre del archivo conserva la extensión
+        original para que load_hr_data pueda detectar el formato.
+        """
+        head = self.client.head_object(Bucket=self.bucket, Key=key)
+        etag = head.get("ETag", "").strip('"')
+        if not etag:
+            # Sin ETag no se puede validar la copia: se usa LastModified + tamaño
+            etag = f"{head.get('LastModified')}-{head.get('ContentLength')}"
+        digest = hashlib.sha256(etag.encode("utf-8")).hexdigest()[:32]
+        ext = os.path.splitext(key)[1].lower()
+        local_path = os.path.join(self.cache_dir, f"{digest}{ext}")
+
+        if os.path.exists(local_path):
+            # Marca el acceso para el orden LRU
+            os.utime(local_path, None)
+            return local_path
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Archivo temporal único: dos sesiones pueden descargar la misma key a la vez
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        os.close(fd)
         try:
-            out = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix)
-            return [o["Key"] for o in out.get("Contents", [])]
+            self.client.download_file(self.bucket, key, tmp_path, Config=self.transfer_config)
+            os.replace(tmp_path, local_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._evict_cache(keep=local_path)
+        return local_path
+
+    def _evict_cache(self, keep: str | None = None):
+        """Elimina los archivos menos usados hasta quedar bajo cache_max_bytes."""
+        try:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if os.path.isfile(path) and not name.endswith(".part"):
+                    st_ = os.stat(path)
+                    entries.append((st_.st_mtime, st_.st_size, path))
+        except FileNotFoundError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                print(f"[WARN cache] No se pudo eliminar {path}: {e}")
+
+    def iter_objects(self, prefix: str = ""):
+        """
+        Recorre todas las páginas de list_objects_v2 (sin el tope de 1000 keys)
+        y entrega un dict por objeto con Key, Size, ETag y LastModified.
+        """
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for o in page.get("Contents", []):
+                yield {
+                    "Key": o["Key"],
+                    "Size": o.get("Size", 0),
+                    "ETag": o.get("ETag", "").strip('"'),
+                    "LastModified": o.get("LastModified"),
+                }
+
+    def list_objects(self, prefix: str = "", use_cache: bool = True) -> list[dict]:
+        """
+        Lista completa de objetos bajo `prefix`. El resultado se guarda en memoria
+        durante `listing_ttl` segundos y se invalida cuando este proceso sube algo.
+        """
+        now = time.monotonic()
+        cached = self._listing_cache.get(prefix)
+        if use_cache and cached and now - cached[0] < self.listing_ttl:
+            return cached[1]
+        try:
+            objects = list(self.iter_objects(prefix))
         except Exception as e:
             # Imprime el detalle del error en consola para diagnosticar
-            print(f"[ERROR list_keys] Bucket={self.bucket}, Prefix={prefix}, Error={e}")
+            print(f"[ERROR list_objects] Bucket={self.bucket}, Prefix={prefix}, Error={e}")
             raise
+        self._listing_cache[prefix] = (now, objects)
+        return objects
+
+    def invalidate_listing(self, prefix: str | None = None):
+        """Descarta el listado en caché de `prefix` (o todos si es None)."""
+        if prefix is None:
+            self._listing_cache.clear()
+        else:
+            self._listing_cache.pop(prefix, None)
+
+    def list_keys(self, prefix: str = "") -> list[str]:
+        return [o["Key"] for o in self.list_objects(prefix)]
+
+    def read_bytes(self, key: str) -> bytes | bytearray:
+        """
+        Lee el objeto completo en memoria. Si supera multipart_threshold se
+        descarga con GETs por rangos de multipart_chunksize en paralelo.
+        """
+        cfg = self.transfer_config
+        size = self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        if size <= cfg.multipart_threshold or cfg.max_concurrency <= 1:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+        buf = bytearray(size)
+        chunk = cfg.multipart_chunksize
+
+        def fetch(start: int):
+            end = min(start + chunk, size) - 1
+            obj = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}")
+            buf[start:end + 1] = obj["Body"].read()
+
+        with ThreadPoolExecutor(max_workers=cfg.max_concurrency) as pool:
+            # list() propaga la primera excepción de cualquier rango
+            list(pool.map(fetch, range(0, size, chunk)))
+        return buf
+
+    # ───── Sidecars Parquet ──────────────────────────────────────────────────────
+    @staticmethod
+    def sidecar_key(key: str) -> str:
+        """uploads/planilla.xlsx -> processed/planilla.xlsx.parquet"""
+        return f"processed/{os.path.basename(key)}.parquet"
+
+    def write_sidecar(self, key: str, df: pd.DataFrame) -> str | None:
+        """
+        Guarda `df` (ya estandarizado) como Parquet junto a la key original.
+        El ETag del original queda en la metadata para detectar sidecars obsoletos.
+        Devuelve la key del sidecar, o None si no se pudo generar.
+        """
+        source = self.head(key)
+        if source is None:
+            return None
+        side_key = self.sidecar_key(key)
+        try:
+            buf = BytesIO()
+            df.to_parquet(buf, index=False)
+        except Exception as e:
+            # p.ej. pyarrow no instalado o columnas object con tipos mezclados
+            print(f"[WARN write_sidecar] No se pudo serializar {key} a Parquet: {e}")
+            return None
+        buf.seek(0)
+        self.client.upload_fileobj(
+            buf, self.bucket, side_key,
+            ExtraArgs={"ACL": "private", "Metadata": {"source-etag": source.get("ETag", "").strip('"')}},
+            Config=self.transfer_config,
+        )
+        self.invalidate_listing()
+        return side_key
+
+    def fresh_sidecar(self, key: str) -> str | None:
+        """Devuelve la key del sidecar si existe y corresponde al ETag actual del original."""
+        side = self.head(self.sidecar_key(key))
+        if side is None:
+            return None
+        source = self.head(key)
+        if source is None:
+            return None
+        if side.get("Metadata", {}).get("source-etag") != source.get("ETag", "").strip('"'):
+            return None
+        return self.sidecar_key(key)
 
     # ───── Helpers DataFrame ─────────────────────────────────────────────────────
-    def load_dataframe(self, key: str):
+    def load_dataframe(self, key: str, prefer_sidecar: bool = True):
         """
         Devuelve el objeto de S3 directamente como DataFrame.
-        No interfiere con los métodos ya existentes.
+        Si existe un sidecar Parquet vigente se lee ese en lugar del original.
         """
-        import pandas as pd
-        from io import BytesIO
+        if prefer_sidecar:
+            side_key = self.fresh_sidecar(key)
+            if side_key:
+                return pd.read_parquet(BytesIO(self.read_bytes(side_key)))
 
-        obj = self.client.get_object(Bucket=self.bucket, Key=key)
-        data = obj["Body"].read()
+        data = self.read_bytes(key)
         ext = key.split(".")[-1].lower()
 
+        if ext == "parquet":
+            return pd.read_parquet(BytesIO(data))
         if ext in ("xlsx", "xls"):
             return pd.read_excel(BytesIO(data))
-        return pd.read_csv(BytesIO(data), encoding="utf-8")
\ No newline at end of file
+        return pd.read_csv(BytesIO(data), encoding="utf-8")
@@ -0,0 +1,86 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from analisis_hr import normalize_string
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Tokens de búsqueda de un texto ya normalizado: las palabras alfanuméricas
+    y además el valor completo sin separadores (así '12.345.678-9' también
+    se encuentra como '123456789').
+    """
+    tokens = _TOKEN_RE.findall(text)
+    compact = "".join(tokens)
+    if len(tokens) > 1 and compact:
+        tokens.append(compact)
+    return tokens
+
+
+class SearchIndex:
+    """
+    Índice invertido para el buscador de "Datos Procesados", construido una vez
+    por dataset. Cada columna se factoriza y solo sus valores distintos se
+    normalizan (sin acentos, minúsculas) y se separan en tokens; cada token
+    apunta a los pares (columna, valor distinto) que lo contienen. Una búsqueda
+    resuelve los tokens por prefijo con búsqueda binaria y marca las filas
+    comparando códigos enteros, sin convertir el DataFrame a texto.
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.columns = list(df.columns)
+        self.index = df.index
+        self._codes = []
+        postings = defaultdict(list)
+        for col_id, col in enumerate(self.columns):
+            codes, uniques = pd.factorize(df.iloc[:, col_id])
+            self._codes.append(codes)
+            for value_id, value in enumerate(uniques):
+                for token in set(tokenize(normalize_string(value))):
+                    postings[token].append((col_id, value_id))
+        self._tokens = sorted(postings)
+        self._postings = [np.array(postings[t], dtype=np.int64) for t in self._tokens]
+
+    def _lookup(self, token: str, prefix: bool) -> np.ndarray:
+        """Pares (columna, valor) cuyo token coincide exacto o por prefijo."""
+        lo = bisect_left(self._tokens, token)
+        hi = bisect_left(self._tokens, token + "\uffff") if prefix else lo + 1
+        found = [self._postings[i] for i in range(lo, min(hi, len(self._tokens)))
+                 if prefix or self._tokens[i] == token]
+        if not found:
+            return np.empty((0, 2), dtype=np.int64)
+        return np.concatenate(found)
+
+    def _rows_for(self, token: str, col_ids: set[int] | None, prefix: bool) -> np.ndarray:
+        mask = np.zeros(len(self.index), dtype=bool)
+        pairs = self._lookup(token, prefix)
+        for col_id in np.unique(pairs[:, 0]):
+            if col_ids is not None and col_id not in col_ids:
+                continue
+            values = pairs[pairs[:, 0] == col_id, 1]
+            mask |= np.isin(self._codes[col_id], values)
+        return mask
+
+    def search(self, query: str, columns: list[str] | None = None, prefix: bool = True) -> np.ndarray:
+        """
+        Posiciones de fila que contienen todos los tokens de `query` (en
+        cualquier columna de `columns`, o en todas si es None).
+        """
+        tokens = _TOKEN_RE.findall(normalize_string(query))
+        if not tokens:
+            return np.arange(len(self.index))
+        col_ids = None if columns is None else {self.columns.index(c) for c in columns if c in self.columns}
+        mask = np.logical_and.reduce([self._rows_for(t, col_ids, prefix) for t in tokens])
+        if len(tokens) > 1:
+            # Consulta escrita con separadores distintos a los del dato (p.ej. un RUT)
+            mask |= self._rows_for("".join(tokens), col_ids, prefix)
+        return np.flatnonzero(mask)
+
+    def filter(self, df: pd.DataFrame, query: str, columns: list[str] | None = None,
+               prefix: bool = True) -> pd.DataFrame:
+        """Aplica la búsqueda a `df`, que puede ser un subconjunto filtrado del dataset indexado."""
+        labels = self.index[self.search(query, columns, prefix)]
+        return df[df.index.isin(labels)]
@@ -0,0 +1,327 @@
+"""
+Sketches mergeables para agregaciones sobre muchas filas.
+  - HyperLogLog: conteo aproximado de valores distintos (p.ej. Rut únicos),
+    vectorizado para construir un sketch por grupo en una sola pasada.
+  - DistinctCounter: distintos por celda de dimensiones, agregables a cualquier
+    nivel, con HyperLogLog o en modo exacto.
+  - QuantileSketch: cuantiles y tramos con error relativo acotado (buckets
+    logarítmicos tipo DDSketch), mergeables entre celdas y bloques de carga.
+"""
+import numpy as np
+import pandas as pd
+
+HLL_PRECISION = 10  # 2^10 registros por sketch (~3% de error estándar)
+
+
+def hash_values(values) -> np.ndarray:
+    """Hash de 64 bits (uint64) por valor, estable entre procesos."""
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy(dtype=np.uint64)
+
+
+def _hll_alpha(m: int) -> float:
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+def hll_registers(hashes: np.ndarray, groups: np.ndarray | None = None, n_groups: int = 1,
+                  p: int = HLL_PRECISION) -> np.ndarray:
+    """
+    Construye los registros HyperLogLog de `n_groups` sketches a la vez.
+    `groups` indica a qué sketch pertenece cada hash (None = un solo sketch).
+    Retorna un array uint8 de forma (n_groups, 2**p).
+    """
+    m = 1 << p
+    registers = np.zeros((n_groups, m), dtype=np.uint8)
+    if len(hashes) == 0:
+        return registers
+    hashes = hashes.astype(np.uint64, copy=False)
+    idx = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    # rango = posición del primer bit 1 en los (64 - p) bits restantes
+    width = 64 - p
+    with np.errstate(divide="ignore"):
+        bit_len = np.where(rest > 0, np.floor(np.log2(rest.astype(np.float64))) + 1, 0)
+    rank = np.minimum(width - bit_len + 1, width + 1).astype(np.uint8)
+    rows = np.zeros(len(hashes), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    valid = rows >= 0
+    np.maximum.at(registers, (rows[valid], idx[valid]), rank[valid])
+    return registers
+
+
+def hll_estimate(registers: np.ndarray) -> np.ndarray:
+    """Cardinalidad estimada por fila de registros (acepta uno o varios sketches)."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    raw = _hll_alpha(m) * m * m / np.sum(np.exp2(-registers.astype(np.float64)), axis=1)
+    zeros = np.count_nonzero(registers == 0, axis=1)
+    # Corrección para cardinalidades bajas (linear counting)
+    with np.errstate(divide="ignore"):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def hll_merge(registers: np.ndarray) -> np.ndarray:
+    """Une varios sketches (filas) en uno: máximo por registro."""
+    registers = np.atleast_2d(registers)
+    if registers.shape[0] == 0:
+        return np.zeros(registers.shape[1], dtype=np.uint8)
+    return registers.max(axis=0)
+
+
+class HyperLogLog:
+    """Sketch HyperLogLog individual, mergeable con otros de la misma precisión."""
+    def __init__(self, p: int = HLL_PRECISION, registers: np.ndarray | None = None):
+        self.p = p
+        self.registers = registers if registers is not None else np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, values):
+        new = hll_registers(hash_values(values), p=self.p)[0]
+        np.maximum(self.registers, new, out=self.registers)
+        return self
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("Solo se pueden unir sketches con la misma precisión.")
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self) -> int:
+        return int(round(hll_estimate(self.registers)[0]))
+
+
+def _unique_sorted(keys: np.ndarray) -> np.ndarray:
+    """Valores únicos ordenados de un array de enteros (ordenar y comparar vecinos)."""
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+
+
+class DistinctCounter:
+    """
+    Conteo de identificadores distintos (p.ej. Rut) por celda de dimensiones,
+    construido una vez y agregable a cualquier nivel: sumar conteos distintos de
+    departamentos no da el total de la empresa, pero unir sus sketches sí.
+    Con exact=False cada celda guarda un HyperLogLog (memoria acotada, ~3% de
+    error con la precisión por defecto); con exact=True guarda los pares
+    (celda, identificador) sin repetir y el roll-up cuenta valores únicos exactos.
+    """
+    def __init__(self, ids, dimensions: dict, exact: bool = False, p: int = HLL_PRECISION):
+        self.exact = exact
+        self.p = p
+        self.dimensions = list(dimensions)
+        ids = pd.Series(ids).reset_index(drop=True)
+        valid = ids.notna().to_numpy()
+        ids = ids[valid]
+        keys = pd.DataFrame({name: pd.Series(values).reset_index(drop=True)[valid].array
+                             for name, values in dimensions.items()})
+        if self.dimensions:
+            grouped = keys.groupby(self.dimensions, observed=True, dropna=False, sort=False)
+            cell_ids = grouped.ngroup().to_numpy()
+            self.cells = grouped.size().reset_index(name='rows')
+        else:
+            cell_ids = np.zeros(len(ids), dtype=np.int64)
+            self.cells = pd.DataFrame({'rows': [len(ids)]})
+
+        if exact:
+            codes, uniques = pd.factorize(ids)
+            self._n_ids = max(len(uniques), 1)
+            pairs = _unique_sorted(cell_ids.astype(np.int64) * self._n_ids + codes)
+            self._pair_cells = pairs // self._n_ids
+            self._pair_ids = pairs % self._n_ids
+            self.registers = None
+        else:
+            self.registers = hll_registers(hash_values(ids), cell_ids, len(self.cells), p)
+
+    def _mask(self, where: dict | None) -> np.ndarray:
+        mask = np.ones(len(self.cells), dtype=bool)
+        for dim, values in (where or {}).items():
+            values = values if isinstance(values, (list, tuple, set, np.ndarray)) else [values]
+            mask &= self.cells[dim].isin(values).to_numpy()
+        return mask
+
+    def count(self, by=(), where: dict | None = None) -> pd.DataFrame:
+        """
+        Distintos por las dimensiones `by` (vacío = total) sobre las celdas que
+        cumplen `where` ({dimensión: valor o lista de valores}). Retorna un
+        DataFrame con las columnas de `by` y 'distinct'; como groupby, omite
+        los grupos con clave nula.
+        """
+        by = list(by)
+        mask = self._mask(where)
+        group_of_cell = np.full(len(self.cells), -1, dtype=np.int64)
+        if by:
+            grouped = self.cells[mask].groupby(by, observed=True, dropna=False, sort=True)
+            group_of_cell[mask] = grouped.ngroup().to_numpy()
+            out = grouped.size().reset_index()[by]
+        else:
+            group_of_cell[mask] = 0
+            out = pd.DataFrame(index=[0])
+        n_groups = len(out)
+
+        if self.exact:
+            groups = group_of_cell[self._pair_cells]
+            keep = groups >= 0
+            # Un par (grupo, id) por empleado aunque aparezca en varias celdas del grupo
+            unique = _unique_sorted(groups[keep] * self._n_ids + self._pair_ids[keep])
+            out['distinct'] = np.bincount(unique // self._n_ids, minlength=n_groups)[:n_groups]
+        else:
+            merged = np.zeros((n_groups, self.registers.shape[1]), dtype=np.uint8)
+            np.maximum.at(merged, group_of_cell[mask], self.registers[mask])
+            out['distinct'] = np.rint(hll_estimate(merged)).astype(np.int64)
+        if by:
+            out = out.dropna(subset=by).reset_index(drop=True)
+        return out
+
+    def total(self, where: dict | None = None) -> int:
+        return int(self.count(where=where)['distinct'].iloc[0])
+
+
+QUANTILE_ACCURACY = 0.01  # error relativo máximo de cada cuantil (1%)
+
+
+class QuantileSketch:
+    """
+    Sketches de cuantiles mergeables por celda de dimensiones (esquema DDSketch):
+    cada valor positivo cae en un bucket logarítmico de ancho relativo fijo, así
+    cualquier cuantil se estima con error relativo <= `accuracy`. Los buckets son
+    los mismos para todas las celdas, por lo que unir celdas o bloques de carga
+    es sumar conteos. Los valores <= 1 comparten el bucket 0.
+    """
+    def __init__(self, dimensions, accuracy: float = QUANTILE_ACCURACY, max_value: float = 1e12):
+        self.dimensions = list(dimensions)
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.n_buckets = int(np.ceil(np.log(max_value) / self._log_gamma)) + 1
+        self._index: dict[tuple, int] = {}
+        self._keys: list[tuple] = []
+        self.counts = np.zeros((0, self.n_buckets), dtype=np.int64)
+
+    # ───── Construcción ─────────────────────────────────────────────────────────
+    def bucket_values(self) -> np.ndarray:
+        """Valor representativo de cada bucket (punto medio relativo)."""
+        values = 2 * self.gamma ** np.arange(self.n_buckets) / (self.gamma + 1)
+        values[0] = 0.0
+        return values
+
+    def _buckets(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            idx = np.ceil(np.log(np.maximum(values, 1.0)) / self._log_gamma)
+        return np.clip(idx, 0, self.n_buckets - 1).astype(np.int64)
+
+    def update(self, values, dimensions: dict | None = None) -> "QuantileSketch":
+        """Agrega un bloque de valores; `dimensions` trae un array por dimensión."""
+        values = pd.to_numeric(pd.Series(values).reset_index(drop=True), errors='coerce').to_numpy(dtype=float)
+        valid = np.isfinite(values) & (values >= 0)
+        if self.dimensions:
+            keys = pd.DataFrame({name: pd.Series(dimensions[name]).reset_index(drop=True)[valid].array
+                                 for name in self.dimensions})
+            grouped = keys.groupby(self.dimensions, observed=True, dropna=False, sort=False)
+            local = grouped.ngroup().to_numpy()
+            uniques = [k if isinstance(k, tuple) else (k,) for k in grouped.size().index]
+        else:
+            local = np.zeros(int(valid.sum()), dtype=np.int64)
+            uniques = [()]
+        # Celdas locales del bloque -> filas globales del sketch (pocas por bloque)
+        rows = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques):
+            key = tuple(None if pd.isna(k) else k for k in key)
+            if key not in self._index:
+                self._index[key] = len(self._keys)
+                self._keys.append(key)
+            rows[i] = self._index[key]
+        if len(self._keys) > len(self.counts):
+            grow = np.zeros((len(self._keys) - len(self.counts), self.n_buckets), dtype=np.int64)
+            self.counts = np.vstack([self.counts, grow])
+        flat = rows[local] * self.n_buckets + self._buckets(values[valid])
+        self.counts += np.bincount(flat, minlength=self.counts.size).reshape(self.counts.shape)
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Suma en este sketch los conteos de otro con las mismas dimensiones y buckets."""
+        if other.dimensions != self.dimensions or other.n_buckets != self.n_buckets:
+            raise ValueError("Solo se pueden unir sketches con las mismas dimensiones y precisión.")
+        for key, counts in zip(other._keys, other.counts):
+            if key not in self._index:
+                self._index[key] = len(self._keys)
+                self._keys.append(key)
+                self.counts = np.vstack([self.counts, np.zeros((1, self.n_buckets), dtype=np.int64)])
+            self.counts[self._index[key]] += counts
+        return self
+
+    # ───── Consultas ────────────────────────────────────────────────────────────
+    @property
+    def cells(self) -> pd.DataFrame:
+        """Una fila por celda con sus dimensiones y la cantidad de valores."""
+        cells = pd.DataFrame(self._keys, columns=self.dimensions)
+        cells['count'] = self.counts.sum(axis=1)
+        return cells
+
+    def select(self, mask: np.ndarray) -> "QuantileSketch":
+        """Copia con solo las celdas marcadas en `mask` (p.ej. los períodos filtrados)."""
+        out = QuantileSketch(self.dimensions, self.accuracy, max_value=1.0)
+        out.n_buckets = self.n_buckets
+        out._keys = [k for k, keep in zip(self._keys, mask) if keep]
+        out._index = {k: i for i, k in enumerate(out._keys)}
+        out.counts = self.counts[mask]
+        return out
+
+    def _rollup(self, by, mask):
+        cells = self.cells
+        counts = self.counts
+        if mask is not None:
+            cells, counts = cells[mask], counts[mask]
+        by = list(by)
+        if not by:
+            return pd.DataFrame(index=[0]), counts.sum(axis=0, keepdims=True)
+        grouped = cells.groupby(by, observed=True, dropna=False, sort=True)
+        out = grouped.size().reset_index()[by]
+        merged = np.zeros((len(out), self.n_buckets), dtype=np.int64)
+        np.add.at(merged, grouped.ngroup().to_numpy(), counts)
+        # Como groupby, sin los grupos con clave nula
+        keep = out.notna().all(axis=1).to_numpy()
+        return out[keep].reset_index(drop=True), merged[keep]
+
+    def quantiles(self, qs=(0.1, 0.5, 0.9), by=(), mask: np.ndarray | None = None) -> pd.DataFrame:
+        """
+        Cuantiles estimados por las dimensiones `by` (vacío = total) sobre las
+        celdas marcadas en `mask`. Columnas: `by`, 'n' y 'p10', 'p50', ... por cuantil.
+        """
+        out, merged = self._rollup(by, mask)
+        n = merged.sum(axis=1)
+        cumulative = merged.cumsum(axis=1)
+        values = self.bucket_values()
+        out['n'] = n
+        for q in qs:
+            rank = np.floor(q * np.maximum(n - 1, 0))
+            idx = np.minimum((cumulative <= rank[:, None]).sum(axis=1), self.n_buckets - 1)
+            out[f"p{round(q * 100):g}"] = np.where(n > 0, values[idx], np.nan)
+        return out
+
+    def histogram(self, edges, labels=None, by=(), mask: np.ndarray | None = None) -> pd.DataFrame:
+        """
+        Cantidad aproximada de valores por tramo (edges[i], edges[i+1]] para
+        cualquier lista de cortes. Cada bucket se reparte entre los tramos según
+        la fracción (logarítmica) de su rango que cae en cada uno, así que solo
+        el bucket que contiene un corte se aproxima. Formato largo: `by`, 'band'
+        y 'count'.
+        """
+        out, merged = self._rollup(by, mask)
+        edges = np.asarray(edges, dtype=float)
+        labels = list(labels) if labels is not None else \
+            [f"{edges[i]:,.0f}-{edges[i + 1]:,.0f}" for i in range(len(edges) - 1)]
+        # Fracción de cada bucket (gamma^(i-1), gamma^i] bajo cada corte; el bucket 0 es [0, 1]
+        with np.errstate(divide='ignore'):
+            log_edges = np.log(np.maximum(edges[:len(labels) + 1], 0.0))
+        lower = np.arange(self.n_buckets) - 1.0
+        below = np.clip(log_edges[None, :] / self._log_gamma - lower[:, None], 0.0, 1.0)
+        below[0] = edges[:len(labels) + 1] >= 1.0
+        weights = np.diff(below, axis=1)
+        table = pd.DataFrame(np.rint(merged @ weights).astype(np.int64), columns=labels)
+        wide = pd.concat([out.reset_index(drop=True), table], axis=1)
+        long = wide.melt(id_vars=list(by), value_vars=labels, var_name='band', value_name='count')
+        long['band'] = pd.Categorical(long['band'], categories=labels, ordered=True)
+        return long